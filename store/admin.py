@@ -2,10 +2,11 @@ from typing import Any, List, Optional, Tuple
 from django.contrib import admin, messages
 from django.db.models.query import QuerySet
 from django.http.request import HttpRequest
-from django.db.models.aggregates import Count
 from django.utils.html import format_html, urlencode
 from django.urls import reverse
-from . import models
+from django.utils import timezone
+from . import analytics, caching, customer_stats, models, renditions
+from .signals import send_order_created
 
 
 # Custom filters
@@ -38,7 +39,7 @@ class CollectionAdmin(admin.ModelAdmin):
     list_display = ['title', 'products_count']
     search_fields = ['title']
 
-    @admin.display(ordering='products_count')
+    @admin.display(ordering='product_count')
     def products_count(self, collection):
         url = (
             reverse('admin:store_product_changelist')
@@ -46,12 +47,8 @@ class CollectionAdmin(admin.ModelAdmin):
             + urlencode({
                'collection__id': str(collection.id) 
             }))
-        return format_html('<a href="{}">{}</a>', url, collection.products_count) # Provide a link to other pages
-        # return collection.products_count
-    
-    # Override the base queryset
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(products_count=Count('products'))
+        return format_html('<a href="{}">{}</a>', url, collection.product_count) # Provide a link to other pages
+        # return collection.product_count
 
 
 class ProductImageInline(admin.TabularInline):
@@ -60,7 +57,10 @@ class ProductImageInline(admin.TabularInline):
 
     def thumbnail(self, instance):
         if instance.image.name != '':
-            return format_html(f'<img src="{instance.image.url}" class="thumbnail" />')
+            # The small rendition once it exists, the upload until then
+            files = renditions.get_files(instance.image.name, instance.renditions)
+            url = renditions.get_storage().url(files['thumbnail']) if files else instance.image.url
+            return format_html(f'<img src="{url}" class="thumbnail" />')
         return ''
 
 
@@ -100,7 +100,10 @@ class ProductAdmin(admin.ModelAdmin):
     # Defining custom action
     @admin.action(description='Clear inventory')
     def clear_inventory(self, request, queryset):
-        updated_count = queryset.update(inventory=0) # returns the number of updated records
+        products = list(queryset.values_list('id', 'collection_id'))
+        updated_count = queryset.update(inventory=0, last_update=timezone.now()) # returns the number of updated records
+        # update() skips auto_now and the model signals, so invalidate the cached product responses here
+        caching.bump_products([id for id, _ in products], [collection_id for _, collection_id in products])
         self.message_user(
             request,
             f'{updated_count} products were successfully updated',
@@ -120,22 +123,19 @@ class CustomerAdmin(admin.ModelAdmin):
     list_display = ['first_name', 'last_name', 'membership', 'orders_count']
     list_editable = ['membership']
     list_per_page = 20
-    list_select_related = ['user']
+    # The count comes from the CustomerStats row (customer_stats.py) instead of a COUNT over every order
+    list_select_related = ['user', 'stats']
     ordering = ['user__first_name', 'user__last_name']
     search_fields = ['first_name__istartswith', 'last_name__istartswith']
 
-    @admin.display(ordering='orders_count')
+    @admin.display(ordering='stats__orders_count')
     def orders_count(self, customer):
         url = (
             reverse('admin:store_order_changelist')
             + '?'
             + urlencode({'customer__id': str(customer.id)
         }))
-        return format_html('<a href="{}">{}</a>', url, customer.orders_count)
-        #return customer.orders_count
-
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(orders_count=Count('order'))
+        return format_html('<a href="{}">{}</a>', url, customer_stats.get_stats(customer).orders_count)
 
 
 class OrderItemInline(admin.TabularInline):
@@ -158,4 +158,16 @@ class OrderAdmin(admin.ModelAdmin):
     list_select_related = ['customer']
     ordering = ['id']
 
+    # The items are saved with the inlines, after save_model: only then is the order complete
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        order = form.instance
+        if not change:
+            send_order_created(models.Order, order)
+        else:
+            # Items or the customer may have changed
+            customer_stats.rebuild({order.customer_id, form.initial.get('customer', order.customer_id)})
+            day = timezone.localdate(order.placed_at)
+            analytics.reconcile(day, day)
+
 
@@ -0,0 +1,160 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import Collection, Customer, DailySales, Order, OrderItem
+from . import increments
+
+
+# Finance reports (revenue, units and average order value per day, collection and membership tier) backed by the
+# DailySales rollup: one row per local day, payment status and dimension key. Placing an order adds it to the rows
+# of its status (the order_created signal), and a payment status change moves it from the old status rows to the
+# new ones, so a date-range report sums a few rows per day. Orders stay in the collection and membership tier they
+# were counted in until reconcile() recomputes those days from Order / OrderItem (nightly for the last
+# SALES_RECONCILE_DAYS, or with the reconcile_sales command). An increment that fails is logged with its order id
+# (send_order_created): days older than SALES_RECONCILE_DAYS need reconcile_sales --start.
+GROUPS = {
+    'day': DailySales.DIMENSION_TOTAL,
+    'collection': DailySales.DIMENSION_COLLECTION,
+    'membership': DailySales.DIMENSION_MEMBERSHIP
+}
+DEFAULT_DAYS = 30
+MAX_DAYS = 731
+UNIQUE_FIELDS = ['dimension', 'key', 'day', 'payment_status']
+SUM_FIELDS = ['orders', 'units', 'revenue']
+REVENUE = ExpressionWrapper(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+CENT = Decimal('0.01')
+
+
+def get_order_rows(order, changes):
+    """The rollup rows of an order, for each (payment_status, sign) in changes: +1 adds the order, -1 removes it."""
+    day = timezone.localdate(order.placed_at)
+    membership = Customer.objects.filter(pk=order.customer_id).values_list('membership', flat=True).first()
+    collections = list(
+        OrderItem.objects
+        .filter(order=order)
+        .values('product__collection_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(REVENUE))
+        .order_by())
+    units = sum(row['units'] for row in collections)
+    revenue = sum((row['revenue'] for row in collections), Decimal(0))
+    keys = [
+        (DailySales.DIMENSION_TOTAL, '', units, revenue),
+        (DailySales.DIMENSION_MEMBERSHIP, membership, units, revenue)
+    ] + [
+        (DailySales.DIMENSION_COLLECTION, str(row['product__collection_id']), row['units'], row['revenue'])
+        for row in collections
+    ]
+    return [
+        {'day': day, 'payment_status': payment_status, 'dimension': dimension, 'key': key,
+         'orders': sign, 'units': sign * units, 'revenue': sign * revenue}
+        for payment_status, sign in changes for dimension, key, units, revenue in keys
+    ]
+
+
+def add_order(order):
+    """Adds an order to the rollups of its payment status, with the same queries for any number of items."""
+    rows = get_order_rows(order, [(order.payment_status, 1)])
+    increments.bulk_increment(DailySales, rows, UNIQUE_FIELDS, SUM_FIELDS)
+
+
+def change_payment_status(order, previous_status):
+    if order.payment_status == previous_status:
+        return
+    rows = get_order_rows(order, [(previous_status, -1), (order.payment_status, 1)])
+    increments.bulk_increment(DailySales, rows, UNIQUE_FIELDS, SUM_FIELDS)
+
+
+def reconcile(start=None, end=None, batch_size=1000):
+    """
+    Recomputes the rollups of the days from start to end (every day by default) from the orders.
+    Returns the number of rows written.
+    """
+    orders, items, stored = Order.objects.all(), OrderItem.objects.all(), DailySales.objects.all()
+    if start is not None:
+        orders = orders.filter(placed_at__date__gte=start)
+        items = items.filter(order__placed_at__date__gte=start)
+        stored = stored.filter(day__gte=start)
+    if end is not None:
+        orders = orders.filter(placed_at__date__lte=end)
+        items = items.filter(order__placed_at__date__lte=end)
+        stored = stored.filter(day__lte=end)
+
+    totals = {}
+    def add(dimension, key, row):
+        total = totals.setdefault((dimension, key, row['day'], row['payment_status']), [0, 0, Decimal(0)])
+        total[0] += row['orders']
+        total[1] += row['units'] or 0
+        total[2] += row['revenue'] or 0
+
+    with transaction.atomic():
+        item_revenue = ExpressionWrapper(
+            F('items__unit_price') * F('items__quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+        memberships = orders \
+            .annotate(day=TruncDate('placed_at')) \
+            .values('day', 'payment_status', 'customer__membership') \
+            .annotate(orders=Count('id', distinct=True), units=Sum('items__quantity'), revenue=Sum(item_revenue)) \
+            .order_by()
+        for row in memberships.iterator():
+            add(DailySales.DIMENSION_TOTAL, '', row)
+            add(DailySales.DIMENSION_MEMBERSHIP, row['customer__membership'], row)
+        collections = items \
+            .annotate(day=TruncDate('order__placed_at'), payment_status=F('order__payment_status')) \
+            .values('day', 'payment_status', 'product__collection_id') \
+            .annotate(orders=Count('order_id', distinct=True), units=Sum('quantity'), revenue=Sum(REVENUE)) \
+            .order_by()
+        for row in collections.iterator():
+            add(DailySales.DIMENSION_COLLECTION, str(row['product__collection_id']), row)
+
+        rows = [
+            DailySales(dimension=dimension, key=key, day=day, payment_status=payment_status,
+                       orders=count, units=units, revenue=revenue)
+            for (dimension, key, day, payment_status), (count, units, revenue) in totals.items()
+        ]
+        stored.delete()
+        DailySales.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def reconcile_recent(days):
+    today = timezone.localdate()
+    return reconcile(today - timedelta(days=days), today)
+
+
+def get_default_range():
+    end = timezone.localdate()
+    return end - timedelta(days=DEFAULT_DAYS - 1), end
+
+
+def get_report(start, end, group_by='day', payment_statuses=None):
+    """
+    Orders, units, revenue and average order value from start to end (inclusive) per day, collection or
+    membership tier, counting the orders in payment_statuses (all of them by default).
+    """
+    rows = DailySales.objects.filter(dimension=GROUPS[group_by], day__range=(start, end))
+    if payment_statuses is not None:
+        rows = rows.filter(payment_status__in=payment_statuses)
+    group = 'day' if group_by == 'day' else 'key'
+    rows = rows \
+        .values(group) \
+        .annotate(total_orders=Sum('orders'), total_units=Sum('units'), total_revenue=Sum('revenue')) \
+        .filter(total_orders__gt=0) \
+        .order_by(group)
+
+    report = [
+        {
+            group_by: int(row[group]) if group_by == 'collection' else row[group],
+            'orders': row['total_orders'],
+            'units': row['total_units'],
+            'revenue': row['total_revenue'],
+            'average_order_value': (row['total_revenue'] / row['total_orders']).quantize(CENT)
+        }
+        for row in rows
+    ]
+    if group_by == 'collection':
+        titles = dict(Collection.objects.filter(pk__in=[row['collection'] for row in report]).values_list('id', 'title'))
+        for row in report:
+            row['collection_title'] = titles.get(row['collection'])
+    return report
@@ -0,0 +1,328 @@
+import csv
+import io
+import json
+from collections import Counter
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxLengthValidator, MinValueValidator
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, models, transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError as DRFValidationError
+from . import caching, increments, leaderboards, search
+from .counters import recount_collections
+from .models import Collection, Product, ProductImage
+from .serializers import ProductBatchUpdateSerializer
+from .tasks import queue_renditions
+
+
+# Streaming bulk import / export of the catalog (NDJSON or CSV), used by the import_catalog / export_catalog
+# commands and the /store/bulk/<kind>/ admin endpoint, and the batch stock / price update behind
+# /store/products/batch-update/.
+# Exports iterate the table in chunks, so memory stays flat. Imports are upserts by id, one INSERT ... ON CONFLICT
+# per chunk; the signals that bulk_create skips (search index, product counts, cache versions) are applied per chunk.
+FORMATS = ['ndjson', 'csv']
+CHUNK_SIZE = 1000
+
+
+class CatalogKind:
+    def __init__(self, model, fields, references=None, validators=None):
+        self.model = model
+        self.fields = fields
+        # field -> model that the value must exist in
+        self.references = references or {}
+        # field -> validators used instead of the model field's
+        self.validators = validators or {}
+
+    @property
+    def update_fields(self):
+        return [self.model._meta.get_field(name).name for name in self.fields if name != 'id']
+
+    # Called per imported chunk; touched collects ids for finish_import(), which runs once per import
+    def after_import(self, objs, previous, touched):
+        pass
+
+    def finish_import(self, touched):
+        pass
+
+
+class CollectionKind(CatalogKind):
+    def after_import(self, objs, previous, touched):
+        for obj in objs:
+            caching.bump_collection(obj.id)
+        # Once per chunk rather than comparing each row with its stored tax rate
+        if 'tax_rate' in self.update_fields:
+            caching.bump_pricing()
+
+
+class ProductKind(CatalogKind):
+    @property
+    def update_fields(self):
+        return super().update_fields + ['last_update']
+
+    def after_import(self, objs, previous, touched):
+        ids = [obj.id for obj in objs]
+        collection_ids = {obj.collection_id for obj in objs} | set(previous.values())
+        search.index_products(ids)
+        caching.bump_products(ids, collection_ids)
+        touched.update(collection_ids)
+        for obj in objs:
+            if obj.id in previous and previous[obj.id] != obj.collection_id:
+                leaderboards.move_product(obj.id, obj.collection_id)
+
+    def finish_import(self, touched):
+        recount_collections(touched)
+
+
+class ProductImageKind(CatalogKind):
+    def after_import(self, objs, previous, touched):
+        product_ids = {obj.product_id for obj in objs} | set(previous.values())
+        Product.objects.filter(id__in=product_ids).update(last_update=timezone.now())
+        products = Product.objects.filter(id__in=product_ids).values_list('id', 'collection_id')
+        caching.bump_products([id for id, _ in products], [collection_id for _, collection_id in products])
+        # bulk_create skips post_save, which queues the renditions
+        image_ids = [obj.id for obj in objs]
+        transaction.on_commit(lambda: queue_renditions(image_ids))
+
+
+KINDS = {
+    'collections': CollectionKind(Collection, ['id', 'title', 'tax_rate']),
+    'products': ProductKind(
+        Product,
+        ['id', 'title', 'slug', 'description', 'unit_price', 'inventory', 'collection_id'],
+        references={'collection_id': Collection},
+        # Sold out products export with 0 and must import back (as in the batch update)
+        validators={'inventory': [MinValueValidator(0)]}),
+    'images': ProductImageKind(ProductImage, ['id', 'product_id', 'image'], references={'product_id': Product}),
+}
+
+# The column that tells which parent rows an update moves away from
+PARENT_FIELDS = {'products': 'collection_id', 'images': 'product_id'}
+
+
+## EXPORT ##
+
+class Echo:
+    # Pseudo-buffer for csv.writer: write() hands back the line instead of storing it
+    def write(self, value):
+        return value
+
+
+def export_rows(kind):
+    spec = KINDS[kind]
+    return spec.model.objects.order_by('id').values(*spec.fields).iterator(chunk_size=CHUNK_SIZE)
+
+
+def export_lines(kind, format='ndjson'):
+    """Yields the table as NDJSON or CSV text, one line at a time."""
+    fields = KINDS[kind].fields
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(fields)
+        for row in export_rows(kind):
+            yield writer.writerow(['' if row[name] is None else row[name] for name in fields])
+    else:
+        for row in export_rows(kind):
+            yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+## IMPORT ##
+
+def read_rows(lines, format='ndjson'):
+    """Parses an iterable of text (or bytes) lines into (line number, dict or None) pairs; None means unparsable."""
+    lines = (line.decode('utf-8') if isinstance(line, bytes) else line for line in lines)
+    if format == 'csv':
+        for line_number, row in enumerate(csv.DictReader(lines), start=2):
+            yield line_number, row
+        return
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else None
+
+
+def clean_value(spec, field, value):
+    """
+    field.clean() without its per-row queries and upload checks: references are checked once per chunk
+    (import_chunk), and files are imported by their storage name.
+    """
+    value = field.to_python(value)
+    if isinstance(field, models.FileField):
+        validators = [MaxLengthValidator(field.max_length)]
+    else:
+        if not field.is_relation:
+            field.validate(value, None)
+        validators = spec.validators.get(field.name, field.validators)
+    messages = []
+    for validator in validators:
+        try:
+            validator(value)
+        except ValidationError as error:
+            messages.extend(error.messages)
+    if messages:
+        raise ValidationError(messages)
+    return value
+
+
+def clean_row(spec, row):
+    """
+    Returns (data, errors) for a raw row. Blank cells of fields with a default are left out of data: new rows get
+    the default, existing ones keep their stored value (see import_chunk).
+    """
+    data, errors = {}, {}
+    for name in spec.fields:
+        field = spec.model._meta.get_field(name)
+        value = row.get(name)
+        if value in (None, ''):
+            if name != 'id' and field.has_default():
+                continue
+            if name != 'id' and field.null:
+                data[name] = None
+                continue
+            # id is required too: it is the upsert key
+            errors[name] = ['This field is required.']
+            continue
+        try:
+            data[name] = clean_value(spec, field, value)
+        except ValidationError as error:
+            errors[name] = error.messages
+    return data, errors
+
+
+def import_chunk(kind, chunk, report, touched):
+    spec = KINDS[kind]
+    cleaned = []
+    for line_number, row in chunk:
+        if row is None:
+            report['errors'].append({'line': line_number, 'errors': {'row': ['Not a valid record.']}})
+            continue
+        data, errors = clean_row(spec, row)
+        if errors:
+            report['errors'].append({'line': line_number, 'errors': errors})
+        else:
+            cleaned.append((line_number, data))
+
+    # Referenced rows must exist (one query per reference per chunk)
+    for name, model in spec.references.items():
+        wanted = {data[name] for _, data in cleaned}
+        existing = set(model.objects.filter(id__in=wanted).values_list('id', flat=True))
+        missing = [(line_number, data) for line_number, data in cleaned if data[name] not in existing]
+        for line_number, data in missing:
+            report['errors'].append({'line': line_number, 'errors': {name: [f'No {model._meta.verbose_name} with id {data[name]}.']}})
+        cleaned = [(line_number, data) for line_number, data in cleaned if data[name] in existing]
+
+    if not cleaned:
+        return
+    # An upsert can't touch the same row twice, so the last occurrence of an id wins
+    rows_by_id = {data['id']: data for _, data in cleaned}
+    parent_field = PARENT_FIELDS.get(kind)
+    previous = dict(spec.model.objects.filter(id__in=rows_by_id).values_list('id', parent_field or 'id'))
+
+    # Fields left blank are not updated: one upsert per set of given fields (usually one per chunk)
+    groups = {}
+    for data in rows_by_id.values():
+        blank = {spec.model._meta.get_field(name).name for name in spec.fields if name not in data}
+        update_fields = tuple(name for name in spec.update_fields if name not in blank)
+        groups.setdefault(update_fields, []).append(spec.model(**data))
+
+    objs = []
+    with transaction.atomic():
+        for update_fields, group in groups.items():
+            increments.bulk_upsert(spec.model, group, ['id'], list(update_fields))
+            objs += group
+        spec.after_import(objs, previous if parent_field else {}, touched)
+
+    report['updated'] += len(previous)
+    report['created'] += len(objs) - len(previous)
+
+
+def import_rows(kind, rows, chunk_size=CHUNK_SIZE):
+    """Upserts (line number, row) pairs in chunks. Returns {'created', 'updated', 'errors': [{line, errors}]}."""
+    report = {'created': 0, 'updated': 0, 'errors': []}
+    touched = set()
+    chunk = []
+    for item in rows:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            import_chunk(kind, chunk, report, touched)
+            chunk = []
+    if chunk:
+        import_chunk(kind, chunk, report, touched)
+    KINDS[kind].finish_import(touched)
+    reset_sequence(kind)
+    return report
+
+
+def reset_sequence(kind):
+    # Rows imported with explicit ids don't advance Postgres sequences
+    statements = connection.ops.sequence_reset_sql(no_style(), [KINDS[kind].model])
+    if statements:
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+
+
+def import_text(kind, text, format='ndjson', chunk_size=CHUNK_SIZE):
+    return import_rows(kind, read_rows(io.StringIO(text), format), chunk_size)
+
+
+## BATCH UPDATE ##
+
+MAX_BATCH_UPDATE = 10000
+BATCH_UPDATE_FIELDS = ['inventory', 'unit_price']
+
+
+def update_chunk(cleaned, report):
+    """Applies {id: (index, data)} validated rows."""
+    collection_ids = dict(Product.objects.filter(id__in=cleaned).values_list('id', 'collection_id'))
+    for id, (index, _) in list(cleaned.items()):
+        if id not in collection_ids:
+            report['errors'].append({'index': index, 'id': id, 'errors': {'id': [f'No product with id {id}.']}})
+            del cleaned[id]
+    if not cleaned:
+        return
+
+    # bulk_update sets the same columns on every row, so rows are grouped by the values they change:
+    # each group is one UPDATE ... SET col = CASE id WHEN ... END WHERE id IN (...)
+    now = timezone.now()
+    groups = {}
+    for id, (_, data) in cleaned.items():
+        fields = tuple(name for name in BATCH_UPDATE_FIELDS if name in data)
+        groups.setdefault(fields, []).append(Product(id=id, last_update=now, **{name: data[name] for name in fields}))
+
+    with transaction.atomic():
+        for fields, objs in groups.items():
+            Product.objects.bulk_update(objs, [*fields, 'last_update'])
+    caching.bump_products(list(cleaned), collection_ids.values())
+    report['updated'] += len(cleaned)
+
+
+def update_products(rows, chunk_size=CHUNK_SIZE):
+    """
+    Sets inventory and / or unit_price for a list of {id, inventory, unit_price} rows, chunk by chunk.
+    Returns {'updated', 'errors': [{index, id, errors}]}; invalid rows don't stop the others.
+    """
+    report = {'updated': 0, 'errors': []}
+    serializer = ProductBatchUpdateSerializer()
+    cleaned = []
+    for index, row in enumerate(rows):
+        try:
+            cleaned.append((index, serializer.run_validation(row)))
+        except DRFValidationError as error:
+            report['errors'].append({'index': index, 'id': row.get('id') if isinstance(row, dict) else None, 'errors': error.detail})
+
+    # A product listed twice is ambiguous, so none of its rows are applied
+    counts = Counter(data['id'] for _, data in cleaned)
+    for index, data in cleaned:
+        if counts[data['id']] > 1:
+            report['errors'].append({'index': index, 'id': data['id'], 'errors': {'id': [f'Product {data["id"]} is listed more than once.']}})
+    cleaned = [(index, data) for index, data in cleaned if counts[data['id']] == 1]
+
+    for start in range(0, len(cleaned), chunk_size):
+        update_chunk({data['id']: (index, data) for index, data in cleaned[start:start + chunk_size]}, report)
+    report['errors'].sort(key=lambda error: error['index'])
+    return report
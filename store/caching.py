@@ -0,0 +1,140 @@
+import hashlib
+import time
+from datetime import datetime, timezone
+from django.core.cache import cache
+from rest_framework.response import Response
+
+
+# Versioned response cache for product reads.
+# Cached responses are keyed by version counters instead of being deleted: saving a product bumps its own counter,
+# its collection's counter and the catalog counter, so every key that could contain it changes at once.
+# Old entries are never read again and simply age out of the cache.
+KEY_PREFIX = 'store'
+RESPONSE_TIMEOUT = 24 * 60 * 60
+STATS_HITS = f'{KEY_PREFIX}:cache:hits'
+STATS_MISSES = f'{KEY_PREFIX}:cache:misses'
+
+
+def catalog_version_key():
+    return f'{KEY_PREFIX}:version:catalog'
+
+def collection_version_key(collection_id):
+    return f'{KEY_PREFIX}:version:collection:{collection_id}'
+
+def product_version_key(product_id):
+    return f'{KEY_PREFIX}:version:product:{product_id}'
+
+def cart_version_key(cart_id):
+    return f'{KEY_PREFIX}:version:cart:{cart_id}'
+
+# Tax rates and promotions change the prices of many products at once
+def pricing_version_key():
+    return f'{KEY_PREFIX}:version:pricing'
+
+
+def get_versions(*keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Start from the clock, so a counter that was evicted can never come back with a value it already had
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def bump_product(product_id, *collection_ids):
+    bump(
+        catalog_version_key(),
+        product_version_key(product_id),
+        *[collection_version_key(id) for id in set(collection_ids) if id is not None])
+
+def bump_products(product_ids, collection_ids):
+    bump(
+        catalog_version_key(),
+        *[product_version_key(id) for id in product_ids],
+        *[collection_version_key(id) for id in set(collection_ids)])
+
+def bump_cart(cart_id):
+    bump(cart_version_key(cart_id))
+
+# Tax rates are part of every product price, so a tax rate change also bumps pricing
+def bump_collection(collection_id, tax_rate_changed=False):
+    bump(catalog_version_key(), collection_version_key(collection_id))
+    if tax_rate_changed:
+        bump_pricing()
+
+# The pricing version is a timestamp (ns), so it doubles as the time prices last changed
+def bump_pricing():
+    cache.set(pricing_version_key(), time.time_ns(), timeout=None)
+
+def get_pricing_changed_at():
+    version, = get_versions(pricing_version_key())
+    return datetime.fromtimestamp(version / 1e9, tz=timezone.utc)
+
+
+def record(hit):
+    key = STATS_HITS if hit else STATS_MISSES
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, timeout=None)
+        cache.incr(key)
+
+def get_stats():
+    stats = cache.get_many([STATS_HITS, STATS_MISSES])
+    hits, misses = stats.get(STATS_HITS, 0), stats.get(STATS_MISSES, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None
+    }
+
+
+class VersionedCacheMixin:
+    """
+    Serves list() and retrieve() from the cache. Views describe which version counters a response depends on
+    with get_list_version_keys() and get_detail_version_keys(); by default, any catalog change invalidates both.
+    """
+    cache_name = None
+
+    def get_list_version_keys(self, request):
+        return [catalog_version_key()]
+
+    def get_detail_version_keys(self, request, pk):
+        return [catalog_version_key()]
+
+    def get_response_cache_key(self, request, kind, version_keys):
+        versions = ':'.join(str(version) for version in get_versions(*version_keys))
+        # Absolute URLs (image urls, pagination links) depend on the host, so it's part of the key
+        params = sorted(request.query_params.lists())
+        digest = hashlib.md5(repr((request.get_host(), params)).encode('utf-8')).hexdigest()
+        return f'{KEY_PREFIX}:{self.cache_name}:{kind}:{versions}:{digest}'
+
+    def cached_response(self, key, compute):
+        data = cache.get(key)
+        record(hit=data is not None)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+        response = compute()
+        if response.status_code == 200:
+            cache.set(key, response.data, RESPONSE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    def list(self, request, *args, **kwargs):
+        key = self.get_response_cache_key(request, 'list', self.get_list_version_keys(request))
+        return self.cached_response(key, lambda: super(VersionedCacheMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        version_keys = self.get_detail_version_keys(request, kwargs['pk'])
+        key = self.get_response_cache_key(request, f'detail:{kwargs["pk"]}', version_keys)
+        return self.cached_response(key, lambda: super(VersionedCacheMixin, self).retrieve(request, *args, **kwargs))
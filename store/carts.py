@@ -0,0 +1,442 @@
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Prefetch, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone as django_timezone
+from . import caching, increments
+from .models import Cart, CartItem, Product
+
+
+# Cart storage backends, picked by settings.CART_BACKEND:
+# - 'database' (default): carts live in store_cart / store_cartitem.
+# - 'cache': active carts live in the cache as one small record per cart,
+#     {'v': version, 'c': created_at timestamp, 'i': {product_id: quantity}}
+#   Every change rewrites the record and schedules a write-behind persist_cart task (at most one per cart per
+#   CART_PERSIST_DELAY), checkout flushes the cart first, and a cart missing from the cache is reloaded from the
+#   database. A cart is unique per product, so cache-backed items use the product id as their item id: ids stay
+#   the same however many times the cart is persisted or reloaded.
+# Both backends hand out Cart / CartItem instances, so the serializers and the API are the same. Carts come with
+# items_count / total_price and items with total_price already computed (annotated by the database backend).
+# Cart summaries ({id, items_count, total_price}, for header badges) are cached under the cart's version counter,
+# which every change to the cart bumps, and the catalog version, which price changes bump.
+KEY_PREFIX = 'store:cart'
+LOCK_TIMEOUT = 5
+LOCK_WAIT = 2
+SUMMARY_TIMEOUT = 60 * 60
+# Carts record their last activity at most once per TOUCH_INTERVAL, so adding items stays one statement
+TOUCH_INTERVAL = 60 * 60
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+
+
+class CartLocked(Exception):
+    """Another request held the cart's lock for longer than LOCK_WAIT; the change wasn't made."""
+
+
+def get_store():
+    if settings.CART_BACKEND == 'cache':
+        return CacheCartStore()
+    return DatabaseCartStore()
+
+
+def parse_cart_id(cart_id):
+    try:
+        return Cart._meta.pk.to_python(cart_id)
+    except ValidationError:
+        return None
+
+
+def get_item_total(prefix=''):
+    return ExpressionWrapper(F(f'{prefix}quantity') * F(f'{prefix}product__unit_price'), output_field=MONEY)
+
+
+def get_cart_totals():
+    return {
+        'items_count': Coalesce(Sum('items__quantity'), 0),
+        'total_price': Coalesce(Sum(get_item_total('items__')), Value(Decimal(0)), output_field=MONEY)
+    }
+
+
+def get_touch_key(cart_id):
+    return f'{KEY_PREFIX}:{cart_id}:touched'
+
+
+def touch(cart_id):
+    if cache.add(get_touch_key(cart_id), True, TOUCH_INTERVAL):
+        Cart.objects.filter(pk=cart_id).update(last_activity=django_timezone.now())
+
+
+def reap(idle_timeout, chunk_size=1000):
+    """
+    Deletes the carts (and their items) idle for more than idle_timeout seconds, chunk_size carts per transaction,
+    so locks are held briefly. Returns {'carts': n, 'items': n}.
+    """
+    cutoff = django_timezone.now() - timedelta(seconds=idle_timeout)
+    idle = Cart.objects.filter(last_activity__lt=cutoff)
+    reclaimed = {'carts': 0, 'items': 0}
+    while True:
+        cart_ids = list(idle.order_by('last_activity').values_list('id', flat=True)[:chunk_size])
+        if not cart_ids:
+            return reclaimed
+        with transaction.atomic():
+            # Filtered again: a cart used since it was selected is kept
+            _, deleted = idle.filter(id__in=cart_ids).delete()
+        reclaimed['carts'] += deleted.get(Cart._meta.label, 0)
+        reclaimed['items'] += deleted.get(CartItem._meta.label, 0)
+        if settings.CART_BACKEND == 'cache':
+            cache.delete_many([CacheCartStore().get_key(cart_id) for cart_id in cart_ids])
+        if len(cart_ids) < chunk_size:
+            return reclaimed
+
+
+def get_summary(cart_id):
+    """Returns {id, items_count, total_price}, or None if the cart doesn't exist."""
+    cart_id = parse_cart_id(cart_id)
+    if cart_id is None:
+        return None
+    versions = caching.get_versions(caching.cart_version_key(cart_id), caching.catalog_version_key())
+    key = f'{KEY_PREFIX}:summary:{cart_id}:' + ':'.join(str(version) for version in versions)
+    summary = cache.get(key)
+    if summary is None:
+        summary = get_store().get_summary(cart_id)
+        if summary is not None:
+            cache.set(key, summary, SUMMARY_TIMEOUT)
+    return summary
+
+
+class DatabaseCartStore:
+    def create(self):
+        cart = Cart.objects.create()
+        # Its last_activity is now
+        cache.add(get_touch_key(cart.id), True, TOUCH_INTERVAL)
+        cart.items_count, cart.total_price = 0, Decimal(0)
+        cart._prefetched_objects_cache = {'items': []}
+        return cart
+
+    def get_carts(self, cart_id):
+        # Malformed ids match nothing instead of raising
+        cart_id = parse_cart_id(cart_id)
+        return Cart.objects.filter(pk=cart_id) if cart_id is not None else Cart.objects.none()
+
+    def get(self, cart_id):
+        items = CartItem.objects.select_related('product').annotate(total_price=get_item_total())
+        return self.get_carts(cart_id) \
+            .annotate(**get_cart_totals()) \
+            .prefetch_related(Prefetch('items', queryset=items)) \
+            .first()
+
+    def get_summary(self, cart_id):
+        return self.get_carts(cart_id) \
+            .annotate(**get_cart_totals()) \
+            .values('id', 'items_count', 'total_price') \
+            .first()
+
+    def exists(self, cart_id):
+        return self.get_carts(cart_id).exists()
+
+    def delete(self, cart_id):
+        deleted, _ = self.get_carts(cart_id).delete()
+        if deleted:
+            caching.bump_cart(cart_id)
+        return deleted > 0
+
+    def get_items(self, cart_id):
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            return CartItem.objects.none()
+        return CartItem.objects \
+            .filter(cart_id=cart_id) \
+            .select_related('product') \
+            .annotate(total_price=get_item_total())
+
+    def get_item(self, cart_id, item_id):
+        if not str(item_id).isdigit():
+            return None
+        return self.get_items(cart_id).filter(pk=item_id).first()
+
+    def add_item(self, cart_id, product_id, quantity):
+        items = self.add_items(cart_id, {product_id: quantity})
+        return items[0] if items else None
+
+    def add_items(self, cart_id, quantities, replace=False):
+        """
+        Adds {product_id: quantity} to the cart (or, with replace=True, sets the quantities).
+        Returns the resulting items, or None if the cart doesn't exist.
+        """
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            return None
+        # Adds aren't idempotent: the items and the cart's activity commit together, so an error leaves neither and
+        # the add can be retried without counting it twice (no savepoint: the error reaches the caller anyway)
+        with transaction.atomic(savepoint=False):
+            if connection.features.supports_update_conflicts_with_target:
+                items = self.upsert_items(cart_id, quantities, replace)
+            else:
+                items = self.update_or_create_items(cart_id, quantities, replace)
+            if items is not None:
+                touch(cart_id)
+        if items is not None:
+            caching.bump_cart(cart_id)
+        return items
+
+    # One statement for any number of items: INSERT ... ON CONFLICT (cart, product) DO UPDATE, which the database
+    # applies atomically, so concurrent adds never lose an increment. The EXISTS guard turns a missing cart into
+    # zero rows (foreign keys are only checked at commit).
+    def upsert_items(self, cart_id, quantities, replace):
+        table, cart_table = CartItem._meta.db_table, Cart._meta.db_table
+        db_cart_id = CartItem._meta.get_field('cart').get_db_prep_value(cart_id, connection)
+        rows = list(quantities.items())
+        new_quantity = 'excluded.quantity' if replace else f'{table}.quantity + excluded.quantity'
+        sql = (
+            f'INSERT INTO {table} (cart_id, product_id, quantity) '
+            f'SELECT %s, v.column1, v.column2 FROM (VALUES {", ".join(["(%s, %s)"] * len(rows))}) v '
+            f'WHERE EXISTS (SELECT 1 FROM {cart_table} WHERE id = %s) '
+            f'ON CONFLICT (cart_id, product_id) DO UPDATE SET quantity = {new_quantity}')
+        params = [db_cart_id, *[value for row in rows for value in row], db_cart_id]
+        with connection.cursor() as cursor:
+            if connection.features.can_return_rows_from_bulk_insert:
+                cursor.execute(sql + ' RETURNING id, product_id, quantity', params)
+                results = cursor.fetchall()
+            else:
+                cursor.execute(sql, params)
+                results = None
+        if results is None:
+            results = CartItem.objects \
+                .filter(cart_id=cart_id, product_id__in=quantities) \
+                .values_list('id', 'product_id', 'quantity')
+        if not results:
+            return None
+        return [
+            CartItem(id=id, cart_id=cart_id, product_id=product_id, quantity=quantity)
+            for id, product_id, quantity in results
+        ]
+
+    # Databases without ON CONFLICT ... DO UPDATE: F() increments, and an insert in a savepoint for new items
+    def update_or_create_items(self, cart_id, quantities, replace):
+        with transaction.atomic():
+            if not Cart.objects.filter(pk=cart_id).exists():
+                return None
+            for product_id, quantity in quantities.items():
+                items = CartItem.objects.filter(cart_id=cart_id, product_id=product_id)
+                new_quantity = quantity if replace else F('quantity') + quantity
+                if items.update(quantity=new_quantity):
+                    continue
+                try:
+                    with transaction.atomic():
+                        CartItem.objects.create(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                except IntegrityError:
+                    # Added concurrently
+                    items.update(quantity=new_quantity)
+            return list(CartItem.objects.filter(cart_id=cart_id, product_id__in=quantities))
+
+    def update_item(self, cart_id, item, quantity):
+        CartItem.objects.filter(pk=item.pk).update(quantity=quantity)
+        caching.bump_cart(item.cart_id)
+        touch(item.cart_id)
+        item.quantity = quantity
+        return item
+
+    def remove_item(self, cart_id, item):
+        item.delete()
+        caching.bump_cart(item.cart_id)
+        touch(item.cart_id)
+
+    # Carts are small: the item ids, quantities and product timestamps are enough to validate one
+    def get_validator_parts(self, cart_id):
+        rows = list(self.get_carts(cart_id)
+                    .values_list('items__id', 'items__quantity', 'items__product__last_update')
+                    .order_by('items__id'))
+        return rows or None
+
+    def flush(self, cart_id):
+        pass
+
+
+class CacheCartStore:
+    def get_key(self, cart_id):
+        return f'{KEY_PREFIX}:{cart_id}'
+
+    def read(self, cart_id):
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is None:
+            return None, None
+        record = cache.get(self.get_key(cart_id))
+        if record is None:
+            record = self.load(cart_id)
+        return cart_id, record
+
+    # A cart that isn't cached (evicted, or created before the cache backend) is read back from the database
+    def load(self, cart_id):
+        cart = Cart.objects.filter(pk=cart_id).values_list('created_at', flat=True).first()
+        if cart is None:
+            return None
+        items = CartItem.objects.filter(cart_id=cart_id).order_by('id').values_list('product_id', 'quantity')
+        record = {'v': 0, 'c': cart.timestamp(), 'i': dict(items)}
+        cache.add(self.get_key(cart_id), record, settings.CART_CACHE_TIMEOUT)
+        return record
+
+    def write(self, cart_id, record):
+        record['v'] += 1
+        cache.set(self.get_key(cart_id), record, settings.CART_CACHE_TIMEOUT)
+        caching.bump_cart(cart_id)
+        # Imported here: tasks imports this module
+        from .tasks import queue_persist_cart
+        queue_persist_cart(cart_id)
+
+    @contextmanager
+    def lock(self, cart_id):
+        # Serializes read-modify-write of one cart; a lock left by a crashed request expires after LOCK_TIMEOUT
+        key, token = f'{self.get_key(cart_id)}:lock', uuid4().hex
+        deadline = time.monotonic() + LOCK_WAIT
+        while not cache.add(key, token, LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                # Going ahead without the lock would lose the other request's change
+                raise CartLocked(f'Cart {cart_id} is being changed by another request.')
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            if cache.get(key) == token:
+                cache.delete(key)
+
+    def build(self, cart_id, record):
+        products = Product.objects.only('id', 'title', 'unit_price').in_bulk(list(record['i']))
+        items = [
+            CartItem(id=product_id, cart_id=cart_id, product=products[product_id], quantity=quantity)
+            for product_id, quantity in record['i'].items() if product_id in products
+        ]
+        for item in items:
+            item.total_price = item.quantity * item.product.unit_price
+        cart = Cart(id=cart_id, created_at=datetime.fromtimestamp(record['c'], tz=timezone.utc))
+        cart.items_count = sum(item.quantity for item in items)
+        cart.total_price = sum((item.total_price for item in items), Decimal(0))
+        # What prefetch_related('items') would have set, so cart.items.all() doesn't query
+        cart._prefetched_objects_cache = {'items': items}
+        return cart, items
+
+    def create(self):
+        cart_id = uuid4()
+        record = {'v': 0, 'c': time.time(), 'i': {}}
+        self.write(cart_id, record)
+        return self.build(cart_id, record)[0]
+
+    def get(self, cart_id):
+        cart_id, record = self.read(cart_id)
+        if record is None:
+            return None
+        return self.build(cart_id, record)[0]
+
+    def exists(self, cart_id):
+        return self.read(cart_id)[1] is not None
+
+    def get_summary(self, cart_id):
+        cart_id, record = self.read(cart_id)
+        if record is None:
+            return None
+        prices = dict(Product.objects.filter(id__in=list(record['i'])).values_list('id', 'unit_price'))
+        quantities = [(quantity, prices[product_id]) for product_id, quantity in record['i'].items() if product_id in prices]
+        return {
+            'id': cart_id,
+            'items_count': sum(quantity for quantity, _ in quantities),
+            'total_price': sum((quantity * price for quantity, price in quantities), Decimal(0))
+        }
+
+    def delete(self, cart_id):
+        with self.lock(cart_id):
+            cart_id, record = self.read(cart_id)
+            if record is None:
+                return False
+            cache.delete(self.get_key(cart_id))
+            Cart.objects.filter(pk=cart_id).delete()
+            caching.bump_cart(cart_id)
+        return True
+
+    def get_items(self, cart_id):
+        cart_id, record = self.read(cart_id)
+        if record is None:
+            return []
+        return self.build(cart_id, record)[1]
+
+    def get_item(self, cart_id, item_id):
+        try:
+            item_id = int(item_id)
+        except (TypeError, ValueError):
+            return None
+        return next((item for item in self.get_items(cart_id) if item.id == item_id), None)
+
+    def add_item(self, cart_id, product_id, quantity):
+        items = self.add_items(cart_id, {product_id: quantity})
+        return items[0] if items else None
+
+    def add_items(self, cart_id, quantities, replace=False):
+        with self.lock(cart_id):
+            cart_id, record = self.read(cart_id)
+            if record is None:
+                return None
+            for product_id, quantity in quantities.items():
+                record['i'][product_id] = quantity if replace else record['i'].get(product_id, 0) + quantity
+            self.write(cart_id, record)
+        return [
+            CartItem(id=product_id, cart_id=cart_id, product_id=product_id, quantity=record['i'][product_id])
+            for product_id in quantities
+        ]
+
+    def update_item(self, cart_id, item, quantity):
+        with self.lock(cart_id):
+            cart_id, record = self.read(cart_id)
+            if record is not None and item.product_id in record['i']:
+                record['i'][item.product_id] = quantity
+                self.write(cart_id, record)
+        item.quantity = quantity
+        return item
+
+    def remove_item(self, cart_id, item):
+        with self.lock(cart_id):
+            cart_id, record = self.read(cart_id)
+            if record is not None and record['i'].pop(item.product_id, None) is not None:
+                self.write(cart_id, record)
+
+    def get_validator_parts(self, cart_id):
+        cart_id, record = self.read(cart_id)
+        if record is None:
+            return None
+        # Prices are part of the payload, so the product timestamps are too
+        products = sorted(Product.objects.filter(id__in=list(record['i'])).values_list('id', 'last_update'))
+        return record['v'], sorted(record['i'].items()), products
+
+    def flush(self, cart_id):
+        """Writes the cached cart to the database now (checkout reads carts from the database)."""
+        cart_id = parse_cart_id(cart_id)
+        if cart_id is not None:
+            persist_cached_cart(cart_id)
+
+
+def persist(cart_id, record):
+    with transaction.atomic():
+        cart, created = Cart.objects.update_or_create(pk=cart_id, defaults={'last_activity': django_timezone.now()})
+        if created:
+            # created_at is auto_now_add, so the cart's real creation time is set afterwards
+            Cart.objects.filter(pk=cart_id).update(created_at=datetime.fromtimestamp(record['c'], tz=timezone.utc))
+        items = record['i']
+        CartItem.objects.filter(cart_id=cart_id).exclude(product_id__in=list(items)).delete()
+        existing = set(Product.objects.filter(id__in=list(items)).values_list('id', flat=True))
+        increments.bulk_upsert(
+            CartItem,
+            [CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+             for product_id, quantity in items.items() if product_id in existing],
+            ['cart', 'product'], ['quantity'])
+
+
+def persist_cached_cart(cart_id):
+    """Write-behind: copies the current cached state of a cart to the database."""
+    store = CacheCartStore()
+    with store.lock(cart_id):
+        record = cache.get(store.get_key(cart_id))
+        if record is not None:
+            persist(cart_id, record)
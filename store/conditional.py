@@ -0,0 +1,49 @@
+import hashlib
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode('utf-8')).hexdigest())
+
+
+class ConditionalGetMixin:
+    """
+    ETag / Last-Modified support for list() and retrieve().
+    Views compute the validators cheaply (an aggregate or a cache read, never the serializer) in
+    get_list_validators() and get_detail_validators(), which return an (etag, last_modified) pair.
+    last_modified is a datetime or None; returning (None, None) skips the conditional handling.
+    A matching If-None-Match / If-Modified-Since gets a 304 before any serializer work happens.
+    """
+    def get_list_validators(self, request):
+        return None, None
+
+    def get_detail_validators(self, request, pk):
+        return None, None
+
+    def conditional_response(self, request, validators, compute):
+        etag, last_modified = validators
+        timestamp = int(last_modified.timestamp()) if last_modified is not None else None
+        if etag is not None or timestamp is not None:
+            not_modified = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if not_modified is not None:
+                return not_modified
+        response = compute()
+        if response.status_code == 200:
+            if etag is not None:
+                response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            self.get_list_validators(request),
+            lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs))
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request,
+            self.get_detail_validators(request, kwargs['pk']),
+            lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs))
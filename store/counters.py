@@ -0,0 +1,21 @@
+from django.db.models.aggregates import Count
+from . import caching
+from .models import Collection
+
+
+def recount_collections(collection_ids=None, fix=True):
+    """
+    Compares Collection.product_count with the products table and returns the collections that were out of date
+    (annotated with actual_count, and stored_count when fixed).
+    """
+    collections = Collection.objects.annotate(actual_count=Count('products')).order_by('id')
+    if collection_ids is not None:
+        collections = collections.filter(id__in=collection_ids)
+    mismatched = [collection for collection in collections if collection.product_count != collection.actual_count]
+    if fix and mismatched:
+        for collection in mismatched:
+            collection.stored_count = collection.product_count
+            collection.product_count = collection.actual_count
+            caching.bump_collection(collection.id)
+        Collection.objects.bulk_update(mismatched, ['product_count'])
+    return mismatched
@@ -0,0 +1,110 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Q, Sum
+from .models import CustomerProductStats, CustomerStats, Order, OrderItem
+from . import increments
+
+
+# Per-customer aggregates for the customer history endpoint and the admin: order count, lifetime spend (orders whose
+# payment completed), last order date and the products each customer bought most. Placing an order adds to them
+# (the order_created signal) and payment status changes move the order total in or out of the spend, so reading a
+# customer's history never aggregates their orders. rebuild() recomputes them from Order / OrderItem, nightly too
+# (the rebuild_customer_stats task), which catches up orders whose increments failed.
+DEFAULT_LIMIT = 5
+REVENUE = ExpressionWrapper(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def add_order(order):
+    """Adds an order to its customer's aggregates, with the same queries for any number of items."""
+    items = OrderItem.objects \
+        .filter(order=order) \
+        .values('product_id') \
+        .annotate(units=Sum('quantity'), revenue=Sum(REVENUE)) \
+        .order_by()
+    rows = [
+        {'customer_id': order.customer_id, 'product_id': item['product_id'],
+         'units': item['units'], 'revenue': item['revenue']}
+        for item in items
+    ]
+    spend = sum((row['revenue'] for row in rows), Decimal(0)) if order.payment_status == Order.STATUS_COMPLETED else Decimal(0)
+    increments.bulk_increment(
+        CustomerStats,
+        [{'customer_id': order.customer_id, 'orders_count': 1, 'lifetime_spend': spend, 'last_order_at': order.placed_at}],
+        ['customer_id'], ['orders_count', 'lifetime_spend'])
+    # Orders placed by concurrent workers can finish out of order
+    CustomerStats.objects \
+        .filter(Q(last_order_at__lt=order.placed_at) | Q(last_order_at__isnull=True), customer_id=order.customer_id) \
+        .update(last_order_at=order.placed_at)
+    increments.bulk_increment(CustomerProductStats, rows, ['customer_id', 'product_id'], ['units', 'revenue'])
+
+
+def get_order_total(order_id):
+    return OrderItem.objects.filter(order_id=order_id).aggregate(total=Sum(REVENUE))['total'] or Decimal(0)
+
+
+def change_payment_status(order, previous_status):
+    completed = order.payment_status == Order.STATUS_COMPLETED
+    if completed == (previous_status == Order.STATUS_COMPLETED):
+        return
+    total = get_order_total(order.pk)
+    spend = F('lifetime_spend') + total if completed else F('lifetime_spend') - total
+    if not CustomerStats.objects.filter(customer_id=order.customer_id).update(lifetime_spend=spend):
+        # The customer's orders were never added (e.g. created before the aggregates existed)
+        rebuild([order.customer_id])
+
+
+def rebuild(customer_ids=None, batch_size=1000):
+    """Recomputes the aggregates of the given customers (all of them by default). Returns the number of customers."""
+    orders = Order.objects.all()
+    items = OrderItem.objects.all()
+    if customer_ids is not None:
+        orders = orders.filter(customer_id__in=customer_ids)
+        items = items.filter(order__customer_id__in=customer_ids)
+
+    with transaction.atomic():
+        spend = dict(
+            items.filter(order__payment_status=Order.STATUS_COMPLETED)
+            .values('order__customer_id')
+            .annotate(spend=Sum(REVENUE))
+            .order_by()
+            .values_list('order__customer_id', 'spend'))
+        stats = [
+            CustomerStats(customer_id=row['customer_id'], orders_count=row['orders_count'],
+                          lifetime_spend=spend.get(row['customer_id'], Decimal(0)), last_order_at=row['last_order_at'])
+            for row in orders
+            .values('customer_id')
+            .annotate(orders_count=Count('id'), last_order_at=Max('placed_at'))
+            .order_by()
+            .iterator()
+        ]
+        products = [
+            CustomerProductStats(customer_id=row['order__customer_id'], product_id=row['product_id'],
+                                 units=row['units'], revenue=row['revenue'])
+            for row in items
+            .values('order__customer_id', 'product_id')
+            .annotate(units=Sum('quantity'), revenue=Sum(REVENUE))
+            .order_by()
+            .iterator()
+        ]
+
+        stored_stats, stored_products = CustomerStats.objects.all(), CustomerProductStats.objects.all()
+        if customer_ids is not None:
+            stored_stats = stored_stats.filter(customer_id__in=customer_ids)
+            stored_products = stored_products.filter(customer_id__in=customer_ids)
+        stored_stats.delete()
+        stored_products.delete()
+        CustomerStats.objects.bulk_create(stats, batch_size=batch_size)
+        CustomerProductStats.objects.bulk_create(products, batch_size=batch_size)
+    return len(stats)
+
+
+def get_stats(customer):
+    # Customers without orders have no row
+    return customer.stats if hasattr(customer, 'stats') else CustomerStats(customer=customer)
+
+
+def get_top_products(customer_id, limit=DEFAULT_LIMIT):
+    return CustomerProductStats.objects \
+        .filter(customer_id=customer_id) \
+        .select_related('product') \
+        .order_by('-units', 'product_id')[:limit]
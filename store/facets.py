@@ -0,0 +1,58 @@
+from decimal import Decimal
+from django.db.models import BooleanField, Case, Count, F, IntegerField, Value, When
+from django.db.models.functions import Cast, Floor
+
+
+DEFAULT_PRICE_BUCKET = 10
+
+
+def compute_facets(queryset, bucket_size=DEFAULT_PRICE_BUCKET, collection_queryset=None):
+    """
+    Collection counts, a unit_price histogram and stock counts for the (already filtered) product queryset.
+    Everything comes from one GROUP BY (collection, price bucket, in stock) query that is folded in Python.
+    When the queryset is filtered by collection, pass collection_queryset (the same filters without the collection
+    one): the collection counts are then read from it with a second query, so they show every collection the other
+    filters match rather than only the selected one.
+    """
+    rows = queryset \
+        .order_by() \
+        .prefetch_related(None) \
+        .annotate(
+            price_bucket=Cast(Floor(F('unit_price') / Value(Decimal(bucket_size))), IntegerField()),
+            in_stock=Case(When(inventory__gt=0, then=Value(True)), default=Value(False), output_field=BooleanField())) \
+        .values('collection_id', 'collection__title', 'price_bucket', 'in_stock') \
+        .annotate(count=Count('id'))
+
+    total = 0
+    collections = {}
+    buckets = {}
+    stock = {'in_stock': 0, 'out_of_stock': 0}
+    for row in rows:
+        count = row['count']
+        total += count
+        collection = collections.setdefault(
+            row['collection_id'], {'id': row['collection_id'], 'title': row['collection__title'], 'count': 0})
+        collection['count'] += count
+        buckets[row['price_bucket']] = buckets.get(row['price_bucket'], 0) + count
+        stock['in_stock' if row['in_stock'] else 'out_of_stock'] += count
+
+    if collection_queryset is not None:
+        rows = collection_queryset \
+            .order_by() \
+            .prefetch_related(None) \
+            .values('collection_id', 'collection__title') \
+            .annotate(count=Count('id'))
+        collections = {
+            row['collection_id']: {'id': row['collection_id'], 'title': row['collection__title'], 'count': row['count']}
+            for row in rows
+        }
+
+    return {
+        'count': total,
+        'collections': sorted(collections.values(), key=lambda collection: collection['title']),
+        'prices': [
+            {'min': bucket * bucket_size, 'max': (bucket + 1) * bucket_size, 'count': buckets[bucket]}
+            for bucket in sorted(buckets)
+        ],
+        'stock': stock
+    }
@@ -1,7 +1,11 @@
-from django_filters.rest_framework import FilterSet
+from django_filters.rest_framework import FilterSet, NumberFilter
 from .models import Product
 
 class ProductFilter(FilterSet):
+    # effective_price is annotated by the view (see pricing.annotate_prices)
+    effective_price__gt = NumberFilter(field_name='effective_price', lookup_expr='gt')
+    effective_price__lt = NumberFilter(field_name='effective_price', lookup_expr='lt')
+
     class Meta:
         model = Product
         fields = {
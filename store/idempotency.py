@@ -0,0 +1,83 @@
+import hashlib
+import time
+from uuid import uuid4
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+
+# Idempotency-Key support for POSTs that clients retry (checkout, adding cart items).
+# The first request with a key runs normally and its successful response is stored in the cache for
+# IDEMPOTENCY_TTL; retries with the same key get the stored response back (Idempotent-Replayed: true) without the
+# serializer or any cart / order queries. A duplicate arriving while the first request is still running waits for
+# its response. Keys are scoped to the user and the URL, and reusing a key with a different body is a 422.
+# Failed requests (4xx / 5xx) aren't stored: a retry runs again.
+KEY_PREFIX = 'store:idempotency'
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# How long an in-flight request holds its key, and how long a duplicate waits for it
+LOCK_TIMEOUT = 30
+WAIT_TIMEOUT = 10
+POLL_INTERVAL = 0.05
+REPLAYED_HEADERS = ['Location']
+
+
+class IdempotentMixin:
+    """
+    Views wrap their POST handlers with idempotent_response(request, compute); create() is wrapped already.
+    """
+    def get_idempotency_cache_key(self, request, key):
+        user_id = request.user.pk if request.user.is_authenticated else None
+        digest = hashlib.sha256(repr((user_id, request.path, key)).encode('utf-8')).hexdigest()
+        return f'{KEY_PREFIX}:{digest}'
+
+    def idempotent_response(self, request, compute):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return compute()
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response({'detail': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        cache_key = self.get_idempotency_cache_key(request, key)
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        lock_key, token = f'{cache_key}:lock', uuid4().hex
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while True:
+            stored = cache.get(cache_key)
+            if stored is not None:
+                return self.replay(stored, fingerprint)
+            if cache.add(lock_key, token, LOCK_TIMEOUT):
+                break
+            if time.monotonic() >= deadline:
+                return Response({'detail': f'A request with this {HEADER} is still in progress.'},
+                                status=status.HTTP_409_CONFLICT)
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = compute()
+            if 200 <= response.status_code < 300:
+                cache.set(cache_key, {
+                    'fingerprint': fingerprint,
+                    'status': response.status_code,
+                    'data': response.data,
+                    'headers': {name: response[name] for name in REPLAYED_HEADERS if response.has_header(name)}
+                }, settings.IDEMPOTENCY_TTL)
+            return response
+        finally:
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
+
+    def replay(self, stored, fingerprint):
+        if stored['fingerprint'] != fingerprint:
+            return Response({'detail': f'This {HEADER} was already used with a different request body.'},
+                            status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+        response = Response(stored['data'], status=stored['status'], headers=stored['headers'])
+        response['Idempotent-Replayed'] = 'true'
+        return response
+
+    def create(self, request, *args, **kwargs):
+        return self.idempotent_response(
+            request,
+            lambda: super(IdempotentMixin, self).create(request, *args, **kwargs))
@@ -0,0 +1,62 @@
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+
+
+def bulk_increment(model, rows, unique_fields, sum_fields):
+    """
+    Adds rows (dicts of field values) to the stored ones: rows whose unique_fields already exist get their
+    sum_fields incremented, the others are inserted. Safe under concurrent writers.
+    One INSERT ... ON CONFLICT DO UPDATE statement where the database has it, otherwise an F() update per row,
+    with an insert in a savepoint for new rows.
+    """
+    if not rows:
+        return
+    if connection.features.supports_update_conflicts_with_target:
+        upsert(model, rows, unique_fields, sum_fields)
+        return
+    for row in rows:
+        increment(model, row, unique_fields, sum_fields)
+
+
+def upsert(model, rows, unique_fields, sum_fields):
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    names = list(rows[0])
+    fields = [model._meta.get_field(name) for name in names]
+    conflict = ', '.join(quote(model._meta.get_field(name).column) for name in unique_fields)
+    updates = ', '.join(
+        f'{column} = {table}.{column} + excluded.{column}'
+        for column in (quote(model._meta.get_field(name).column) for name in sum_fields))
+    placeholders = '(' + ', '.join(['%s'] * len(fields)) + ')'
+    sql = (
+        f'INSERT INTO {table} ({", ".join(quote(field.column) for field in fields)}) '
+        f'VALUES {", ".join([placeholders] * len(rows))} '
+        f'ON CONFLICT ({conflict}) DO UPDATE SET {updates}')
+    params = [field.get_db_prep_save(row[name], connection) for row in rows for name, field in zip(names, fields)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+
+
+def increment(model, row, unique_fields, sum_fields):
+    stored = model.objects.filter(**{name: row[name] for name in unique_fields})
+    # F() keeps the increment atomic under concurrent writers
+    increments = {name: F(name) + row[name] for name in sum_fields}
+    if stored.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**row)
+    except IntegrityError:
+        # Another writer created the row first
+        stored.update(**increments)
+
+
+def bulk_upsert(model, objs, unique_fields, update_fields, batch_size=None):
+    """
+    bulk_create(update_conflicts=True) on every database Django supports it on: PostgreSQL and SQLite take
+    unique_fields as the ON CONFLICT target, MySQL has no target (ON DUPLICATE KEY UPDATE fires on any unique key),
+    so objs must not collide with stored rows on any other unique key.
+    """
+    target = unique_fields if connection.features.supports_update_conflicts_with_target else None
+    return model.objects.bulk_create(
+        objs, batch_size=batch_size, update_conflicts=True, unique_fields=target, update_fields=update_fields)
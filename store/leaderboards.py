@@ -0,0 +1,96 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import OrderItem, ProductSales
+from . import increments
+
+
+# Best-seller / revenue leaderboards backed by the ProductSales rollup: one row per product and calendar period
+# (day, week, month, all time). Placing an order adds its items to the four rows of each product
+# (the order_created signal), so reading a leaderboard is an ORDER BY ... LIMIT k on an index.
+# rebuild() recomputes everything from OrderItem, for backfills and nightly (the rebuild_leaderboards task), which
+# catches up orders whose increments failed.
+PERIODS = {
+    'day': ProductSales.PERIOD_DAY,
+    'week': ProductSales.PERIOD_WEEK,
+    'month': ProductSales.PERIOD_MONTH,
+    'all': ProductSales.PERIOD_ALL
+}
+METRICS = ['revenue', 'units']
+ALL_TIME_START = date(1970, 1, 1)
+DEFAULT_LIMIT = 5
+MAX_LIMIT = 100
+
+
+def get_period_start(period, day):
+    if period == ProductSales.PERIOD_DAY:
+        return day
+    if period == ProductSales.PERIOD_WEEK:
+        return day - timedelta(days=day.weekday())
+    if period == ProductSales.PERIOD_MONTH:
+        return day.replace(day=1)
+    return ALL_TIME_START
+
+
+def get_rollup_keys(day):
+    return [(period, get_period_start(period, day)) for period, _ in ProductSales.PERIOD_CHOICES]
+
+
+def add_order(order):
+    """Adds an order's items to the rollups. Runs in the caller's transaction."""
+    day = timezone.localdate(order.placed_at)
+    items = OrderItem.objects \
+        .filter(order=order) \
+        .values('product_id', 'product__collection_id') \
+        .annotate(units=Sum('quantity'), revenue=Sum(F('unit_price') * F('quantity')))
+    rows = [
+        {'period': period, 'period_start': period_start, 'product_id': item['product_id'],
+         'collection_id': item['product__collection_id'], 'units': item['units'], 'revenue': item['revenue']}
+        for item in items for period, period_start in get_rollup_keys(day)
+    ]
+    # One INSERT ... ON CONFLICT DO UPDATE for all the rows of an order, so checkout makes the same queries for any
+    # number of items
+    increments.bulk_increment(ProductSales, rows, ['period', 'period_start', 'product_id'], ['units', 'revenue'])
+
+
+def move_product(product_id, collection_id):
+    ProductSales.objects.filter(product_id=product_id).update(collection_id=collection_id)
+
+
+def rebuild(batch_size=1000):
+    """Recomputes every rollup row from the order items. Returns the number of rows written."""
+    revenue = ExpressionWrapper(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    daily = OrderItem.objects \
+        .annotate(day=TruncDate('order__placed_at')) \
+        .values('product_id', 'product__collection_id', 'day') \
+        .annotate(units=Sum('quantity'), revenue=Sum(revenue)) \
+        .order_by()
+    totals = {}
+    for row in daily.iterator():
+        for period, period_start in get_rollup_keys(row['day']):
+            key = (period, period_start, row['product_id'])
+            total = totals.setdefault(key, [row['product__collection_id'], 0, Decimal(0)])
+            total[1] += row['units']
+            total[2] += row['revenue']
+
+    rows = [
+        ProductSales(period=period, period_start=period_start, product_id=product_id,
+                     collection_id=collection_id, units=units, revenue=revenue)
+        for (period, period_start, product_id), (collection_id, units, revenue) in totals.items()
+    ]
+    with transaction.atomic():
+        ProductSales.objects.all().delete()
+        ProductSales.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def get_leaderboard(period='all', metric='revenue', day=None, collection_id=None, limit=DEFAULT_LIMIT):
+    period = PERIODS[period]
+    day = day or timezone.localdate()
+    rows = ProductSales.objects.filter(period=period, period_start=get_period_start(period, day))
+    if collection_id is not None:
+        rows = rows.filter(collection_id=collection_id)
+    return rows.select_related('product').order_by(f'-{metric}', 'product_id')[:limit]
@@ -0,0 +1,36 @@
+from typing import Any
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from store import search
+from store.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Compares the full-text product search with the icontains SearchFilter it replaced'
+
+    def add_arguments(self, parser):
+        parser.add_argument('terms', nargs='*', default=['coffee', 'bread', 'wine', 'app', 'chees'])
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int, default=10, help='Rows fetched per query (one page)')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        if not search.is_supported():
+            self.stderr.write('This database has no full-text index to benchmark.')
+            return
+        repeat, limit = options['repeat'], options['limit']
+        self.stdout.write(f'{Product.objects.count()} products, {repeat} runs per term, {limit} rows per page')
+        self.stdout.write(f'{"term":<15}{"icontains (ms)":>16}{"full-text (ms)":>16}{"hits":>8}')
+        for term in options['terms']:
+            # What DRF's SearchFilter builds for search_fields = ['title', 'description']
+            icontains = Product.objects.filter(Q(title__icontains=term) | Q(description__icontains=term))
+            ranked = search.search_products(Product.objects.all(), term).order_by('-rank', 'id')
+            like_ms = self.time(lambda: (icontains.count(), list(icontains[:limit])), repeat)
+            fts_ms = self.time(lambda: (ranked.count(), list(ranked[:limit])), repeat)
+            self.stdout.write(f'{term:<15}{like_ms:>16.2f}{fts_ms:>16.2f}{ranked.count():>8}')
+
+    def time(self, run, repeat):
+        start = perf_counter()
+        for _ in range(repeat):
+            run()
+        return (perf_counter() - start) * 1000 / repeat
@@ -0,0 +1,52 @@
+from typing import Any
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from store.models import Product, Collection
+from store.pricing import annotate_prices
+from store.serializers import ProductSerializer, ProductValuesSerializer, SimpleProductSerializer, SimpleProductValuesSerializer, CollectionSerializer, CollectionValuesSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares the ModelSerializer list path with the values() read path (queries + serialization + rendering)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='*', default=[10, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        request = Request(APIRequestFactory().get('/store/products/'))
+        context = {'request': request}
+        collections = Collection.objects.all()
+        cases = [
+            ('ProductSerializer', ProductSerializer, ProductValuesSerializer, annotate_prices(Product.objects.prefetch_related('images'))),
+            ('SimpleProductSerializer', SimpleProductSerializer, SimpleProductValuesSerializer, Product.objects.all()),
+            ('CollectionSerializer', CollectionSerializer, CollectionValuesSerializer, collections),
+        ]
+        self.stdout.write(f'{"serializer":<26}{"rows":>6}{"model (ms)":>12}{"values (ms)":>13}{"speedup":>9}{"same":>6}')
+        for name, serializer_class, values_serializer_class, queryset in cases:
+            for size in options['sizes']:
+                # .all() gives each run a fresh queryset, so neither path reads a cached result
+                def model_path():
+                    page = queryset.all()[:size]
+                    return JSONRenderer().render(serializer_class(page, many=True, context=context).data)
+
+                def values_path():
+                    serializer = values_serializer_class(context=context)
+                    rows = queryset.all()[:size].prefetch_related(None).values(*serializer.get_values_fields())
+                    return JSONRenderer().render(serializer.serialize(rows))
+
+                same = model_path() == values_path()
+                model_ms = self.time(model_path, options['repeat'])
+                values_ms = self.time(values_path, options['repeat'])
+                rows = len(queryset.all()[:size])
+                self.stdout.write(
+                    f'{name:<26}{rows:>6}{model_ms:>12.2f}{values_ms:>13.2f}{model_ms / values_ms:>8.1f}x{str(same):>6}')
+
+    def time(self, run, repeat):
+        start = perf_counter()
+        for _ in range(repeat):
+            run()
+        return (perf_counter() - start) * 1000 / repeat
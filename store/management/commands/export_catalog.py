@@ -0,0 +1,22 @@
+import sys
+from typing import Any
+from django.core.management.base import BaseCommand
+from store import bulk
+
+
+class Command(BaseCommand):
+    help = 'Streams collections, products or images to NDJSON or CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(bulk.KINDS))
+        parser.add_argument('--format', choices=bulk.FORMATS, default='ndjson')
+        parser.add_argument('--output', help='File to write (default: stdout)')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for line in bulk.export_lines(options['kind'], options['format']):
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
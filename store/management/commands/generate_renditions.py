@@ -0,0 +1,32 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+from store import renditions
+from store.models import ProductImage
+from store.tasks import queue_renditions
+
+
+class Command(BaseCommand):
+    help = 'Generates missing or outdated renditions for existing product images (media/store/images)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate renditions that are already current')
+        parser.add_argument('--queue', action='store_true', help='Hand the images to Celery instead of resizing here')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        images = ProductImage.objects.exclude(image='').order_by('id')
+        pending = [image for image in images.iterator() if options['force'] or not renditions.is_current(image)]
+
+        if options['queue']:
+            queue_renditions([image.id for image in pending])
+            self.stdout.write(self.style.SUCCESS(f'Queued {len(pending)} images'))
+            return
+
+        failed = 0
+        for image in pending:
+            try:
+                renditions.generate(image)
+            except (OSError, ValueError) as error:
+                # Missing or unreadable source files shouldn't stop the backfill
+                failed += 1
+                self.stderr.write(f'Image {image.id} ({image.image.name}): {error}')
+        self.stdout.write(self.style.SUCCESS(f'Generated renditions for {len(pending) - failed} images, {failed} failed'))
@@ -0,0 +1,23 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+from store import bulk
+
+
+class Command(BaseCommand):
+    help = 'Upserts collections, products or images from an NDJSON or CSV file, in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(bulk.KINDS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=bulk.FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=bulk.CHUNK_SIZE)
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        format = options['format'] or ('csv' if options['path'].endswith('.csv') else 'ndjson')
+        with open(options['path'], newline='', encoding='utf-8') as file:
+            report = bulk.import_rows(options['kind'], bulk.read_rows(file, format), options['chunk_size'])
+
+        for error in report['errors']:
+            self.stderr.write(f'Line {error["line"]}: {error["errors"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{report["created"]} created, {report["updated"]} updated, {len(report["errors"])} rejected'))
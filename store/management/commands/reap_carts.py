@@ -0,0 +1,16 @@
+from typing import Any
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from store import carts
+
+
+class Command(BaseCommand):
+    help = 'Deletes the carts idle for longer than CART_IDLE_TIMEOUT (what the reap_carts task runs)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle-timeout', type=int, default=settings.CART_IDLE_TIMEOUT, help='Seconds without changes')
+        parser.add_argument('--chunk-size', type=int, default=settings.CART_REAP_CHUNK_SIZE, help='Carts deleted per transaction')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        reclaimed = carts.reap(options['idle_timeout'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {reclaimed["carts"]} carts and {reclaimed["items"]} cart items'))
@@ -0,0 +1,23 @@
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError
+from store.counters import recount_collections
+
+
+class Command(BaseCommand):
+    help = 'Recomputes Collection.product_count (e.g. after bulk imports); --check only reports the differences'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Report mismatches without fixing them')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        mismatched = recount_collections(fix=not options['check'])
+        for collection in mismatched:
+            stored = getattr(collection, 'stored_count', collection.product_count)
+            self.stdout.write(f'{collection.title} (#{collection.id}): stored {stored}, actual {collection.actual_count}')
+
+        if options['check']:
+            if mismatched:
+                raise CommandError(f'{len(mismatched)} collection counts are out of date')
+            self.stdout.write(self.style.SUCCESS('All collection counts are correct'))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Fixed {len(mismatched)} collection counts'))
@@ -0,0 +1,11 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+from store import customer_stats
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the customer aggregates (order count, spend, top products) from all orders'
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        count = customer_stats.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt the aggregates of {count} customers'))
@@ -0,0 +1,11 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+from store import leaderboards
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the sales leaderboard rollups from all order items (after imports or raw SQL changes)'
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        count = leaderboards.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} rollup rows'))
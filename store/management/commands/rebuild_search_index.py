@@ -0,0 +1,14 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+from store import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the product full-text search index (needed after seed_db or other raw SQL imports)'
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        if not search.is_supported():
+            self.stdout.write('This database has no full-text index; searches use the default filter.')
+            return
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} products'))
@@ -0,0 +1,28 @@
+from typing import Any
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from store import analytics
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the daily sales rollups from the orders, for a date range or every day (backfill)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day (YYYY-MM-DD), the first order by default')
+        parser.add_argument('--end', help='Last day (YYYY-MM-DD), the last order by default')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        start, end = self.parse_day(options['start']), self.parse_day(options['end'])
+        count = analytics.reconcile(start, end)
+        self.stdout.write(self.style.SUCCESS(f'Wrote {count} rollup rows'))
+
+    def parse_day(self, value):
+        if value is None:
+            return None
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is None:
+            raise CommandError(f'{value} is not a date (YYYY-MM-DD).')
+        return day
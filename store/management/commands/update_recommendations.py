@@ -0,0 +1,16 @@
+from typing import Any
+from django.core.management.base import BaseCommand
+from store import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Adds the orders placed since the last run to the frequently-bought-together recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Discard the stored counts and rescan every order')
+
+    def handle(self, *args: Any, **options: Any) -> str | None:
+        if options['rebuild']:
+            recommendations.reset_recommendations()
+        count = recommendations.update_recommendations()
+        self.stdout.write(self.style.SUCCESS(f'Updated recommendations for {count} products'))
@@ -0,0 +1,148 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+from .storage import IMMUTABLE_CACHE_CONTROL, is_fingerprinted
+
+
+# Media view for every environment (MEDIA_URL), replacing django.views.static.serve, which is development only.
+# - Behind nginx or Apache (MEDIA_OFFLOAD = 'x-accel-redirect' / 'x-sendfile') the view only checks the file and
+#   hands the transfer to the proxy, so no worker ever copies bytes.
+# - Otherwise it returns a FileResponse over the open file: gunicorn passes those to os.sendfile() (zero-copy),
+#   including single byte ranges, since the file is positioned at the range start and Content-Length is set.
+# ETag / Last-Modified come from os.stat(), so 304s never open the file.
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_validators(path, stat):
+    # A fingerprinted name already identifies the bytes
+    if is_fingerprinted(path):
+        etag = '"%s"' % os.path.splitext(os.path.basename(path))[0]
+    else:
+        etag = '"%x-%x"' % (stat.st_mtime_ns, stat.st_size)
+    return etag, int(stat.st_mtime)
+
+
+def parse_range(header, size):
+    """
+    Returns (start, end) inclusive for a single satisfiable range, 'unsatisfiable', or None to serve the whole file
+    (no header, malformed or multiple ranges: the spec lets servers ignore those).
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # bytes=-500 is the last 500 bytes
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        return 'unsatisfiable'
+    if start > end:
+        return None
+    return start, end
+
+
+def if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+class FileRange:
+    """Read-only view of bytes [start, end] of an open file, with fileno() kept for sendfile()."""
+    def __init__(self, file, start, end):
+        self.file = file
+        self.remaining = end - start + 1
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def offload_response(path, full_path):
+    response = HttpResponse()
+    if settings.MEDIA_OFFLOAD == 'x-accel-redirect':
+        # nginx serves this from an `internal` location aliased to MEDIA_ROOT
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + quote(path)
+    else:
+        response['X-Sendfile'] = full_path
+    # Let the proxy set the content type from the file it sends
+    del response['Content-Type']
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (OSError, ValueError, SuspiciousFileOperation):
+        raise Http404('File not found')
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    etag, last_modified = get_validators(path, stat)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = build_response(request, path, full_path, stat.st_size, etag, last_modified)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if is_fingerprinted(path):
+        response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def build_response(request, path, full_path, size, etag, last_modified):
+    if settings.MEDIA_OFFLOAD:
+        # The proxy handles Range and the body; the conditional headers were already answered here
+        return offload_response(path, full_path)
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    byte_range = None
+    if if_range_matches(request, etag, last_modified):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = size
+    elif byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        response = FileResponse(FileRange(open(full_path, 'rb'), start, end), content_type=content_type, status=206)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
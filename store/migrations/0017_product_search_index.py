@@ -0,0 +1,40 @@
+# Generated by Django 4.2.2 on 2026-10-18 10:05
+
+from django.db import migrations
+
+
+# The full-text index lives outside the ORM (see store/search.py), so it is created per database vendor.
+# Populate it afterwards with: python manage.py rebuild_search_index
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE store_product_fts USING fts5("
+            "title, description, collection, tags, tokenize='porter unicode61')")
+    elif vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE TABLE store_product_search ('
+            'product_id bigint PRIMARY KEY REFERENCES store_product (id) ON DELETE CASCADE, '
+            'document tsvector NOT NULL)')
+        schema_editor.execute(
+            'CREATE INDEX store_product_search_document_idx ON store_product_search USING gin (document)')
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS store_product_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS store_product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0016_product_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
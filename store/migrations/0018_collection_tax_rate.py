@@ -0,0 +1,19 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:40
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0017_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='tax_rate',
+            field=models.DecimalField(decimal_places=4, default=Decimal('0.1'), max_digits=5),
+        ),
+    ]
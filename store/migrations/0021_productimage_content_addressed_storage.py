@@ -0,0 +1,20 @@
+# Generated by Django 4.2.2 on 2026-10-18 16:10
+
+import store.storage
+import store.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0020_productimage_renditions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='productimage',
+            name='image',
+            field=models.ImageField(storage=store.storage.ContentAddressedStorage(), upload_to='store/images', validators=[store.validators.validate_file_size]),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.2 on 2026-10-18 17:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0022_product_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('D', 'Day'), ('W', 'Week'), ('M', 'Month'), ('A', 'All time')], max_length=1)),
+                ('period_start', models.DateField()),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('collection', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.collection')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['period', 'period_start', '-revenue'], name='store_produ_period_378924_idx'), models.Index(fields=['period', 'period_start', '-units'], name='store_produ_period_d6f2f4_idx'), models.Index(fields=['period', 'period_start', 'collection', '-revenue'], name='store_produ_period_839ddf_idx'), models.Index(fields=['period', 'period_start', 'collection', '-units'], name='store_produ_period_34b626_idx')],
+                'unique_together': {('period', 'period_start', 'product')},
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.2 on 2026-10-18 15:40
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+# Existing carts have no recorded activity: start from their creation time, so abandoned ones are reaped
+def populate_last_activity(apps, schema_editor):
+    Cart = apps.get_model('store', 'Cart')
+    Cart.objects.update(last_activity=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0023_product_sales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='last_activity',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(populate_last_activity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.2 on 2026-10-18 16:25
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0024_cart_last_activity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderTicket',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False)),
+                ('cart_id', models.UUIDField()),
+                ('status', models.CharField(choices=[('P', 'Pending'), ('R', 'Processing'), ('C', 'Placed'), ('F', 'Failed')], default='P', max_length=1)),
+                ('error', models.CharField(blank=True, max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.customer')),
+                ('order', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='store.order')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='store_order_status_772fba_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Max, Sum
+
+
+# Aggregate the orders placed so far (what customer_stats.rebuild does, with the historical models)
+def populate_customer_stats(apps, schema_editor):
+    CustomerStats = apps.get_model('store', 'CustomerStats')
+    CustomerProductStats = apps.get_model('store', 'CustomerProductStats')
+    Order = apps.get_model('store', 'Order')
+    OrderItem = apps.get_model('store', 'OrderItem')
+    revenue = ExpressionWrapper(F('unit_price') * F('quantity'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+    spend = dict(
+        OrderItem.objects.filter(order__payment_status='C')
+        .values('order__customer_id').annotate(spend=Sum(revenue)).order_by()
+        .values_list('order__customer_id', 'spend'))
+    CustomerStats.objects.bulk_create([
+        CustomerStats(customer_id=row['customer_id'], orders_count=row['orders_count'],
+                      lifetime_spend=spend.get(row['customer_id'], 0), last_order_at=row['last_order_at'])
+        for row in Order.objects.values('customer_id')
+        .annotate(orders_count=Count('id'), last_order_at=Max('placed_at')).order_by()
+    ], batch_size=1000)
+    CustomerProductStats.objects.bulk_create([
+        CustomerProductStats(customer_id=row['order__customer_id'], product_id=row['product_id'],
+                             units=row['units'], revenue=row['revenue'])
+        for row in OrderItem.objects.values('order__customer_id', 'product_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(revenue)).order_by()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0025_order_ticket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerStats',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='store.customer')),
+                ('orders_count', models.PositiveIntegerField(default=0)),
+                ('lifetime_spend', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('last_order_at', models.DateTimeField(null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomerProductStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('units', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('customer', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.customer')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='store.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['customer', '-units'], name='store_custo_custome_c072bf_idx')],
+                'unique_together': {('customer', 'product')},
+            },
+        ),
+        migrations.RunPython(populate_customer_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.2.2 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0026_customer_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('payment_status', models.CharField(choices=[('P', 'Pending'), ('C', 'Completed'), ('F', 'Failed')], max_length=1)),
+                ('dimension', models.CharField(choices=[('T', 'Total'), ('C', 'Collection'), ('M', 'Membership')], max_length=1)),
+                ('key', models.CharField(blank=True, max_length=20)),
+                ('orders', models.IntegerField(default=0)),
+                ('units', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dimension', 'day'], name='store_daily_dimensi_14d269_idx')],
+                'unique_together': {('dimension', 'key', 'day', 'payment_status')},
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.2 on 2026-10-18 16:40
+
+from django.db import migrations
+
+
+# MySQL version of the full-text index of migration 0017 (see store/search.py): an InnoDB table with FULLTEXT
+# indexes on the title, on the collection and tags, and on the whole document, queried with MATCH ... AGAINST.
+# Populate it afterwards with: python manage.py rebuild_search_index
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'mysql':
+        return
+    schema_editor.execute(
+        'CREATE TABLE store_product_search ('
+        'product_id bigint NOT NULL PRIMARY KEY, '
+        'title varchar(255) NOT NULL, '
+        'description longtext NOT NULL, '
+        'collection varchar(255) NOT NULL, '
+        'tags longtext NOT NULL, '
+        'FULLTEXT INDEX store_product_search_title_idx (title), '
+        'FULLTEXT INDEX store_product_search_labels_idx (collection, tags), '
+        'FULLTEXT INDEX store_product_search_document_idx (title, description, collection, tags), '
+        'CONSTRAINT store_product_search_product_id_fk '
+        'FOREIGN KEY (product_id) REFERENCES store_product (id) ON DELETE CASCADE'
+        ') ENGINE=InnoDB')
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute('DROP TABLE IF EXISTS store_product_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0027_daily_sales'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,9 +1,12 @@
 from django.contrib import admin
 from django.core.validators import MinValueValidator
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+from decimal import Decimal
 from uuid import uuid4
 from .import validators
+from .storage import ContentAddressedStorage
 
 
 
@@ -17,10 +20,25 @@ class Promotion(models.Model):
 class Collection(models.Model):
     title = models.CharField(max_length=255)
     featured_product = models.ForeignKey('Product', on_delete=models.SET_NULL, related_name='+', null=True)
+    # Sales tax applied to the products of this collection (0.1 = 10%)
+    tax_rate = models.DecimalField(max_digits=5, decimal_places=4, default=Decimal('0.1'))
+    # Denormalized number of products, kept current by signals (rebuild with the rebuild_collection_counts command)
+    product_count = models.PositiveIntegerField(default=0, editable=False)
 
     # String representation of the object (by default, but here customizing it)
     def __str__(self) -> str:
         return self.title
+
+    def save(self, *args, **kwargs):
+        # product_count only changes through F() updates (signals) and recount_collections: writing back the value
+        # loaded with the instance would undo the products added or removed since
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'product_count' and field.attname not in deferred
+            ]
+        super().save(*args, **kwargs)
     
     # Ordering
     class Meta:
@@ -45,10 +63,21 @@ class Product(models.Model):
     
     class Meta:
         ordering = ['title']
+        # Composite indexes for keyset pagination on the ordering fields (id is the tiebreaker)
+        indexes = [
+            models.Index(fields=['unit_price', 'id']),
+            models.Index(fields=['last_update', 'id'])
+        ]
 
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
-    image = models.ImageField(upload_to='store/images', validators=[validators.validate_file_size])
+    # Stored by content hash: identical uploads share one file and URLs can be cached forever
+    image = models.ImageField(
+        upload_to='store/images',
+        storage=ContentAddressedStorage(),
+        validators=[validators.validate_file_size])
+    # Generated resized copies, see store/renditions.py
+    renditions = models.JSONField(default=dict, blank=True, editable=False)
 
 
 class Review(models.Model):
@@ -105,16 +134,51 @@ class Order(models.Model):
     payment_status = models.CharField(max_length=1, choices=PAYMENT_STATUS_CHOICES, default=STATUS_PENDING)
     customer = models.ForeignKey(Customer, on_delete=models.PROTECT)
 
+    def save(self, *args, **kwargs):
+        # The payment status signals lock the row to read the stored status, and move the order's totals in the
+        # rollups before the lock is released (see store/signals/handlers.py)
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+
     class Meta:
         permissions = [
             ('cancel_order', 'Can cancel order')
         ]
 
 
+# Asynchronous checkout (settings.ORDER_PLACEMENT = 'async'): the request files a ticket, a worker places the order
+class OrderTicket(models.Model):
+    STATUS_PENDING = 'P'
+    STATUS_PROCESSING = 'R'
+    STATUS_PLACED = 'C'
+    STATUS_FAILED = 'F'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_PLACED, 'Placed'),
+        (STATUS_FAILED, 'Failed')
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid4)
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='+')
+    # Not a foreign key: placing the order deletes the cart
+    cart_id = models.UUIDField()
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    order = models.OneToOneField(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    error = models.CharField(max_length=255, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'created_at'])]
+
+
 class Cart(models.Model):
     # GUID: Globally Unique Identifier (long 32 character string)
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Last change to the cart or its items (see carts.touch); idle carts are deleted by carts.reap
+    last_activity = models.DateTimeField(default=timezone.now, db_index=True)
 
 class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
@@ -139,3 +203,112 @@ class OrderItem(models.Model):
 
 
 
+
+
+# Progress of incremental background jobs: the last row id each job has processed
+class JobCheckpoint(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+# "Frequently bought together", built by store/recommendations.py
+# Sparse co-occurrence matrix: the number of orders containing both products (stored in both directions)
+class ProductPair(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    orders = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [['product', 'related']]
+
+# The top neighbours of each product, read by the product recommendations endpoint
+class ProductRecommendation(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    position = models.PositiveSmallIntegerField()
+    orders = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = [['product', 'position']]
+        ordering = ['product', 'position']
+
+
+# Sales per product and calendar period, kept current by store/leaderboards.py so that best-seller
+# leaderboards are an index range scan instead of an aggregate over every order item
+class ProductSales(models.Model):
+    PERIOD_DAY = 'D'
+    PERIOD_WEEK = 'W'
+    PERIOD_MONTH = 'M'
+    PERIOD_ALL = 'A'
+    PERIOD_CHOICES = [
+        (PERIOD_DAY, 'Day'),
+        (PERIOD_WEEK, 'Week'),
+        (PERIOD_MONTH, 'Month'),
+        (PERIOD_ALL, 'All time')
+    ]
+
+    period = models.CharField(max_length=1, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    # The product's current collection, for per-collection leaderboards
+    collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['period', 'period_start', 'product']]
+        indexes = [
+            models.Index(fields=['period', 'period_start', '-revenue']),
+            models.Index(fields=['period', 'period_start', '-units']),
+            models.Index(fields=['period', 'period_start', 'collection', '-revenue']),
+            models.Index(fields=['period', 'period_start', 'collection', '-units'])
+        ]
+
+
+# Per-customer aggregates kept current by store/customer_stats.py, read by the customer history endpoint and the
+# admin instead of aggregating every Order / OrderItem of the customer
+class CustomerStats(models.Model):
+    customer = models.OneToOneField(Customer, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    orders_count = models.PositiveIntegerField(default=0)
+    # Orders whose payment completed
+    lifetime_spend = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    last_order_at = models.DateTimeField(null=True)
+
+# What each customer has bought, for their top products
+class CustomerProductStats(models.Model):
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='+')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['customer', 'product']]
+        indexes = [models.Index(fields=['customer', '-units'])]
+
+
+# Sales per local day and payment status, in total and broken down by collection and by membership tier, kept
+# current by store/analytics.py so that finance reports read a few rows per day instead of every order item
+class DailySales(models.Model):
+    DIMENSION_TOTAL = 'T'
+    DIMENSION_COLLECTION = 'C'
+    DIMENSION_MEMBERSHIP = 'M'
+    DIMENSION_CHOICES = [
+        (DIMENSION_TOTAL, 'Total'),
+        (DIMENSION_COLLECTION, 'Collection'),
+        (DIMENSION_MEMBERSHIP, 'Membership')
+    ]
+
+    day = models.DateField()
+    payment_status = models.CharField(max_length=1, choices=Order.PAYMENT_STATUS_CHOICES)
+    dimension = models.CharField(max_length=1, choices=DIMENSION_CHOICES)
+    # The collection id or the membership tier; empty for the totals
+    key = models.CharField(max_length=20, blank=True)
+    # Not positive fields: payment status changes subtract orders from their previous status
+    orders = models.IntegerField(default=0)
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = [['dimension', 'key', 'day', 'payment_status']]
+        indexes = [models.Index(fields=['dimension', 'day'])]
@@ -0,0 +1,181 @@
+import logging
+import time
+from datetime import timedelta
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from .models import CartItem, Order, OrderItem, OrderTicket, Product
+from .signals import send_order_created
+from . import caching, carts
+
+
+logger = logging.getLogger(__name__)
+
+
+# Order placement, shared by synchronous checkout (CreateOrderSerializer.save) and the asynchronous one:
+# with settings.ORDER_PLACEMENT = 'async' the request only validates the cart and files an OrderTicket, and
+# workers place the pending tickets in batches (place_tickets). Clients poll the ticket, optionally long polling on
+# a cache key the worker sets when the ticket is done, so waiting clients never query the database.
+KEY_PREFIX = 'store:order-ticket'
+SCHEDULED_KEY = f'{KEY_PREFIX}:scheduled'
+# A ticket claimed by a worker that died is handed out again after this long
+PROCESSING_TIMEOUT = timedelta(minutes=5)
+MAX_WAIT = 20
+POLL_INTERVAL = 0.25
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class TicketReclaimed(Exception):
+    pass
+
+
+def create_order(customer_id, cart_id):
+    """
+    Turns the cart into an order in the caller's transaction, with the same queries for any number of items:
+    the products are locked in id order (concurrent checkouts always wait for each other in the same order, so they
+    can't deadlock), then inventory is taken with one conditional UPDATE ... WHERE inventory >= quantity.
+    Raises CheckoutError if the cart is gone or empty, or a product is short.
+    """
+    quantities = dict(CartItem.objects.filter(cart_id=cart_id).values_list('product_id', 'quantity'))
+    if not quantities:
+        raise CheckoutError('The cart is empty.')
+
+    # Prices are read from the locked rows, so the order gets the prices the inventory was taken at
+    products = Product.objects \
+        .select_for_update() \
+        .filter(pk__in=quantities) \
+        .order_by('pk') \
+        .values_list('pk', 'unit_price', 'inventory', 'collection_id')
+    prices, collection_ids, short = {}, [], []
+    for product_id, unit_price, inventory, collection_id in products:
+        prices[product_id] = unit_price
+        collection_ids.append(collection_id)
+        if inventory < quantities[product_id]:
+            short.append(product_id)
+    if short:
+        raise CheckoutError(f'Not enough inventory for products {short}.')
+
+    # The WHERE clause is what guarantees inventory never goes negative (SQLite has no FOR UPDATE)
+    quantity = Case(*[When(pk=product_id, then=Value(quantities[product_id])) for product_id in prices])
+    taken = Product.objects \
+        .filter(pk__in=prices, inventory__gte=quantity) \
+        .update(inventory=F('inventory') - quantity, last_update=timezone.now())
+    if taken != len(quantities):
+        raise CheckoutError('Not enough inventory.')
+    # update() skips auto_now and the model signals: invalidate the cached product responses once the stock is taken
+    transaction.on_commit(lambda: caching.bump_products(list(prices), collection_ids))
+
+    order = Order.objects.create(customer_id=customer_id)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, product_id=product_id, unit_price=prices[product_id], quantity=quantity)
+        for product_id, quantity in sorted(quantities.items())
+    ])
+    # Deleting the cart also stops a concurrent checkout of the same cart: it finds nothing and rolls back
+    if not carts.get_store().delete(cart_id):
+        raise CheckoutError('No cart with a given id was found')
+    return order
+
+
+def place_order(customer_id, cart_id):
+    with transaction.atomic():
+        order = create_order(customer_id, cart_id)
+    send_order_created(Order, order)
+    return order
+
+
+def get_ticket_key(ticket_id):
+    return f'{KEY_PREFIX}:{ticket_id}'
+
+
+def file_ticket(customer_id, cart_id):
+    ticket = OrderTicket.objects.create(customer_id=customer_id, cart_id=cart_id)
+    # Imported here: tasks imports this module
+    from .tasks import queue_place_tickets
+    queue_place_tickets()
+    return ticket
+
+
+def claim_tickets(batch_size, skipped=()):
+    now = timezone.now()
+    with transaction.atomic():
+        OrderTicket.objects \
+            .filter(status=OrderTicket.STATUS_PROCESSING, updated_at__lt=now - PROCESSING_TIMEOUT) \
+            .update(status=OrderTicket.STATUS_PENDING)
+        pending = OrderTicket.objects \
+            .filter(status=OrderTicket.STATUS_PENDING) \
+            .exclude(pk__in=skipped) \
+            .order_by('created_at')
+        if connection.features.has_select_for_update_skip_locked:
+            # Concurrent workers take different tickets instead of waiting for each other
+            pending = pending.select_for_update(skip_locked=True)
+        tickets = list(pending[:batch_size])
+        OrderTicket.objects \
+            .filter(pk__in=[ticket.pk for ticket in tickets]) \
+            .update(status=OrderTicket.STATUS_PROCESSING, updated_at=now)
+    for ticket in tickets:
+        # updated_at identifies the claim (see place_ticket)
+        ticket.status, ticket.updated_at = OrderTicket.STATUS_PROCESSING, now
+    return tickets
+
+
+def place_ticket(ticket):
+    """
+    Places a ticket claimed by claim_tickets. Returns False if it failed with an unexpected error: the ticket is
+    pending again, for a later run.
+    """
+    # The ticket is only written while this claim holds: once PROCESSING_TIMEOUT hands it to another worker, that
+    # worker's outcome stands
+    claimed = OrderTicket.objects.filter(
+        pk=ticket.pk, status=OrderTicket.STATUS_PROCESSING, updated_at=ticket.updated_at)
+    # The order and the ticket are saved in one transaction, so a ticket is never placed twice
+    try:
+        with transaction.atomic():
+            order = create_order(ticket.customer_id, ticket.cart_id)
+            if not claimed.update(order=order, status=OrderTicket.STATUS_PLACED, updated_at=timezone.now()):
+                # Rolls the order back
+                raise TicketReclaimed()
+        ticket.order, ticket.status = order, OrderTicket.STATUS_PLACED
+    except TicketReclaimed:
+        return True
+    except CheckoutError as error:
+        error = str(error)[:255]
+        if not claimed.update(status=OrderTicket.STATUS_FAILED, error=error, updated_at=timezone.now()):
+            return True
+        ticket.status, ticket.error = OrderTicket.STATUS_FAILED, error
+    except Exception:
+        logger.exception('Placing order ticket %s failed', ticket.pk)
+        claimed.update(status=OrderTicket.STATUS_PENDING, updated_at=timezone.now())
+        return False
+    cache.set(get_ticket_key(ticket.pk), ticket.status, MAX_WAIT * 3)
+    if ticket.order is not None:
+        send_order_created(Order, ticket.order)
+    return True
+
+
+def place_tickets(batch_size):
+    """Places pending tickets, batch_size at a time, until there are none left. Returns the number processed."""
+    # Tickets filed from now on schedule another run
+    cache.delete(SCHEDULED_KEY)
+    processed, skipped = 0, []
+    while True:
+        tickets = claim_tickets(batch_size, skipped)
+        for ticket in tickets:
+            if not place_ticket(ticket):
+                # Back to pending: retried by the next run rather than again in this one
+                skipped.append(ticket.pk)
+        processed += len(tickets)
+        if len(tickets) < batch_size:
+            return processed
+
+
+def wait_for_ticket(ticket_id, timeout):
+    """Long polling: returns once the ticket is placed or failed, or after timeout seconds."""
+    deadline = time.monotonic() + min(timeout, MAX_WAIT)
+    while time.monotonic() < deadline:
+        if cache.get(get_ticket_key(ticket_id)) is not None:
+            return
+        time.sleep(POLL_INTERVAL)
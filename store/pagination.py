@@ -1,4 +1,164 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import json
+from datetime import datetime
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 class DefaultPagination(PageNumberPagination):
-    page_size = 10
\ No newline at end of file
+    page_size = 10
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination: every page is fetched with WHERE (key, id) > (last_key, last_id) ... LIMIT n,
+    so page 1000 costs the same as page 1. There is no COUNT(*) and the cursors are opaque.
+    The key is the first term of ?ordering= if it is one of the view's ordering_fields, with id as the tiebreaker.
+    """
+    page_size = 10
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    invalid_cursor_message = 'Invalid cursor'
+    tiebreaker = 'id'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.field, self.descending = self.get_ordering(request, view)
+        cursor = self.decode_cursor(request, queryset)
+
+        # A "previous" cursor walks backwards, so the ordering and the comparison flip
+        self.reverse = bool(cursor and cursor['r'])
+        descending = self.descending != self.reverse
+        queryset = queryset.order_by(*self.get_order_by(descending))
+        if cursor is not None:
+            queryset = queryset.filter(self.get_seek_filter(cursor, descending))
+
+        # Fetch one extra row to know whether there is another page
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = cursor is not None if not self.reverse else has_more
+        self.page = results
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data
+        })
+
+    def get_ordering(self, request, view):
+        ordering = request.query_params.get(self.ordering_query_param, '')
+        term = ordering.split(',')[0].strip()
+        field = term.lstrip('-')
+        if field and field in getattr(view, 'ordering_fields', []):
+            return field, term.startswith('-')
+        return self.tiebreaker, False
+
+    def get_order_by(self, descending):
+        prefix = '-' if descending else ''
+        if self.field == self.tiebreaker:
+            return [prefix + self.tiebreaker]
+        return [prefix + self.field, prefix + self.tiebreaker]
+
+    def get_seek_filter(self, cursor, descending):
+        lookup = 'lt' if descending else 'gt'
+        after_id = Q(**{f'{self.tiebreaker}__{lookup}': cursor['id']})
+        if self.field == self.tiebreaker:
+            return after_id
+        return Q(**{f'{self.field}__{lookup}': cursor['v']}) | (Q(**{self.field: cursor['v']}) & after_id)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, instance, reverse):
+        # Pages are model instances, or dicts on the values() read path
+        if isinstance(instance, dict):
+            value, id = instance[self.field], instance[self.tiebreaker]
+        else:
+            value, id = getattr(instance, self.field), getattr(instance, self.tiebreaker)
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        position = {'v': str(value), 'id': id, 'r': reverse}
+        encoded = base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_model_field(self, queryset):
+        # The ordering field can be an annotation (e.g. price_with_tax)
+        annotation = queryset.query.annotations.get(self.field)
+        if annotation is not None:
+            return annotation.output_field
+        return queryset.model._meta.get_field(self.field)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii'))
+            # Cursors come from the client: the value is parsed here, so a tampered one is a 404, not a query error
+            value = self.get_model_field(queryset).to_python(position['v'])
+            if value is None:
+                raise ValueError('No cursor value')
+            return {'v': value, 'id': int(position['id']), 'r': bool(position['r'])}
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class NewestFirstPagination(KeysetPagination):
+    """Keyset pagination by descending id, whatever ?ordering= says."""
+    def get_ordering(self, request, view):
+        return self.tiebreaker, True
+
+
+class SelectablePagination(BasePagination):
+    """
+    Lets each request pick its pagination mode, so existing clients keep the page-number responses:
+    ?pagination=cursor (or following a cursor link) switches to keyset pagination.
+    """
+    page_number_class = DefaultPagination
+    keyset_class = KeysetPagination
+    mode_query_param = 'pagination'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.delegate = self.get_delegate(request)
+        if self.delegate is None:
+            return None
+        page = self.delegate.paginate_queryset(queryset, request, view)
+        self.display_page_controls = getattr(self.delegate, 'display_page_controls', False)
+        return page
+
+    def get_delegate(self, request):
+        params = request.query_params
+        if params.get(self.mode_query_param) == 'cursor' or self.keyset_class.cursor_query_param in params:
+            return self.keyset_class()
+        if self.page_number_class is None:
+            return None
+        return self.page_number_class()
+
+    def get_paginated_response(self, data):
+        return self.delegate.get_paginated_response(data)
+
+    def to_html(self):
+        return self.delegate.to_html()
+
+
+class OptionalKeysetPagination(SelectablePagination):
+    # Unpaginated unless the client asks for cursor pagination (keeps the old /orders/ response shape)
+    page_number_class = None
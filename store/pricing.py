@@ -0,0 +1,50 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.db.models import DecimalField, F, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Least, Round
+from .models import Promotion
+
+
+# Prices are computed by the database as annotations, so listings can be filtered and ordered by them:
+#   price_with_tax  = unit_price * (1 + collection.tax_rate)
+#   effective_price = unit_price * (1 - best promotion discount) * (1 + collection.tax_rate)
+# Promotion.discount is a fraction (0.15 = 15% off); only the best promotion of a product applies.
+PRICE_FIELD = DecimalField(max_digits=9, decimal_places=2)
+RATE_FIELD = DecimalField(max_digits=5, decimal_places=4)
+CENT = Decimal('0.01')
+ANNOTATIONS = ['price_with_tax', 'effective_price']
+
+
+def best_discount():
+    discounts = Promotion.objects \
+        .filter(product=OuterRef('pk')) \
+        .order_by('-discount') \
+        .values('discount')[:1]
+    discount = Least(Greatest(Coalesce(Subquery(discounts), Value(0.0)), Value(0.0)), Value(1.0))
+    return Cast(discount, RATE_FIELD)
+
+
+def round_price(expression):
+    return Cast(Round(expression, 2), PRICE_FIELD)
+
+
+def annotate_prices(queryset):
+    tax_multiplier = Value(Decimal(1), output_field=RATE_FIELD) + F('collection__tax_rate')
+    return queryset \
+        .annotate(best_discount=best_discount()) \
+        .annotate(
+            price_with_tax=round_price(F('unit_price') * tax_multiplier),
+            effective_price=round_price(
+                F('unit_price') * (Value(Decimal(1), output_field=RATE_FIELD) - F('best_discount')) * tax_multiplier))
+
+
+# Python equivalents for instances that weren't loaded through annotate_prices() (e.g. right after a save)
+def quantize(price):
+    return price.quantize(CENT, rounding=ROUND_HALF_UP)
+
+def calculate_price_with_tax(product):
+    return quantize(product.unit_price * (1 + product.collection.tax_rate))
+
+def calculate_effective_price(product):
+    discount = max([promotion.discount for promotion in product.promotions.all()], default=0.0)
+    discount = Decimal(str(min(max(discount, 0.0), 1.0)))
+    return quantize(product.unit_price * (1 - discount) * (1 + product.collection.tax_rate))
@@ -0,0 +1,99 @@
+from datetime import timedelta
+from itertools import groupby
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import JobCheckpoint, Order, OrderItem, ProductPair, ProductRecommendation
+from . import increments
+
+
+# "Frequently bought together" recommendations, precomputed so that reading them is one indexed lookup.
+# ProductPair is a sparse co-occurrence matrix (orders containing both products). It is updated incrementally:
+# each run counts the pairs of the orders placed since the last run with one self-join GROUP BY in the database
+# and adds them to the stored counts. The top neighbours of every product that gained pairs are then rewritten
+# into ProductRecommendation.
+# (Counting happens in SQL rather than with NumPy / SciPy sparse matrices: neither is a dependency, and the
+# database already does the grouping set-wise without shipping order items to Python.)
+TOP_K = 10
+ORDER_BATCH_SIZE = 5000
+CHECKPOINT = 'recommendations'
+# Order ids are allocated before commit, so recent ids may still be invisible: only settled orders are counted
+SETTLE_DELAY = timedelta(minutes=5)
+
+
+def count_pairs(after_order_id, last_order_id):
+    """Returns {(product_id, related_id): orders} for the orders with after_order_id < id <= last_order_id."""
+    table = OrderItem._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT a.product_id, b.product_id, COUNT(DISTINCT a.order_id) '
+            f'FROM {table} a JOIN {table} b ON b.order_id = a.order_id AND b.product_id <> a.product_id '
+            f'WHERE a.order_id > %s AND a.order_id <= %s '
+            f'GROUP BY a.product_id, b.product_id',
+            [after_order_id, last_order_id])
+        return {(product_id, related_id): orders for product_id, related_id, orders in cursor.fetchall()}
+
+
+def add_pairs(counts):
+    product_ids = {product_id for product_id, _ in counts}
+    related_ids = {related_id for _, related_id in counts}
+    existing = ProductPair.objects \
+        .filter(product_id__in=product_ids, related_id__in=related_ids) \
+        .values_list('product_id', 'related_id', 'orders')
+    totals = dict(counts)
+    for product_id, related_id, orders in existing:
+        if (product_id, related_id) in totals:
+            totals[product_id, related_id] += orders
+    increments.bulk_upsert(
+        ProductPair,
+        [ProductPair(product_id=product_id, related_id=related_id, orders=orders)
+         for (product_id, related_id), orders in totals.items()],
+        ['product', 'related'], ['orders'], batch_size=1000)
+
+
+def rebuild_top(product_ids, chunk_size=500):
+    product_ids = sorted(product_ids)
+    for start in range(0, len(product_ids), chunk_size):
+        chunk = product_ids[start:start + chunk_size]
+        pairs = ProductPair.objects \
+            .filter(product_id__in=chunk) \
+            .order_by('product_id', '-orders', 'related_id') \
+            .values_list('product_id', 'related_id', 'orders')
+        recommendations = []
+        for product_id, neighbours in groupby(pairs, key=lambda pair: pair[0]):
+            for position, (_, related_id, orders) in enumerate(list(neighbours)[:TOP_K]):
+                recommendations.append(ProductRecommendation(
+                    product_id=product_id, recommended_id=related_id, position=position, orders=orders))
+        ProductRecommendation.objects.filter(product_id__in=chunk).delete()
+        ProductRecommendation.objects.bulk_create(recommendations)
+
+
+def update_recommendations(batch_size=ORDER_BATCH_SIZE):
+    """Processes the orders placed since the last run. Returns the number of products whose neighbours changed."""
+    last_settled_id = Order.objects \
+        .filter(placed_at__lte=timezone.now() - SETTLE_DELAY) \
+        .aggregate(last_id=Max('id'))['last_id'] or 0
+    JobCheckpoint.objects.get_or_create(name=CHECKPOINT)
+    updated = set()
+    while True:
+        with transaction.atomic():
+            # The row lock keeps concurrent runs from counting the same orders twice
+            checkpoint = JobCheckpoint.objects.select_for_update().get(name=CHECKPOINT)
+            if checkpoint.last_id >= last_settled_id:
+                return len(updated)
+            last_id = min(checkpoint.last_id + batch_size, last_settled_id)
+            counts = count_pairs(checkpoint.last_id, last_id)
+            if counts:
+                add_pairs(counts)
+                touched = {product_id for product_id, _ in counts}
+                rebuild_top(touched)
+                updated |= touched
+            checkpoint.last_id = last_id
+            checkpoint.save()
+
+
+def reset_recommendations():
+    with transaction.atomic():
+        ProductRecommendation.objects.all().delete()
+        ProductPair.objects.all().delete()
+        JobCheckpoint.objects.filter(name=CHECKPOINT).update(last_id=0)
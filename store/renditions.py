@@ -0,0 +1,97 @@
+import io
+import os
+from django.core.files.base import ContentFile
+from django.urls import reverse
+from PIL import Image, ImageOps
+from .models import ProductImage
+
+
+# Resized copies of product images. Every size is written in the source format (JPEG, or PNG for PNG uploads)
+# and as WebP. ProductImage.renditions records what was generated for which upload:
+#   {'source': 'store/images/a.jpg', 'files': {'thumbnail': 'store/renditions/a_thumbnail.jpg', ...}}
+# so replacing the image invalidates the record without any bookkeeping. Renditions are generated by a Celery task
+# after upload; until then the API links to an endpoint that redirects to the original (queueing the task again,
+# at most once per QUEUED_TIMEOUT) or, for staff, generates them on the spot.
+SIZES = {'thumbnail': 150, 'small': 400, 'medium': 800}
+WEBP_SUFFIX = '_webp'
+NAMES = [name + suffix for name in SIZES for suffix in ('', WEBP_SUFFIX)]
+DIRECTORY = 'store/renditions'
+QUALITY = 80
+QUEUED_TIMEOUT = 60
+
+
+def get_storage():
+    return ProductImage._meta.get_field('image').storage
+
+
+def get_files(image_name, renditions):
+    """Returns {rendition name: storage path} if the renditions were generated from the current image, else None."""
+    if image_name and renditions and renditions.get('source') == image_name:
+        return renditions['files']
+    return None
+
+
+def get_queued_key(image_id):
+    return f'store:renditions:{image_id}:queued'
+
+
+def is_current(image):
+    return get_files(image.image.name, image.renditions) is not None
+
+
+def get_urls(image_id, product_id, image_name, renditions, request=None):
+    if not image_name:
+        return {}
+    files = get_files(image_name, renditions)
+    storage = get_storage()
+    urls = {}
+    for name in NAMES:
+        if files is not None:
+            url = storage.url(files[name])
+        else:
+            url = reverse('product-image-rendition', kwargs={'product_pk': product_id, 'pk': image_id, 'name': name})
+        urls[name] = request.build_absolute_uri(url) if request is not None else url
+    return urls
+
+
+def encode(image, size, format):
+    copy = image.copy()
+    copy.thumbnail((size, size), Image.LANCZOS)
+    if format == 'JPEG' and copy.mode not in ('RGB', 'L'):
+        copy = copy.convert('RGB')
+    buffer = io.BytesIO()
+    copy.save(buffer, format=format, quality=QUALITY, optimize=True)
+    return buffer.getvalue()
+
+
+def generate(image):
+    """Writes all renditions of a ProductImage and records them. Returns the {name: path} mapping."""
+    storage = get_storage()
+    source_name = image.image.name
+    with storage.open(source_name, 'rb') as file:
+        source = Image.open(file)
+        source_format = source.format
+        # Apply the camera orientation before resizing, the copies carry no EXIF
+        source = ImageOps.exif_transpose(source)
+        source.load()
+    format, extension = ('PNG', 'png') if source_format == 'PNG' or source.mode in ('RGBA', 'P', 'LA') else ('JPEG', 'jpg')
+    stem = os.path.splitext(os.path.basename(source_name))[0]
+
+    files = {}
+    for name, size in SIZES.items():
+        for suffix, (rendition_format, rendition_extension) in (('', (format, extension)), (WEBP_SUFFIX, ('WEBP', 'webp'))):
+            # The image storage names files by content hash, so regenerating identical bytes writes nothing
+            path = f'{DIRECTORY}/{stem}_{name}.{rendition_extension}'
+            files[name + suffix] = storage.save(path, ContentFile(encode(source, size, rendition_format)))
+
+    renditions = {'source': source_name, 'files': files}
+    # update() rather than save(): only this column changes, and only if the image wasn't replaced meanwhile
+    ProductImage.objects.filter(pk=image.pk, image=source_name).update(renditions=renditions)
+    image.renditions = renditions
+    return files
+
+
+def ensure(image):
+    if not is_current(image):
+        generate(image)
+    return image.renditions['files']
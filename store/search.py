@@ -0,0 +1,168 @@
+import re
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from rest_framework.filters import SearchFilter
+from tags.models import TaggedItem
+from .models import Product
+
+
+# Full-text index for products: an FTS5 virtual table on SQLite and a tsvector table with a GIN index on Postgres
+# (both created by migration 0017), an InnoDB table with FULLTEXT indexes on MySQL (migration 0028). Other databases
+# fall back to the plain SearchFilter (LIKE '%term%').
+# On MySQL, terms shorter than innodb_ft_min_token_size (3 by default) or in the stopword list are not indexed, so a
+# search that requires them finds nothing, and InnoDB only updates the index when the transaction commits.
+SQLITE_TABLE = 'store_product_fts'
+POSTGRES_TABLE = 'store_product_search'
+POSTGRES_CONFIG = 'english'
+MYSQL_TABLE = 'store_product_search'
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported():
+    return connection.vendor in ('sqlite', 'postgresql', 'mysql')
+
+
+def get_terms(search):
+    return TOKEN_RE.findall(search.lower())
+
+
+def build_match_query(terms):
+    # Every term must match; the last one as a prefix so search-as-you-type works
+    if connection.vendor == 'sqlite':
+        parts = [f'"{term}"' for term in terms]
+        parts[-1] += '*'
+        return ' '.join(parts)
+    if connection.vendor == 'mysql':
+        # Boolean mode: + requires the term, * makes it a prefix
+        parts = [f'+{term}' for term in terms]
+        parts[-1] += '*'
+        return ' '.join(parts)
+    parts = list(terms)
+    parts[-1] += ':*'
+    return ' & '.join(parts)
+
+
+def get_documents(product_ids):
+    """Returns (id, title, description, collection title, tags) rows for the given products."""
+    products = Product.objects \
+        .filter(id__in=product_ids) \
+        .values_list('id', 'title', 'description', 'collection__title')
+    tags = {}
+    tagged_items = TaggedItem.objects \
+        .filter(content_type=ContentType.objects.get_for_model(Product), object_id__in=product_ids) \
+        .values_list('object_id', 'tag__label')
+    for object_id, label in tagged_items:
+        tags.setdefault(object_id, []).append(label)
+    return [
+        (id, title, description or '', collection_title or '', ' '.join(tags.get(id, [])))
+        for id, title, description, collection_title in products
+    ]
+
+
+def remove_products(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids or not is_supported():
+        return
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {SQLITE_TABLE} WHERE rowid IN ({placeholders})', product_ids)
+        elif connection.vendor == 'mysql':
+            cursor.execute(f'DELETE FROM {MYSQL_TABLE} WHERE product_id IN ({placeholders})', product_ids)
+        else:
+            cursor.execute(f'DELETE FROM {POSTGRES_TABLE} WHERE product_id IN ({placeholders})', product_ids)
+
+
+def index_products(product_ids):
+    """(Re)indexes the given products; ids that no longer exist are dropped from the index."""
+    product_ids = list(product_ids)
+    if not product_ids or not is_supported():
+        return
+    documents = get_documents(product_ids)
+    remove_products(product_ids)
+    if not documents:
+        return
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.executemany(
+                f'INSERT INTO {SQLITE_TABLE} (rowid, title, description, collection, tags) VALUES (%s, %s, %s, %s, %s)',
+                documents)
+        elif connection.vendor == 'mysql':
+            cursor.executemany(
+                f'INSERT INTO {MYSQL_TABLE} (product_id, title, description, collection, tags) '
+                f'VALUES (%s, %s, %s, %s, %s)',
+                documents)
+        else:
+            # Title weighs most, then tags and collection, then the description
+            cursor.executemany(
+                f'INSERT INTO {POSTGRES_TABLE} (product_id, document) VALUES (%s, '
+                f"setweight(to_tsvector('{POSTGRES_CONFIG}', %s), 'A') || "
+                f"setweight(to_tsvector('{POSTGRES_CONFIG}', %s), 'C') || "
+                f"setweight(to_tsvector('{POSTGRES_CONFIG}', %s), 'B') || "
+                f"setweight(to_tsvector('{POSTGRES_CONFIG}', %s), 'B'))",
+                documents)
+
+
+def rebuild_index(batch_size=1000):
+    ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'DELETE FROM {SQLITE_TABLE}')
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f'DELETE FROM {POSTGRES_TABLE}')
+        elif connection.vendor == 'mysql':
+            cursor.execute(f'DELETE FROM {MYSQL_TABLE}')
+    for start in range(0, len(ids), batch_size):
+        index_products(ids[start:start + batch_size])
+    return len(ids)
+
+
+def search_products(queryset, search):
+    """Filters the queryset to products matching the search and annotates it with a relevance score (higher is better)."""
+    terms = get_terms(search)
+    if not terms:
+        return queryset
+    match = build_match_query(terms)
+    product_table = Product._meta.db_table
+    # Joined rather than a correlated subquery, so the index is probed once per search, not once per row
+    if connection.vendor == 'sqlite':
+        # bm25() is negative (lower is better); weights: title, description, collection, tags
+        return queryset.extra(
+            select={'rank': f'-bm25({SQLITE_TABLE}, 10.0, 1.0, 3.0, 5.0)'},
+            tables=[SQLITE_TABLE],
+            where=[f'{SQLITE_TABLE} MATCH %s', f'{SQLITE_TABLE}.rowid = {product_table}.id'],
+            params=[match])
+    if connection.vendor == 'mysql':
+        # MATCH takes the columns of one FULLTEXT index: title matches weigh most, then collection and tags
+        def get_match(*columns):
+            columns = ', '.join(f'{MYSQL_TABLE}.{column}' for column in columns)
+            return f'MATCH ({columns}) AGAINST (%s IN BOOLEAN MODE)'
+        document = get_match('title', 'description', 'collection', 'tags')
+        return queryset.extra(
+            select={'rank': f"10 * {get_match('title')} + 3 * {get_match('collection', 'tags')} + {document}"},
+            select_params=[match, match, match],
+            tables=[MYSQL_TABLE],
+            where=[document, f'{MYSQL_TABLE}.product_id = {product_table}.id'],
+            params=[match])
+    query = f"to_tsquery('{POSTGRES_CONFIG}', %s)"
+    return queryset.extra(
+        select={'rank': f'ts_rank({POSTGRES_TABLE}.document, {query})'},
+        select_params=[match],
+        tables=[POSTGRES_TABLE],
+        where=[f'{POSTGRES_TABLE}.document @@ {query}', f'{POSTGRES_TABLE}.product_id = {product_table}.id'],
+        params=[match])
+
+
+class ProductSearchFilter(SearchFilter):
+    """
+    SearchFilter backed by the full-text index, ordered by relevance unless the client sends ?ordering=.
+    Falls back to the default icontains search on databases without an index.
+    """
+    def filter_queryset(self, request, queryset, view):
+        if not is_supported():
+            return super().filter_queryset(request, queryset, view)
+        search = request.query_params.get(self.search_param, '')
+        if not get_terms(search):
+            return queryset
+        return search_products(queryset, search).order_by('-rank', 'id')
@@ -1,8 +1,8 @@
 from decimal import Decimal
-from django.db import transaction
-from store .models import Product, Collection, Review, Cart, CartItem, Customer, Order, OrderItem, ProductImage
+from store .models import Product, Collection, Review, Cart, CartItem, Customer, CustomerProductStats, CustomerStats, Order, OrderItem, OrderTicket, ProductImage, ProductRecommendation, ProductSales
 from rest_framework import serializers
-from .signals import order_created
+from rest_framework.exceptions import NotFound
+from . import carts, orders, pricing, renditions
 
 ##  SERIALIZING ##
 # Serializer converts a model instance to a dictionary (Like a DTO)
@@ -27,10 +27,57 @@ from .signals import order_created
 #         return product.unit_price * Decimal(1.1)
 
 
+## SPARSE FIELDSETS ##
+# ?fields=id,title keeps only the listed fields and ?omit=description drops them (GET requests, top-level serializer only).
+# Views use get_requested_fields() / get_model_fields() to load only what will be rendered.
+
+class SparseFieldsetMixin:
+    fields_query_param = 'fields'
+    omit_query_param = 'omit'
+    # Model fields read by serializer fields that aren't model fields of the same name ([] = no column)
+    field_sources = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None:
+            return
+        requested = self.get_requested_fields(request)
+        for name in list(self.fields):
+            if name not in requested:
+                self.fields.pop(name)
+
+    @classmethod
+    def get_requested_fields(cls, request):
+        all_fields = list(cls.Meta.fields)
+        if request is None or request.method != 'GET':
+            return all_fields
+        fields = cls.parse_field_list(request, cls.fields_query_param) or all_fields
+        omit = cls.parse_field_list(request, cls.omit_query_param)
+        unknown = [name for name in fields + omit if name not in all_fields]
+        if unknown:
+            raise serializers.ValidationError({'fields': f'Unknown field(s): {", ".join(unknown)}'})
+        return [name for name in all_fields if name in fields and name not in omit]
+
+    @classmethod
+    def get_model_fields(cls, requested):
+        model_fields = ['id']
+        for name in requested:
+            for source in cls.field_sources.get(name, [name]):
+                if source not in model_fields:
+                    model_fields.append(source)
+        return model_fields
+
+    @staticmethod
+    def parse_field_list(request, param):
+        value = request.query_params.get(param, '')
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+
 ## MODEL SERIALIZING ##
 
 class CollectionSerializer(serializers.ModelSerializer):
-    product_count = serializers.IntegerField(read_only=True)
+    product_count = serializers.IntegerField(read_only=True) # Stored counter, see Collection.product_count
 
     class Meta:
         model = Collection
@@ -38,27 +85,44 @@ class CollectionSerializer(serializers.ModelSerializer):
 
 
 class ProductImageSerializer(serializers.ModelSerializer):
+    renditions = serializers.SerializerMethodField()
+
     class Meta:
         model = ProductImage
-        fields = ['id', 'image']
+        fields = ['id', 'image', 'renditions']
+
+    def get_renditions(self, image: ProductImage):
+        return renditions.get_urls(
+            image.id, image.product_id, image.image.name, image.renditions, self.context.get('request'))
 
     def create(self, validated_data):
         product_id = self.context['product_id']
         return ProductImage.objects.create(product_id=product_id, **validated_data) # The **validated_data syntax unpacks the validated_data dictionary, passing its key-value pairs as keyword arguments to the create() method.
 
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     images = ProductImageSerializer(many=True, read_only=True)
     price_with_tax = serializers.SerializerMethodField(
         method_name='calculate_tax')
+    effective_price = serializers.SerializerMethodField(
+        method_name='calculate_effective_price')
+    # Prices are database annotations (see pricing.annotate_prices), not columns
+    field_sources = {'price_with_tax': [], 'effective_price': [], 'images': []}
 
     class Meta:
         model = Product
         fields = ['id', 'title', 'slug', 'inventory', 'description',
-                  'unit_price', 'price_with_tax', 'collection', 'images']
+                  'unit_price', 'price_with_tax', 'effective_price', 'collection', 'images']
 
     def calculate_tax(self, product: Product):
-        return product.unit_price * Decimal(1.1)
+        if hasattr(product, 'price_with_tax'):
+            return pricing.quantize(product.price_with_tax)
+        return pricing.calculate_price_with_tax(product)
+
+    def calculate_effective_price(self, product: Product):
+        if hasattr(product, 'effective_price'):
+            return pricing.quantize(product.effective_price)
+        return pricing.calculate_effective_price(product)
 
 
 class SimpleProductSerializer(serializers.ModelSerializer):
@@ -67,6 +131,143 @@ class SimpleProductSerializer(serializers.ModelSerializer):
         fields = ['id', 'title', 'unit_price']
 
 
+class ProductRecommendationSerializer(serializers.ModelSerializer):
+    product = SimpleProductSerializer(source='recommended')
+
+    class Meta:
+        model = ProductRecommendation
+        fields = ['product', 'orders']
+
+
+class ProductSalesSerializer(serializers.ModelSerializer):
+    product = SimpleProductSerializer()
+
+    class Meta:
+        model = ProductSales
+        fields = ['product', 'collection', 'units', 'revenue']
+
+
+# One row of analytics.get_report(): only the field it is grouped by is present
+class SalesReportSerializer(serializers.Serializer):
+    day = serializers.DateField(required=False)
+    collection = serializers.IntegerField(required=False)
+    collection_title = serializers.CharField(required=False)
+    membership = serializers.CharField(required=False)
+    orders = serializers.IntegerField()
+    units = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+    average_order_value = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+# One row of POST /store/products/batch-update/ (see bulk.update_products); at least one of the values is required
+class ProductBatchUpdateSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    # 0 is allowed here: stock syncs mark products as sold out
+    inventory = serializers.IntegerField(min_value=0, required=False)
+    unit_price = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=1, required=False)
+
+    def validate(self, data):
+        if 'inventory' not in data and 'unit_price' not in data:
+            raise serializers.ValidationError('Provide inventory, unit_price or both.')
+        return data
+
+
+## READ-ONLY FAST PATH ##
+# Renders .values() rows with exactly the output of the ModelSerializer it mirrors, but without model instances
+# or per-field serializer objects: the field converters are resolved once, then each row is a dict comprehension.
+
+class ValuesSerializer:
+    # output field name -> values() key it reads (defaults to the same name)
+    sources = {}
+    model_serializer_class = None
+
+    def __init__(self, context=None, fields=None):
+        self.context = context or {}
+        if fields is None:
+            fields = self.get_field_names()
+        self.field_names = list(fields)
+        self.converters = [(name, self.get_converter(name)) for name in self.field_names]
+
+    def get_field_names(self):
+        serializer_class = self.model_serializer_class
+        if hasattr(serializer_class, 'get_requested_fields'):
+            return serializer_class.get_requested_fields(self.context.get('request'))
+        return list(serializer_class.Meta.fields)
+
+    def get_values_fields(self):
+        values_fields = ['id']
+        for name in self.field_names:
+            for source in self.sources.get(name, [name]):
+                if source not in values_fields:
+                    values_fields.append(source)
+        return values_fields
+
+    def get_converter(self, name):
+        convert = getattr(self, f'convert_{name}', None)
+        if convert is not None:
+            return convert
+        key = self.sources.get(name, [name])[0]
+        return lambda row: row[key]
+
+    def prepare(self, rows):
+        # Hook for loading related data for a whole page at once
+        pass
+
+    def serialize(self, rows):
+        rows = list(rows)
+        self.prepare(rows)
+        converters = self.converters
+        return [{name: convert(row) for name, convert in converters} for row in rows]
+
+
+class ProductValuesSerializer(ValuesSerializer):
+    model_serializer_class = ProductSerializer
+    sources = {'collection': ['collection_id'], 'images': []}
+    price_quantum = Decimal('0.01')
+
+    def prepare(self, rows):
+        self.images = {}
+        if 'images' not in self.field_names or not rows:
+            return
+        storage = ProductImage._meta.get_field('image').storage
+        request = self.context.get('request')
+        images = ProductImage.objects \
+            .filter(product_id__in=[row['id'] for row in rows]) \
+            .order_by('id') \
+            .values_list('product_id', 'id', 'image', 'renditions')
+        for product_id, id, name, generated in images:
+            url = None
+            if name:
+                url = storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+            self.images.setdefault(product_id, []).append({
+                'id': id,
+                'image': url,
+                'renditions': renditions.get_urls(id, product_id, name, generated, request)
+            })
+
+    def convert_unit_price(self, row):
+        return row['unit_price'].quantize(self.price_quantum)
+
+    def convert_price_with_tax(self, row):
+        return pricing.quantize(row['price_with_tax'])
+
+    def convert_effective_price(self, row):
+        return pricing.quantize(row['effective_price'])
+
+    def convert_images(self, row):
+        return self.images.get(row['id'], [])
+
+
+class SimpleProductValuesSerializer(ProductValuesSerializer):
+    model_serializer_class = SimpleProductSerializer
+
+
+class CollectionValuesSerializer(ValuesSerializer):
+    model_serializer_class = CollectionSerializer
+
+
 class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
@@ -86,8 +287,9 @@ class CartItemSerializer(serializers.ModelSerializer):
         model = CartItem
         fields = ['id', 'product', 'quantity', 'total_price']
 
+    # Annotated by the cart store
     def get_total_price(self, cart_item: CartItem):
-        return cart_item.quantity * cart_item.product.unit_price
+        return cart_item.total_price
 
 
 class CartSerializer(serializers.ModelSerializer):
@@ -101,10 +303,13 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'items', 'total_price']
 
     def get_total_price(self, cart: Cart):
-        cart_items = cart.items.all()
-        total_price = sum(item.product.unit_price *
-                          item.quantity for item in cart_items)
-        return total_price
+        return cart.total_price
+
+
+class CartSummarySerializer(serializers.Serializer):
+    id = serializers.UUIDField()
+    items_count = serializers.IntegerField()
+    total_price = serializers.DecimalField(max_digits=12, decimal_places=2, coerce_to_string=False)
 
 
 class AddCartItemSerializer(serializers.ModelSerializer):
@@ -123,18 +328,11 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         product_id = self.validated_data['product_id']
         quantity = self.validated_data['quantity']
 
-        try:
-            cart_item = CartItem.objects.get(
-                cart_id=cart_id, product_id=product_id)
-            cart_item.quantity += quantity
-            cart_item.save()
-            # Need to use the same pattern as with BaseModel save method in order this to work
-            self.instance = cart_item
-        except CartItem.DoesNotExist:
-            # self.validated_data unpacks the dictionary (we could also use simply product_id=product_id, quantity=quantity)
-            self.instance = CartItem.objects.create(
-                cart_id=cart_id, **self.validated_data)
-
+        # The cart store adds to the quantity of an existing item, or creates it
+        # Need to use the same pattern as with BaseModel save method in order this to work
+        self.instance = carts.get_store().add_item(cart_id, product_id, quantity)
+        if self.instance is None:
+            raise NotFound('No cart with the given ID was found.')
         return self.instance
 
     class Meta:
@@ -142,11 +340,48 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product_id', 'quantity']
 
 
+class CartItemChangeSerializer(serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=32767)
+
+
+class AddCartItemsSerializer(serializers.Serializer):
+    """Adds many items in one request: mode 'add' adds to existing quantities, 'set' replaces them."""
+    MAX_ITEMS = 100
+
+    items = CartItemChangeSerializer(many=True, allow_empty=False, max_length=MAX_ITEMS)
+    mode = serializers.ChoiceField(choices=['add', 'set'], default='add')
+
+    def validate_items(self, items):
+        # One query for all the products
+        product_ids = {item['product_id'] for item in items}
+        existing = set(Product.objects.filter(pk__in=product_ids).values_list('id', flat=True))
+        missing = sorted(product_ids - existing)
+        if missing:
+            raise serializers.ValidationError(f'No products with the given IDs were found: {missing}.')
+        return items
+
+    def save(self, **kwargs):
+        replace = self.validated_data['mode'] == 'set'
+        # Duplicates are merged first: added up, or the last one wins when setting
+        quantities = {}
+        for item in self.validated_data['items']:
+            product_id, quantity = item['product_id'], item['quantity']
+            quantities[product_id] = quantity if replace else quantities.get(product_id, 0) + quantity
+        items = carts.get_store().add_items(self.context['cart_id'], quantities, replace=replace)
+        if items is None:
+            raise NotFound('No cart with the given ID was found.')
+        return sorted(items, key=lambda item: item.product_id)
+
+
 class UpdateCartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['quantity']
 
+    def update(self, instance, validated_data):
+        return carts.get_store().update_item(instance.cart_id, instance, validated_data['quantity'])
+
 
 class CustomerSerializer(serializers.ModelSerializer):
     user_id = serializers.IntegerField(read_only=True)
@@ -156,6 +391,20 @@ class CustomerSerializer(serializers.ModelSerializer):
         fields = ['id', 'user_id', 'phone', 'birth_date', 'membership']
 
 
+class CustomerStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CustomerStats
+        fields = ['customer', 'orders_count', 'lifetime_spend', 'last_order_at']
+
+
+class CustomerProductStatsSerializer(serializers.ModelSerializer):
+    product = SimpleProductSerializer()
+
+    class Meta:
+        model = CustomerProductStats
+        fields = ['product', 'units', 'revenue']
+
+
 class OrderItemSerializer(serializers.ModelSerializer):
     product = SimpleProductSerializer()
 
@@ -164,8 +413,9 @@ class OrderItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'product', 'unit_price', 'quantity']
 
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True)
+    field_sources = {'items': []}
 
     class Meta:
         model = Order
@@ -173,41 +423,38 @@ class OrderSerializer(serializers.ModelSerializer):
 
 
 class CreateOrderSerializer(serializers.Serializer):
-    with transaction.atomic():
-        cart_id = serializers.UUIDField()
-
-        def validate_cart_id(self, cart_id):
-            if not Cart.objects.filter(pk=cart_id).exists():
-                raise serializers.ValidationError('No cart with a given id was found')
-            if CartItem.objects.filter(cart_id=cart_id).count() == 0:
-                raise serializers.ValidationError('The cart is empty.')
-            return cart_id
-        
-
-        def save(self, **kwargs):
-            cart_id = self.validated_data['cart_id']
-            customer = Customer.objects.get(
-                user_id=self.context['user_id'])
-            order = Order.objects.create(customer=customer)
-
-            # In order to get order items, we need to get cartitems in a specific cart
-            cart_items = CartItem.objects.select_related(
-                'product').filter(cart_id=cart_id)
-
-            # Then for each cartitem we'll create an orderitem and save into a database
-            order_items = [
-                OrderItem(
-                    order=order,
-                    product=item.product,
-                    unit_price=item.product.unit_price,
-                    quantity=item.quantity
-                ) for item in cart_items
-            ]
-            OrderItem.objects.bulk_create(order_items)
-            Cart.objects.filter(pk=cart_id).delete()
-
-            order_created.send_robust(self.__class__, order=order)
-            return order
+    cart_id = serializers.UUIDField()
+
+    def validate_cart_id(self, cart_id):
+        # Cache-backed carts are written to the database before checkout reads them
+        carts.get_store().flush(cart_id)
+        if not Cart.objects.filter(pk=cart_id).exists():
+            raise serializers.ValidationError('No cart with a given id was found')
+        if CartItem.objects.filter(cart_id=cart_id).count() == 0:
+            raise serializers.ValidationError('The cart is empty.')
+        return cart_id
+
+    def get_customer_id(self):
+        customer_id = self.context.get('customer_id')
+        if customer_id is not None:
+            return customer_id
+        return Customer.objects.only('id').get(user_id=self.context['user_id']).id
+
+    def save(self, **kwargs):
+        try:
+            return orders.place_order(self.get_customer_id(), self.validated_data['cart_id'])
+        except orders.CheckoutError as error:
+            raise serializers.ValidationError({'cart_id': [str(error)]})
+
+    # Asynchronous checkout: a worker places the order
+    def file_ticket(self):
+        return orders.file_ticket(self.get_customer_id(), self.validated_data['cart_id'])
+
+
+class OrderTicketSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderTicket
+        fields = ['id', 'status', 'order_id', 'error', 'created_at']
 
 
 class UpdateOrderSerializer(serializers.ModelSerializer):
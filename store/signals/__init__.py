@@ -1,3 +1,17 @@
+import logging
 from django.dispatch import Signal
 
-order_created = Signal()
\ No newline at end of file
+
+logger = logging.getLogger(__name__)
+
+order_created = Signal()
+
+
+def send_order_created(sender, order):
+    """
+    Sends order_created for a complete order. A receiver that fails doesn't stop the others or undo the order: its
+    error is logged, and the rollups it keeps are caught up by their scheduled rebuilds.
+    """
+    for receiver, result in order_created.send_robust(sender, order=order):
+        if isinstance(result, Exception):
+            logger.error('order_created receiver %s failed for order %s', receiver.__name__, order.pk, exc_info=result)
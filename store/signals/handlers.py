@@ -1,9 +1,172 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete, m2m_changed
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
 from django.dispatch import receiver
-from ..models import Customer
+from django.utils import timezone
+from tags.models import TaggedItem
+from ..models import Customer, Order, Product, Collection, ProductImage, Promotion
+from .. import analytics, caching, customer_stats, leaderboards, renditions, search
+from . import order_created
+from ..tasks import queue_renditions
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer_for_new_user(sender, **kwargs):
     if kwargs['created']:
         Customer.objects.create(user=kwargs['instance'])
+
+
+# Keep the product full-text index current
+@receiver(post_save, sender=Product)
+def index_product(sender, **kwargs):
+    search.index_products([kwargs['instance'].pk])
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, **kwargs):
+    search.remove_products([kwargs['instance'].pk])
+
+@receiver(post_save, sender=Collection)
+def index_collection_products(sender, **kwargs):
+    if not kwargs['created']:
+        search.index_products(kwargs['instance'].products.values_list('id', flat=True))
+
+@receiver([post_save, post_delete], sender=TaggedItem)
+def index_tagged_product(sender, **kwargs):
+    tagged_item = kwargs['instance']
+    if tagged_item.content_type_id == ContentType.objects.get_for_model(Product).id:
+        search.index_products([tagged_item.object_id])
+        caching.bump_product(tagged_item.object_id, get_collection_id(tagged_item.object_id))
+
+
+def get_collection_id(product_id):
+    return Product.objects.filter(pk=product_id).values_list('collection_id', flat=True).first()
+
+# Invalidate cached product responses by bumping their version counters
+@receiver(pre_save, sender=Product)
+def remember_previous_collection(sender, **kwargs):
+    product = kwargs['instance']
+    if product.pk is not None:
+        # A product moved to another collection also changes the old collection's lists and product count
+        product._previous_collection_id = get_collection_id(product.pk)
+
+@receiver([post_save, post_delete], sender=Product)
+def bump_product_cache(sender, **kwargs):
+    product = kwargs['instance']
+    caching.bump_product(product.pk, product.collection_id, getattr(product, '_previous_collection_id', None))
+
+@receiver([post_save, post_delete], sender=ProductImage)
+def bump_product_image_cache(sender, **kwargs):
+    image = kwargs['instance']
+    # Images are part of the product payload, so they move its Last-Modified too
+    Product.objects.filter(pk=image.product_id).update(last_update=timezone.now())
+    caching.bump_product(image.product_id, get_collection_id(image.product_id))
+
+# Resize new and replaced uploads in the background, once the row is committed
+@receiver(post_save, sender=ProductImage)
+def queue_product_image_renditions(sender, **kwargs):
+    image = kwargs['instance']
+    if image.image.name and not renditions.is_current(image):
+        transaction.on_commit(lambda: queue_renditions([image.pk]))
+
+@receiver(pre_save, sender=Collection)
+def remember_previous_tax_rate(sender, **kwargs):
+    collection = kwargs['instance']
+    if collection.pk is not None:
+        collection._previous_tax_rate = Collection.objects.filter(pk=collection.pk).values_list('tax_rate', flat=True).first()
+
+@receiver([post_save, post_delete], sender=Collection)
+def bump_collection_cache(sender, **kwargs):
+    collection = kwargs['instance']
+    # New and deleted collections have no products, so prices only change with the tax rate of a stored one
+    previous_tax_rate = getattr(collection, '_previous_tax_rate', None)
+    tax_rate = Collection._meta.get_field('tax_rate').to_python(collection.tax_rate)
+    caching.bump_collection(collection.pk, previous_tax_rate is not None and previous_tax_rate != tax_rate)
+
+@receiver([post_save, post_delete], sender=Promotion)
+def bump_promotion_cache(sender, **kwargs):
+    caching.bump_pricing()
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def bump_product_promotions_cache(sender, **kwargs):
+    if kwargs['action'] in ['post_add', 'post_remove', 'post_clear']:
+        caching.bump_pricing()
+
+
+# Keep Collection.product_count current
+@receiver(post_save, sender=Product)
+def count_saved_product(sender, **kwargs):
+    product = kwargs['instance']
+    previous_collection_id = getattr(product, '_previous_collection_id', None)
+    if kwargs['created']:
+        Collection.objects.filter(pk=product.collection_id).update(product_count=F('product_count') + 1)
+    elif previous_collection_id is not None and previous_collection_id != product.collection_id:
+        Collection.objects.filter(pk=previous_collection_id).update(product_count=F('product_count') - 1)
+        Collection.objects.filter(pk=product.collection_id).update(product_count=F('product_count') + 1)
+
+@receiver(post_delete, sender=Product)
+def count_deleted_product(sender, **kwargs):
+    Collection.objects \
+        .filter(pk=kwargs['instance'].collection_id, product_count__gt=0) \
+        .update(product_count=F('product_count') - 1)
+
+
+# Keep the sales leaderboards current
+@receiver(order_created)
+def add_order_to_leaderboards(sender, **kwargs):
+    leaderboards.add_order(kwargs['order'])
+
+@receiver(post_save, sender=Product)
+def move_product_sales(sender, **kwargs):
+    product = kwargs['instance']
+    previous_collection_id = getattr(product, '_previous_collection_id', None)
+    if previous_collection_id is not None and previous_collection_id != product.collection_id:
+        leaderboards.move_product(product.pk, product.collection_id)
+
+
+# Keep the customer aggregates current
+@receiver(order_created)
+def add_order_to_customer_stats(sender, **kwargs):
+    customer_stats.add_order(kwargs['order'])
+
+@receiver(pre_save, sender=Order)
+def remember_previous_payment_status(sender, **kwargs):
+    order = kwargs['instance']
+    update_fields = kwargs['update_fields']
+    order._previous_payment_status = None
+    if order.pk is not None and (update_fields is None or 'payment_status' in update_fields):
+        # Locked until the save commits (Order.save is atomic): concurrent changes can't both move the same totals
+        order._previous_payment_status = Order.objects \
+            .select_for_update() \
+            .filter(pk=order.pk) \
+            .values_list('payment_status', flat=True) \
+            .first()
+
+@receiver(post_save, sender=Order)
+def change_customer_spend(sender, **kwargs):
+    order = kwargs['instance']
+    previous_status = getattr(order, '_previous_payment_status', None)
+    if not kwargs['created'] and previous_status is not None:
+        customer_stats.change_payment_status(order, previous_status)
+
+@receiver(post_delete, sender=Order)
+def rebuild_deleted_order_customer_stats(sender, **kwargs):
+    customer_stats.rebuild([kwargs['instance'].customer_id])
+
+
+# Keep the daily sales rollups current
+@receiver(order_created)
+def add_order_to_daily_sales(sender, **kwargs):
+    analytics.add_order(kwargs['order'])
+
+@receiver(post_save, sender=Order)
+def move_order_daily_sales(sender, **kwargs):
+    order = kwargs['instance']
+    previous_status = getattr(order, '_previous_payment_status', None)
+    if not kwargs['created'] and previous_status is not None:
+        analytics.change_payment_status(order, previous_status)
+
+@receiver(post_delete, sender=Order)
+def reconcile_deleted_order_daily_sales(sender, **kwargs):
+    day = timezone.localdate(kwargs['instance'].placed_at)
+    analytics.reconcile(day, day)
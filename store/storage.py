@@ -0,0 +1,54 @@
+import hashlib
+import os
+import re
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+# Content-addressed file storage: every file is stored under the SHA-256 of its bytes,
+#   store/images/3f/3fa9...c2.jpg
+# so the same image uploaded to many products is written once and shared by all the rows, and a name never
+# points to different bytes. That makes the URLs fingerprinted: they can be cached forever.
+HASH_CHUNK_SIZE = 64 * 1024
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+FINGERPRINT_RE = re.compile(r'(^|/)[0-9a-f]{2}/[0-9a-f]{64}(_\w+)?\.\w+$')
+
+
+def hash_content(content):
+    digest = hashlib.sha256()
+    # chunks() rewinds first and streams, so large uploads aren't read into memory
+    for chunk in content.chunks(chunk_size=HASH_CHUNK_SIZE):
+        digest.update(chunk if isinstance(chunk, bytes) else chunk.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def is_fingerprinted(name):
+    return FINGERPRINT_RE.search(name) is not None
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names files by content hash, keeping the directory and extension of the requested name.
+    Saving bytes that are already stored writes nothing and returns the existing name.
+    Files are shared, so deleting one row's file would break the others: delete() only removes unreferenced files
+    when called explicitly (e.g. by a cleanup job), never from model code.
+    """
+    def get_content_name(self, name, content):
+        digest = hash_content(content)
+        directory = os.path.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(directory, digest[:2], digest + extension).replace('\\', '/')
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            return name
+        # Two concurrent saves of the same new file can still race: the loser gets a suffixed, equally unique name
+        return super().save(name, content, max_length)
+
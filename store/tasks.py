@@ -0,0 +1,98 @@
+import logging
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from kombu.exceptions import OperationalError
+from .models import ProductImage
+from . import analytics, carts, customer_stats, leaderboards, orders, recommendations, renditions
+
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def generate_renditions(image_id):
+    image = ProductImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image.name or renditions.is_current(image):
+        return
+    renditions.generate(image)
+
+
+def queue_renditions(image_ids):
+    # Without a broker the renditions are still generated, on their first request
+    try:
+        for image_id in image_ids:
+            generate_renditions.delay(image_id)
+    except OperationalError:
+        pass
+
+
+@shared_task
+def update_recommendations():
+    return recommendations.update_recommendations()
+
+
+# A cart locked by a request is retried: the request's own change schedules no other write
+@shared_task(autoretry_for=(carts.CartLocked,), retry_backoff=True, max_retries=5)
+def persist_cart(cart_id):
+    carts.persist_cached_cart(cart_id)
+
+
+def queue_persist_cart(cart_id):
+    # One pending write per cart: it runs after CART_PERSIST_DELAY and saves every change made until then
+    if not cache.add(f'{carts.KEY_PREFIX}:{cart_id}:scheduled', True, settings.CART_PERSIST_DELAY):
+        return
+    def send():
+        try:
+            persist_cart.apply_async([str(cart_id)], countdown=settings.CART_PERSIST_DELAY)
+        except OperationalError:
+            # Without a broker the cart is still saved at checkout
+            pass
+    transaction.on_commit(send)
+
+
+@shared_task
+def reap_carts():
+    reclaimed = carts.reap(settings.CART_IDLE_TIMEOUT, settings.CART_REAP_CHUNK_SIZE)
+    logger.info('Reaped %(carts)d idle carts and %(items)d cart items', reclaimed)
+    return reclaimed
+
+
+@shared_task
+def rebuild_leaderboards():
+    count = leaderboards.rebuild()
+    logger.info('Rebuilt the sales leaderboards (%d rows)', count)
+    return count
+
+
+@shared_task
+def rebuild_customer_stats():
+    count = customer_stats.rebuild()
+    logger.info('Rebuilt the aggregates of %d customers', count)
+    return count
+
+
+@shared_task
+def reconcile_sales():
+    count = analytics.reconcile_recent(settings.SALES_RECONCILE_DAYS)
+    logger.info('Reconciled the last %d days of sales rollups (%d rows)', settings.SALES_RECONCILE_DAYS, count)
+    return count
+
+
+@shared_task
+def place_order_tickets():
+    return orders.place_tickets(settings.ORDER_BATCH_SIZE)
+
+
+def queue_place_tickets():
+    def send():
+        # One queued run at a time: it places every ticket filed before it starts
+        if not cache.add(orders.SCHEDULED_KEY, True, 60):
+            return
+        try:
+            place_order_tickets.delay()
+        except OperationalError:
+            # Without a broker the ticket waits for the place_order_tickets beat run
+            cache.delete(orders.SCHEDULED_KEY)
+    transaction.on_commit(send)
@@ -1,6 +1,10 @@
 import pytest
 from rest_framework.test import APIClient
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from storefront.celery import celery
 
 
 @pytest.fixture
@@ -11,4 +15,45 @@ def api_client():
 def authenticate(api_client):
     def do_authenticate(is_staff=False):
         return api_client.force_authenticate(user=User(is_staff=is_staff))
-    return do_authenticate
\ No newline at end of file
+    return do_authenticate
+
+# Run every test against a clean local-memory cache instead of the Redis one in settings
+@pytest.fixture(autouse=True)
+def local_memory_cache(settings):
+    settings.CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}
+    }
+    yield
+    cache.clear()
+
+
+# Run Celery tasks in the test process instead of sending them to the broker in settings, so the tasks the code
+# queues (e.g. on commit) run and their results can be read
+@pytest.fixture(autouse=True)
+def eager_celery(settings):
+    settings.CELERY_TASK_ALWAYS_EAGER = True
+    previous = celery.conf.task_always_eager
+    celery.conf.task_always_eager = True
+    yield
+    celery.conf.task_always_eager = previous
+
+
+# Query budget: fails when an endpoint's query count grows with the size of its result.
+# For each size, add_rows(size) adds that many rows, then request() is called and its queries are counted;
+# every count has to be the same, and at most max_queries if given. Returns the count.
+@pytest.fixture
+def assert_query_budget():
+    def do_assert_query_budget(add_rows, request, sizes=(1, 3, 10), max_queries=None):
+        counts = {}
+        for size in sizes:
+            add_rows(size)
+            with CaptureQueriesContext(connection) as context:
+                response = request()
+            assert response.status_code < 400, response.data
+            counts[size] = len(context.captured_queries)
+        assert len(set(counts.values())) == 1, f'Query count grows with result size: {counts}'
+        count = counts[sizes[0]]
+        if max_queries is not None:
+            assert count <= max_queries, f'{count} queries, budget is {max_queries}'
+        return count
+    return do_assert_query_budget
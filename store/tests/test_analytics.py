@@ -0,0 +1,157 @@
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.core.management import call_command
+from rest_framework import status
+import pytest
+from store import analytics
+from store.models import Collection, Customer, DailySales, Order, OrderItem, Product
+from store.signals import order_created
+from model_bakery import baker
+
+
+MAY_15 = datetime(2024, 5, 15, 12, tzinfo=dt_timezone.utc)
+MAY_16 = datetime(2024, 5, 16, 12, tzinfo=dt_timezone.utc)
+
+
+@pytest.fixture
+def place_order():
+    def do_place_order(items, placed_at=MAY_15, membership=Customer.MEMBERSHIP_BRONZE,
+                       payment_status=Order.STATUS_COMPLETED):
+        customer = baker.make(settings.AUTH_USER_MODEL).customer
+        Customer.objects.filter(pk=customer.pk).update(membership=membership)
+        order = baker.make(Order, customer=customer, payment_status=payment_status)
+        Order.objects.filter(pk=order.pk).update(placed_at=placed_at)
+        order.refresh_from_db()
+        for product, quantity, unit_price in items:
+            baker.make(OrderItem, order=order, product=product, quantity=quantity, unit_price=Decimal(unit_price))
+        order_created.send_robust(None, order=order)
+        return order
+    return do_place_order
+
+
+def get_rollups():
+    return set(DailySales.objects.values_list('dimension', 'key', 'day', 'payment_status', 'orders', 'units', 'revenue'))
+
+
+@pytest.mark.django_db
+class TestDailySalesRollups:
+    def test_order_created_adds_to_every_dimension(self, place_order):
+        product = baker.make(Product)
+        place_order([(product, 2, '5.00')], membership=Customer.MEMBERSHIP_GOLD)
+
+        assert get_rollups() == {
+            ('T', '', date(2024, 5, 15), 'C', 1, 2, Decimal('10.00')),
+            ('M', 'G', date(2024, 5, 15), 'C', 1, 2, Decimal('10.00')),
+            ('C', str(product.collection_id), date(2024, 5, 15), 'C', 1, 2, Decimal('10.00'))
+        }
+
+    def test_payment_status_change_moves_the_order(self, place_order):
+        order = place_order([(baker.make(Product), 2, '5.00')], payment_status=Order.STATUS_PENDING)
+
+        order.payment_status = Order.STATUS_COMPLETED
+        order.save()
+
+        totals = DailySales.objects.filter(dimension=DailySales.DIMENSION_TOTAL)
+        assert dict(totals.values_list('payment_status', 'orders')) == {'P': 0, 'C': 1}
+
+    def test_reconcile_matches_incremental_rollups(self, place_order):
+        first, second = baker.make(Product, _quantity=2)
+        place_order([(first, 2, '5.00'), (second, 1, '3.00')])
+        order = place_order([(second, 4, '3.00')], placed_at=MAY_16, membership=Customer.MEMBERSHIP_SILVER)
+        order.payment_status = Order.STATUS_FAILED
+        order.save()
+        incremental = {row for row in get_rollups() if row[4]}
+
+        call_command('reconcile_sales')
+
+        assert get_rollups() == incremental
+
+    def test_failed_increments_are_logged_and_reconciled(self, monkeypatch, caplog):
+        from store.signals import send_order_created
+        customer = baker.make(settings.AUTH_USER_MODEL).customer
+        order = baker.make(Order, customer=customer, payment_status=Order.STATUS_COMPLETED)
+        baker.make(OrderItem, order=order, quantity=2, unit_price=Decimal('5.00'))
+        def add_order(order):
+            raise RuntimeError('lock wait timeout')
+        monkeypatch.setattr(analytics, 'add_order', add_order)
+
+        send_order_created(Order, order)
+        monkeypatch.undo()
+
+        assert f'add_order_to_daily_sales failed for order {order.pk}' in caplog.text
+        assert not DailySales.objects.exists()
+        analytics.reconcile_recent(1)
+        assert DailySales.objects.get(dimension=DailySales.DIMENSION_TOTAL).revenue == Decimal('10.00')
+
+    def test_reconcile_only_rewrites_the_given_days(self, place_order):
+        product = baker.make(Product)
+        place_order([(product, 1, '5.00')])
+        place_order([(product, 1, '5.00')], placed_at=MAY_16)
+        DailySales.objects.update(units=99)
+
+        analytics.reconcile(date(2024, 5, 16), date(2024, 5, 16))
+
+        assert set(DailySales.objects.values_list('day', 'units')) == {(date(2024, 5, 15), 99), (date(2024, 5, 16), 1)}
+
+
+@pytest.mark.django_db
+class TestSalesAnalytics:
+    url = '/store/analytics/sales/'
+
+    def test_if_user_is_not_admin_returns_403(self, api_client, authenticate):
+        authenticate()
+
+        response = api_client.get(self.url)
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_returns_daily_totals_for_completed_orders(self, api_client, authenticate, place_order):
+        authenticate(is_staff=True)
+        product = baker.make(Product)
+        place_order([(product, 2, '5.00')])
+        place_order([(product, 1, '5.00')])
+        place_order([(product, 1, '5.00')], placed_at=MAY_16)
+        place_order([(product, 9, '5.00')], placed_at=MAY_16, payment_status=Order.STATUS_PENDING)
+
+        response = api_client.get(self.url, {'start': '2024-05-01', 'end': '2024-05-31'})
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['results'] == [
+            {'day': '2024-05-15', 'orders': 2, 'units': 3, 'revenue': Decimal('15.00'), 'average_order_value': Decimal('7.50')},
+            {'day': '2024-05-16', 'orders': 1, 'units': 1, 'revenue': Decimal('5.00'), 'average_order_value': Decimal('5.00')}
+        ]
+
+    def test_groups_by_collection_and_membership(self, api_client, authenticate, place_order):
+        authenticate(is_staff=True)
+        collection = baker.make(Collection, title='Tools')
+        product = baker.make(Product, collection=collection)
+        place_order([(product, 2, '5.00')], membership=Customer.MEMBERSHIP_GOLD)
+        place_order([(product, 1, '5.00')], payment_status=Order.STATUS_PENDING)
+        params = {'start': '2024-05-15', 'end': '2024-05-15', 'payment_status': 'all'}
+
+        by_collection = api_client.get(self.url, {**params, 'group_by': 'collection'})
+        by_membership = api_client.get(self.url, {**params, 'group_by': 'membership'})
+
+        assert by_collection.data['results'] == [{
+            'collection': collection.id, 'collection_title': 'Tools',
+            'orders': 2, 'units': 3, 'revenue': Decimal('15.00'), 'average_order_value': Decimal('7.50')
+        }]
+        assert [(row['membership'], row['orders']) for row in by_membership.data['results']] == [('B', 1), ('G', 1)]
+
+    def test_if_params_are_invalid_returns_400(self, api_client, authenticate):
+        authenticate(is_staff=True)
+
+        response = api_client.get(self.url, {'start': '2024-05-31', 'end': '2024-05-01', 'group_by': 'week'})
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.data) == {'end', 'group_by'}
+
+    def test_queries_do_not_grow_with_orders(self, api_client, authenticate, place_order, assert_query_budget):
+        authenticate(is_staff=True)
+        products = baker.make(Product, _quantity=3)
+
+        assert_query_budget(
+            lambda size: [place_order([(products[i % 3], 1, '5.00')]) for i in range(size)],
+            lambda: api_client.get(self.url, {'start': '2024-05-01', 'end': '2024-05-31', 'group_by': 'collection'}),
+            max_queries=2)
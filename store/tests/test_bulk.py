@@ -0,0 +1,186 @@
+import json
+from decimal import Decimal
+from django.db import connection
+from django.db.models import QuerySet
+from rest_framework import status
+import pytest
+from store import bulk
+from store.models import Product, Collection
+from model_bakery import baker
+
+
+@pytest.mark.django_db
+class TestBulkImport:
+    def test_upserts_rows_and_reports_bad_lines(self):
+        collection = baker.make(Collection)
+        product = baker.make(Product, collection=collection, title='Old')
+        text = '\n'.join([
+            json.dumps({'id': product.id, 'title': 'New', 'slug': 'new', 'unit_price': '2.50', 'inventory': 4, 'collection_id': collection.id}),
+            json.dumps({'id': product.id + 1, 'title': 'Other', 'slug': 'other', 'unit_price': '1', 'inventory': 1, 'collection_id': collection.id}),
+            json.dumps({'id': product.id + 2, 'title': 'Orphan', 'slug': 'orphan', 'unit_price': '1', 'inventory': 1, 'collection_id': 0}),
+            json.dumps({'id': product.id + 3, 'title': 'Bad price', 'slug': 'bad', 'unit_price': 'abc', 'inventory': 1, 'collection_id': collection.id}),
+            'not json'
+        ])
+
+        report = bulk.import_text('products', text, chunk_size=2)
+
+        assert report['created'] == 1
+        assert report['updated'] == 1
+        assert sorted(error['line'] for error in report['errors']) == [3, 4, 5]
+        product.refresh_from_db()
+        assert product.title == 'New'
+        assert product.unit_price == Decimal('2.50')
+        collection.refresh_from_db()
+        assert collection.product_count == 2
+
+    def test_reports_rows_that_fail_the_field_validators(self):
+        collection = baker.make(Collection)
+        row = {'title': 'Valid', 'slug': 'valid', 'unit_price': '2', 'inventory': 0, 'collection_id': collection.id}
+        text = '\n'.join(json.dumps({**row, 'id': 100 + index, **change}) for index, change in enumerate([
+            {},
+            {'unit_price': '-5'},
+            {'inventory': -3},
+            {'slug': 'not a slug'},
+            {'title': 'a' * 400},
+            {'unit_price': '123456789.99'}
+        ]))
+
+        report = bulk.import_text('products', text)
+
+        assert report['created'] == 1
+        assert [list(error['errors']) for error in report['errors']] == [
+            ['unit_price'], ['inventory'], ['slug'], ['title'], ['unit_price']
+        ]
+        assert list(Product.objects.values_list('id', flat=True)) == [100]
+
+    def test_blank_cells_keep_the_stored_values(self):
+        collection = baker.make(Collection, title='Old', tax_rate=Decimal('0.2'))
+        body = f'id,title,tax_rate\n{collection.id},New,\n{collection.id + 1},Created,\n'
+
+        report = bulk.import_text('collections', body, format='csv')
+
+        assert report == {'created': 1, 'updated': 1, 'errors': []}
+        assert set(Collection.objects.values_list('title', 'tax_rate')) == {
+            ('New', Decimal('0.2')), ('Created', Decimal('0.1'))
+        }
+
+    def test_without_conflict_targets_upserts_on_any_unique_key(self, monkeypatch):
+        # MySQL: ON DUPLICATE KEY UPDATE takes no conflict target, and Django rejects unique_fields there
+        monkeypatch.setattr(connection.features, 'supports_update_conflicts_with_target', False)
+        calls = []
+        monkeypatch.setattr(QuerySet, 'bulk_create', lambda queryset, objs, **kwargs: calls.append(kwargs) or objs)
+        collection = baker.make(Collection)
+
+        bulk.import_text('collections', json.dumps({'id': collection.id, 'title': 'New'}))
+
+        assert calls[0]['update_conflicts'] is True
+        assert calls[0]['unique_fields'] is None
+
+    def test_csv_export_imports_back(self):
+        baker.make(Collection, title='Bakery', _quantity=2)
+        text = ''.join(bulk.export_lines('collections', 'csv'))
+        Collection.objects.update(title='Changed')
+
+        report = bulk.import_text('collections', text, format='csv')
+
+        assert report == {'created': 0, 'updated': 2, 'errors': []}
+        assert set(Collection.objects.values_list('title', flat=True)) == {'Bakery'}
+
+
+@pytest.mark.django_db
+class TestBulkCatalogEndpoint:
+    def test_if_user_is_not_admin_returns_403(self, api_client, authenticate):
+        authenticate(is_staff=False)
+
+        response = api_client.get('/store/bulk/products/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_if_kind_is_unknown_returns_404(self, api_client, authenticate):
+        authenticate(is_staff=True)
+
+        response = api_client.get('/store/bulk/customers/')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_streams_ndjson_export(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        products = baker.make(Product, _quantity=3)
+
+        response = api_client.get('/store/bulk/products/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['Content-Type'] == 'application/x-ndjson'
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        assert [json.loads(line)['id'] for line in lines] == [product.id for product in products]
+
+    def test_imports_csv_body(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        body = 'id,title,tax_rate\n500,Imported,0.2\n'
+
+        response = api_client.post('/store/bulk/collections/', body, content_type='text/csv')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {'created': 1, 'updated': 0, 'errors': []}
+        assert Collection.objects.get(id=500).tax_rate == Decimal('0.2')
+
+
+@pytest.mark.django_db
+class TestBatchUpdateProducts:
+    def test_if_user_is_not_admin_returns_403(self, api_client, authenticate):
+        authenticate(is_staff=False)
+
+        response = api_client.post('/store/products/batch-update/', [], format='json')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_if_body_is_not_a_list_returns_400(self, api_client, authenticate):
+        authenticate(is_staff=True)
+
+        response = api_client.post('/store/products/batch-update/', {'id': 1}, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_updates_valid_rows_and_reports_the_rest(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        first, second = baker.make(Product, inventory=10, unit_price=Decimal('5'), _quantity=2)
+
+        response = api_client.post('/store/products/batch-update/', [
+            {'id': first.id, 'inventory': 0},
+            {'id': second.id, 'unit_price': '7.50', 'inventory': 3},
+            {'id': first.id, 'inventory': -1},
+            {'id': 0, 'inventory': 1},
+            {'id': second.id}
+        ], format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['updated'] == 2
+        assert [error['index'] for error in response.data['errors']] == [2, 3, 4]
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert (first.inventory, first.unit_price) == (0, Decimal('5'))
+        assert (second.inventory, second.unit_price) == (3, Decimal('7.50'))
+
+    def test_rejects_every_row_of_a_repeated_id(self, api_client, authenticate):
+        authenticate(is_staff=True)
+        first, second = baker.make(Product, inventory=10, _quantity=2)
+
+        response = api_client.post('/store/products/batch-update/', [
+            {'id': first.id, 'inventory': 1},
+            {'id': second.id, 'inventory': 2},
+            {'id': first.id, 'inventory': 3}
+        ], format='json')
+
+        assert response.data['updated'] == 1
+        assert [(error['index'], list(error['errors'])) for error in response.data['errors']] == [(0, ['id']), (2, ['id'])]
+        assert set(Product.objects.values_list('id', 'inventory')) == {(first.id, 10), (second.id, 2)}
+
+    def test_uses_a_fixed_number_of_queries(self, authenticate, django_assert_max_num_queries):
+        products = baker.make(Product, _quantity=50)
+        rows = [{'id': product.id, 'inventory': 1, 'unit_price': '2'} for product in products]
+
+        # Existence check + savepoint + one UPDATE per chunk
+        with django_assert_max_num_queries(5):
+            report = bulk.update_products(rows)
+
+        assert report == {'updated': 50, 'errors': []}
@@ -0,0 +1,102 @@
+from rest_framework import status
+import pytest
+from store import caching
+from store.models import Product, Collection, ProductImage
+from model_bakery import baker
+
+
+@pytest.mark.django_db
+class TestProductResponseCache:
+    def test_second_detail_read_is_a_hit(self, api_client):
+        product = baker.make(Product)
+
+        first = api_client.get(f'/store/products/{product.pk}/')
+        second = api_client.get(f'/store/products/{product.pk}/')
+
+        assert first['X-Cache'] == 'MISS'
+        assert second['X-Cache'] == 'HIT'
+        assert second.data == first.data
+
+    def test_saving_product_invalidates_detail_and_lists(self, api_client):
+        product = baker.make(Product, title='a')
+        api_client.get(f'/store/products/{product.pk}/')
+        api_client.get(f'/store/products/?collection_id={product.collection_id}')
+
+        product.title = 'b'
+        product.save()
+        detail = api_client.get(f'/store/products/{product.pk}/')
+        listing = api_client.get(f'/store/products/?collection_id={product.collection_id}')
+
+        assert detail['X-Cache'] == 'MISS'
+        assert detail.data['title'] == 'b'
+        assert listing.data['results'][0]['title'] == 'b'
+
+    def test_moving_product_invalidates_old_collection_list(self, api_client):
+        product = baker.make(Product)
+        old_collection_id = product.collection_id
+        api_client.get(f'/store/products/?collection_id={old_collection_id}')
+
+        product.collection = baker.make(Collection)
+        product.save()
+        response = api_client.get(f'/store/products/?collection_id={old_collection_id}')
+
+        assert response['X-Cache'] == 'MISS'
+        assert response.data['count'] == 0
+
+    def test_other_collections_stay_cached(self, api_client):
+        product = baker.make(Product)
+        other = baker.make(Product)
+        api_client.get(f'/store/products/?collection_id={other.collection_id}')
+
+        product.save()
+        response = api_client.get(f'/store/products/?collection_id={other.collection_id}')
+
+        assert response['X-Cache'] == 'HIT'
+
+    def test_renaming_a_collection_keeps_other_products_cached(self, api_client):
+        product = baker.make(Product)
+        api_client.get(f'/store/products/{product.pk}/')
+
+        collection = baker.make(Collection)
+        collection.title = 'Renamed'
+        collection.save()
+        response = api_client.get(f'/store/products/{product.pk}/')
+
+        assert response['X-Cache'] == 'HIT'
+
+    def test_deleting_image_invalidates_detail(self, api_client):
+        image = baker.make(ProductImage, image='store/images/a.png')
+        api_client.get(f'/store/products/{image.product_id}/')
+
+        image.delete()
+        response = api_client.get(f'/store/products/{image.product_id}/')
+
+        assert response['X-Cache'] == 'MISS'
+        assert response.data['images'] == []
+
+
+class TestVersionedCacheMixin:
+    def test_detail_responses_depend_on_the_catalog_by_default(self):
+        version_keys = caching.VersionedCacheMixin().get_detail_version_keys(None, 1)
+
+        assert version_keys == [caching.catalog_version_key()]
+
+
+@pytest.mark.django_db
+class TestCacheStats:
+    def test_if_user_is_not_admin_returns_403(self, api_client, authenticate):
+        authenticate(is_staff=False)
+
+        response = api_client.get('/store/cache-stats/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_counts_hits_and_misses(self, api_client, authenticate):
+        product = baker.make(Product)
+        api_client.get(f'/store/products/{product.pk}/')
+        api_client.get(f'/store/products/{product.pk}/')
+        authenticate(is_staff=True)
+
+        response = api_client.get('/store/cache-stats/')
+
+        assert response.data == {'hits': 1, 'misses': 1, 'hit_ratio': 0.5}
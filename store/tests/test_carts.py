@@ -0,0 +1,352 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from threading import Barrier
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.utils import timezone
+from rest_framework import status
+import pytest
+from store.models import Cart, CartItem, Order, Product
+from model_bakery import baker
+
+
+@pytest.fixture(params=['database', 'cache'])
+def cart_backend(request, settings):
+    settings.CART_BACKEND = request.param
+    return request.param
+
+@pytest.fixture
+def create_cart(api_client):
+    def do_create_cart():
+        return api_client.post('/store/carts/').data['id']
+    return do_create_cart
+
+
+@pytest.mark.django_db
+class TestCartApi:
+    def test_adding_a_product_twice_sums_the_quantity(self, api_client, cart_backend, create_cart):
+        product = baker.make(Product, unit_price=Decimal('2.50'))
+        cart_id = create_cart()
+
+        api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 1})
+        response = api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 2})
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['quantity'] == 3
+        cart = api_client.get(f'/store/carts/{cart_id}/').data
+        assert [(item['product']['id'], item['quantity']) for item in cart['items']] == [(product.id, 3)]
+        assert cart['total_price'] == Decimal('7.50')
+
+    def test_updates_and_removes_items(self, api_client, cart_backend, create_cart):
+        first, second = baker.make(Product, _quantity=2)
+        cart_id = create_cart()
+        first_item = api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': first.id, 'quantity': 1}).data
+        second_item = api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': second.id, 'quantity': 1}).data
+
+        patched = api_client.patch(f'/store/carts/{cart_id}/items/{first_item["id"]}/', {'quantity': 5})
+        deleted = api_client.delete(f'/store/carts/{cart_id}/items/{second_item["id"]}/')
+
+        assert patched.data == {'quantity': 5}
+        assert deleted.status_code == status.HTTP_204_NO_CONTENT
+        items = api_client.get(f'/store/carts/{cart_id}/items/').data
+        assert [(item['product']['id'], item['quantity']) for item in items] == [(first.id, 5)]
+
+    def test_deleted_cart_returns_404(self, api_client, cart_backend, create_cart):
+        cart_id = create_cart()
+
+        deleted = api_client.delete(f'/store/carts/{cart_id}/')
+
+        assert deleted.status_code == status.HTTP_204_NO_CONTENT
+        assert api_client.get(f'/store/carts/{cart_id}/').status_code == status.HTTP_404_NOT_FOUND
+
+    def test_if_cart_does_not_exist_adding_returns_404(self, api_client, cart_backend):
+        product = baker.make(Product)
+
+        response = api_client.post(
+            '/store/carts/00000000-0000-0000-0000-000000000000/items/', {'product_id': product.id, 'quantity': 1})
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+    def test_batch_adds_many_items(self, api_client, cart_backend, create_cart):
+        first, second = baker.make(Product, _quantity=2)
+        cart_id = create_cart()
+        api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': first.id, 'quantity': 1})
+
+        response = api_client.post(f'/store/carts/{cart_id}/items/batch/', {'items': [
+            {'product_id': first.id, 'quantity': 2},
+            {'product_id': second.id, 'quantity': 1},
+            {'product_id': second.id, 'quantity': 3}
+        ]}, format='json')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [(item['product_id'], item['quantity']) for item in response.data] == [(first.id, 3), (second.id, 4)]
+        items = api_client.get(f'/store/carts/{cart_id}/items/').data
+        assert sorted((item['product']['id'], item['quantity']) for item in items) == [(first.id, 3), (second.id, 4)]
+
+    def test_batch_set_replaces_quantities(self, api_client, cart_backend, create_cart):
+        product = baker.make(Product)
+        cart_id = create_cart()
+        api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 5})
+
+        response = api_client.post(f'/store/carts/{cart_id}/items/batch/', {
+            'items': [{'product_id': product.id, 'quantity': 2}], 'mode': 'set'}, format='json')
+
+        assert [(item['product_id'], item['quantity']) for item in response.data] == [(product.id, 2)]
+
+    def test_batch_with_unknown_product_returns_400(self, api_client, cart_backend, create_cart):
+        product = baker.make(Product)
+        cart_id = create_cart()
+
+        response = api_client.post(f'/store/carts/{cart_id}/items/batch/', {'items': [
+            {'product_id': product.id, 'quantity': 1}, {'product_id': product.id + 1, 'quantity': 1}
+        ]}, format='json')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert api_client.get(f'/store/carts/{cart_id}/items/').data == []
+
+    def test_batch_to_missing_cart_returns_404(self, api_client, cart_backend):
+        product = baker.make(Product)
+
+        response = api_client.post('/store/carts/00000000-0000-0000-0000-000000000000/items/batch/', {
+            'items': [{'product_id': product.id, 'quantity': 1}]}, format='json')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+    def test_summary_counts_items_and_totals(self, api_client, cart_backend, create_cart):
+        first = baker.make(Product, unit_price=Decimal('2.50'))
+        second = baker.make(Product, unit_price=Decimal('10'))
+        cart_id = create_cart()
+        api_client.post(f'/store/carts/{cart_id}/items/batch/', {'items': [
+            {'product_id': first.id, 'quantity': 2}, {'product_id': second.id, 'quantity': 1}
+        ]}, format='json')
+
+        response = api_client.get(f'/store/carts/{cart_id}/summary/')
+
+        assert response.data == {'id': cart_id, 'items_count': 3, 'total_price': Decimal('15.00')}
+        cart = api_client.get(f'/store/carts/{cart_id}/').data
+        assert cart['total_price'] == Decimal('15.00')
+        assert sorted(item['total_price'] for item in cart['items']) == [Decimal('5.00'), Decimal('10.00')]
+
+    def test_summary_follows_cart_and_price_changes(self, api_client, cart_backend, create_cart):
+        product = baker.make(Product, unit_price=Decimal('2'))
+        cart_id = create_cart()
+        assert api_client.get(f'/store/carts/{cart_id}/summary/').data['items_count'] == 0
+
+        item = api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 2}).data
+        assert api_client.get(f'/store/carts/{cart_id}/summary/').data['total_price'] == Decimal('4')
+
+        product.unit_price = Decimal('3')
+        product.save()
+        assert api_client.get(f'/store/carts/{cart_id}/summary/').data['total_price'] == Decimal('6')
+
+        api_client.delete(f'/store/carts/{cart_id}/items/{item["id"]}/')
+        assert api_client.get(f'/store/carts/{cart_id}/summary/').data['items_count'] == 0
+
+        api_client.delete(f'/store/carts/{cart_id}/')
+        assert api_client.get(f'/store/carts/{cart_id}/summary/').status_code == status.HTTP_404_NOT_FOUND
+
+    def test_cart_queries_do_not_grow_with_items(self, api_client, cart_backend, create_cart, assert_query_budget):
+        cart_id = create_cart()
+
+        def add_items(size):
+            api_client.post(f'/store/carts/{cart_id}/items/batch/', {'items': [
+                {'product_id': product.id, 'quantity': 1} for product in baker.make(Product, _quantity=size)
+            ]}, format='json')
+
+        assert_query_budget(add_items, lambda: api_client.get(f'/store/carts/{cart_id}/'), max_queries=3)
+
+    def test_cached_summary_makes_no_queries(self, api_client, cart_backend, create_cart, django_assert_num_queries):
+        cart_id = create_cart()
+        api_client.get(f'/store/carts/{cart_id}/summary/')
+
+        with django_assert_num_queries(0):
+            api_client.get(f'/store/carts/{cart_id}/summary/')
+
+@pytest.mark.django_db
+class TestDatabaseCartStore:
+    def test_adding_an_item_is_one_query(self, django_assert_num_queries):
+        from store import carts
+        product = baker.make(Product)
+        cart = baker.make(Cart)
+        store = carts.DatabaseCartStore()
+        store.add_item(cart.id, product.id, 1)
+
+        with django_assert_num_queries(1 if connection.features.supports_update_conflicts_with_target else 4):
+            item = store.add_item(cart.id, product.id, 2)
+
+        assert item.quantity == 3
+        assert CartItem.objects.get(cart=cart, product=product).quantity == 3
+
+    def test_batch_is_one_query(self, django_assert_num_queries):
+        from store import carts
+        if not connection.features.supports_update_conflicts_with_target:
+            pytest.skip('The database has no ON CONFLICT ... DO UPDATE')
+        products = baker.make(Product, _quantity=5)
+        store = carts.DatabaseCartStore()
+        cart = store.create()
+
+        with django_assert_num_queries(1):
+            items = store.add_items(cart.id, {product.id: 2 for product in products})
+
+        assert sorted(item.product_id for item in items) == [product.id for product in products]
+
+
+    def test_without_upsert_support_falls_back_to_f_updates(self, monkeypatch):
+        from store import carts
+        monkeypatch.setattr(connection.features, 'supports_update_conflicts_with_target', False)
+        first, second = baker.make(Product, _quantity=2)
+        cart = baker.make(Cart)
+        store = carts.DatabaseCartStore()
+        store.add_item(cart.id, first.id, 1)
+
+        items = store.add_items(cart.id, {first.id: 2, second.id: 1})
+
+        assert sorted((item.product_id, item.quantity) for item in items) == [(first.id, 3), (second.id, 1)]
+        assert store.add_item('00000000-0000-0000-0000-000000000000', first.id, 1) is None
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentCartAdds:
+    THREADS = 8
+    ADDS = 10
+
+    def test_concurrent_adds_lose_no_increments(self):
+        from store import carts
+        product = baker.make(Product)
+        cart = baker.make(Cart)
+        barrier = Barrier(self.THREADS)
+
+        def add():
+            try:
+                barrier.wait()
+                for _ in range(self.ADDS):
+                    add_retrying_locks(cart.id, product.id)
+            finally:
+                connections.close_all()
+
+        # A statement refused with "locked" (SQLite's in-memory test database locks whole tables) or a deadlock
+        # wrote nothing, so retrying it can't double count
+        def add_retrying_locks(cart_id, product_id):
+            while True:
+                try:
+                    return carts.DatabaseCartStore().add_item(cart_id, product_id, 1)
+                except OperationalError:
+                    time.sleep(0.001)
+
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            for future in [executor.submit(add) for _ in range(self.THREADS)]:
+                future.result()
+
+        assert CartItem.objects.get(cart=cart, product=product).quantity == self.THREADS * self.ADDS
+
+
+@pytest.mark.django_db
+class TestCacheCartStore:
+    @pytest.fixture(autouse=True)
+    def cache_backend(self, settings):
+        settings.CART_BACKEND = 'cache'
+
+    def test_changes_reach_the_database_only_when_persisted(self, api_client, create_cart):
+        from store import carts
+        product = baker.make(Product)
+        cart_id = create_cart()
+        api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 2})
+
+        assert not Cart.objects.exists()
+        carts.persist_cached_cart(cart_id)
+
+        assert list(CartItem.objects.filter(cart_id=cart_id).values_list('product_id', 'quantity')) == [(product.id, 2)]
+
+    def test_evicted_cart_is_reloaded_from_the_database(self, api_client, create_cart):
+        from django.core.cache import cache
+        from store import carts
+        product = baker.make(Product)
+        cart_id = create_cart()
+        item = api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 2}).data
+        carts.persist_cached_cart(cart_id)
+
+        cache.clear()
+        response = api_client.get(f'/store/carts/{cart_id}/items/{item["id"]}/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['quantity'] == 2
+
+    def test_checkout_flushes_the_cart(self, api_client, create_cart):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        api_client.force_authenticate(user=user)
+        product = baker.make(Product, unit_price=Decimal('4'), inventory=10)
+        cart_id = create_cart()
+        api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 3})
+
+        response = api_client.post('/store/orders/', {'cart_id': cart_id})
+
+        assert response.status_code == status.HTTP_200_OK
+        order = Order.objects.get(pk=response.data['id'])
+        assert list(order.items.values_list('product_id', 'quantity')) == [(product.id, 3)]
+        assert api_client.get(f'/store/carts/{cart_id}/').status_code == status.HTTP_404_NOT_FOUND
+
+    def test_if_the_cart_stays_locked_returns_409(self, api_client, create_cart, monkeypatch):
+        from django.core.cache import cache
+        from store import carts
+        monkeypatch.setattr(carts, 'LOCK_WAIT', 0.05)
+        product = baker.make(Product)
+        cart_id = create_cart()
+        api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 1})
+        store = carts.CacheCartStore()
+        cache.add(f'{store.get_key(cart_id)}:lock', 'other', carts.LOCK_TIMEOUT)
+
+        response = api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 2})
+
+        assert response.status_code == status.HTTP_409_CONFLICT
+        assert cache.get(store.get_key(cart_id))['i'] == {product.id: 1}
+
+    def test_reading_a_cart_makes_one_query(self, api_client, create_cart, django_assert_num_queries):
+        product = baker.make(Product)
+        cart_id = create_cart()
+        api_client.post(f'/store/carts/{cart_id}/items/', {'product_id': product.id, 'quantity': 1})
+
+        # The products; the cart itself comes from the cache
+        with django_assert_num_queries(1):
+            api_client.get(f'/store/carts/{cart_id}/items/')
+
+
+@pytest.mark.django_db
+class TestReapCarts:
+    def make_cart(self, idle_days, items=1):
+        cart = baker.make(Cart)
+        Cart.objects.filter(pk=cart.pk).update(last_activity=timezone.now() - timedelta(days=idle_days))
+        if items:
+            baker.make(CartItem, cart=cart, quantity=1, _quantity=items)
+        return cart
+
+    def test_deletes_idle_carts_in_chunks(self):
+        from store import carts
+        idle = [self.make_cart(idle_days=40, items=2) for _ in range(5)]
+        active = self.make_cart(idle_days=1)
+
+        reclaimed = carts.reap(30 * 24 * 60 * 60, chunk_size=2)
+
+        assert reclaimed == {'carts': 5, 'items': 10}
+        assert list(Cart.objects.values_list('id', flat=True)) == [active.id]
+        assert not CartItem.objects.filter(cart__in=idle).exists()
+
+    def test_changing_a_cart_records_activity(self, api_client, cart_backend):
+        from store import carts
+        product = baker.make(Product)
+        cart = self.make_cart(idle_days=40, items=0)
+
+        api_client.post(f'/store/carts/{cart.id}/items/', {'product_id': product.id, 'quantity': 1})
+        carts.get_store().flush(cart.id)
+
+        assert carts.reap(30 * 24 * 60 * 60) == {'carts': 0, 'items': 0}
+        assert Cart.objects.filter(pk=cart.pk).exists()
+
+    def test_task_reports_reclaimed_rows(self, settings):
+        from store.tasks import reap_carts
+        settings.CART_IDLE_TIMEOUT = 24 * 60 * 60
+        self.make_cart(idle_days=2, items=3)
+
+        assert reap_carts() == {'carts': 1, 'items': 3}
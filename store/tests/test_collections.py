@@ -1,4 +1,6 @@
+from io import StringIO
 from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
 from rest_framework import status
 from rest_framework.test import APIClient
 import pytest
@@ -72,3 +74,54 @@ class TestRetrieveCollection:
         assert response.status_code == status.HTTP_404_NOT_FOUND
 
 
+
+
+@pytest.mark.django_db
+class TestCollectionProductCount:
+    def test_count_follows_product_create_move_and_delete(self):
+        first, second = baker.make(Collection, _quantity=2)
+        product = baker.make(Product, collection=first)
+        baker.make(Product, collection=first)
+
+        product.collection = second
+        product.save()
+        product.delete()
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert (first.product_count, second.product_count) == (1, 0)
+
+    def test_rebuild_command_fixes_drifted_counts(self):
+        collection = baker.make(Collection)
+        baker.make(Product, collection=collection, _quantity=2)
+        Collection.objects.filter(pk=collection.pk).update(product_count=7)
+
+        call_command('rebuild_collection_counts', stdout=StringIO())
+
+        collection.refresh_from_db()
+        assert collection.product_count == 2
+
+    def test_saving_a_loaded_collection_keeps_the_count(self):
+        collection = Collection.objects.get(pk=baker.make(Collection).pk)
+        baker.make(Product, collection=collection)
+
+        collection.title = 'Renamed'
+        collection.save()
+
+        collection.refresh_from_db()
+        assert (collection.title, collection.product_count) == ('Renamed', 1)
+
+    def test_check_command_fails_on_drifted_counts(self):
+        collection = baker.make(Collection)
+        Collection.objects.filter(pk=collection.pk).update(product_count=7)
+
+        with pytest.raises(CommandError):
+            call_command('rebuild_collection_counts', '--check', stdout=StringIO())
+
+    def test_list_reads_the_stored_count(self, api_client, django_assert_num_queries):
+        baker.make(Product, collection=baker.make(Collection), _quantity=3)
+
+        with django_assert_num_queries(1):
+            response = api_client.get('/store/collections/')
+
+        assert response.data[0]['product_count'] == 3
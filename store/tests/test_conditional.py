@@ -0,0 +1,92 @@
+from rest_framework import status
+import pytest
+from store.models import Product, Collection, ProductImage, Cart, CartItem
+from model_bakery import baker
+
+
+@pytest.mark.django_db
+class TestConditionalProductReads:
+    def test_detail_with_matching_etag_returns_304(self, api_client):
+        product = baker.make(Product)
+        etag = api_client.get(f'/store/products/{product.pk}/')['ETag']
+
+        response = api_client.get(f'/store/products/{product.pk}/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+        assert response.content == b''
+
+    def test_detail_with_if_modified_since_returns_304(self, api_client):
+        product = baker.make(Product)
+        last_modified = api_client.get(f'/store/products/{product.pk}/')['Last-Modified']
+
+        response = api_client.get(f'/store/products/{product.pk}/', HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_new_image_changes_detail_etag(self, api_client):
+        product = baker.make(Product)
+        etag = api_client.get(f'/store/products/{product.pk}/')['ETag']
+
+        baker.make(ProductImage, product=product, image='store/images/a.png')
+        response = api_client.get(f'/store/products/{product.pk}/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data['images']) == 1
+
+    def test_deleted_product_changes_list_etag(self, api_client):
+        products = baker.make(Product, _quantity=2)
+        etag = api_client.get('/store/products/')['ETag']
+
+        products[0].delete()
+        response = api_client.get('/store/products/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 1
+
+    def test_list_revalidation_makes_no_queries(self, api_client, django_assert_num_queries):
+        baker.make(Product, _quantity=3)
+        etag = api_client.get('/store/products/')['ETag']
+
+        with django_assert_num_queries(0):
+            response = api_client.get('/store/products/', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_list_etag_depends_on_query(self, api_client):
+        baker.make(Product, _quantity=2)
+        etag = api_client.get('/store/products/')['ETag']
+
+        response = api_client.get('/store/products/?ordering=unit_price', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestConditionalCollectionAndCartReads:
+    def test_collection_etag_changes_with_product_count(self, api_client):
+        collection = baker.make(Collection)
+        etag = api_client.get(f'/store/collections/{collection.pk}/')['ETag']
+        unchanged = api_client.get(f'/store/collections/{collection.pk}/', HTTP_IF_NONE_MATCH=etag)
+
+        baker.make(Product, collection=collection)
+        changed = api_client.get(f'/store/collections/{collection.pk}/', HTTP_IF_NONE_MATCH=etag)
+
+        assert unchanged.status_code == status.HTTP_304_NOT_MODIFIED
+        assert changed.data['product_count'] == 1
+
+    def test_cart_etag_changes_with_quantity(self, api_client):
+        item = baker.make(CartItem, quantity=1)
+        etag = api_client.get(f'/store/carts/{item.cart_id}/')['ETag']
+        unchanged = api_client.get(f'/store/carts/{item.cart_id}/', HTTP_IF_NONE_MATCH=etag)
+
+        item.quantity = 2
+        item.save()
+        changed = api_client.get(f'/store/carts/{item.cart_id}/', HTTP_IF_NONE_MATCH=etag)
+
+        assert unchanged.status_code == status.HTTP_304_NOT_MODIFIED
+        assert changed.status_code == status.HTTP_200_OK
+
+    def test_if_cart_id_is_invalid_returns_404(self, api_client):
+        response = api_client.get('/store/carts/not-a-uuid/')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,158 @@
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection
+from rest_framework import status
+import pytest
+from store import customer_stats
+from store.models import CustomerProductStats, CustomerStats, Order, OrderItem, Product
+from store.signals import order_created
+from model_bakery import baker
+
+
+@pytest.fixture
+def customer():
+    return baker.make(settings.AUTH_USER_MODEL).customer
+
+@pytest.fixture
+def place_order(customer):
+    def do_place_order(items, placed_at=None, payment_status=Order.STATUS_PENDING):
+        order = baker.make(Order, customer=customer, payment_status=payment_status)
+        if placed_at is not None:
+            Order.objects.filter(pk=order.pk).update(placed_at=placed_at)
+            order.refresh_from_db()
+        for product, quantity, unit_price in items:
+            baker.make(OrderItem, order=order, product=product, quantity=quantity, unit_price=Decimal(unit_price))
+        order_created.send_robust(None, order=order)
+        return order
+    return do_place_order
+
+
+def get_stats(customer):
+    return CustomerStats.objects.values('orders_count', 'lifetime_spend', 'last_order_at').get(customer=customer)
+
+
+@pytest.mark.django_db
+class TestCustomerStats:
+    def test_order_created_adds_to_the_aggregates(self, customer, place_order):
+        first, second = baker.make(Product, _quantity=2)
+        placed_at = datetime(2024, 5, 16, 12, tzinfo=dt_timezone.utc)
+        place_order([(first, 2, '5.00'), (second, 1, '3.00')], placed_at=placed_at, payment_status=Order.STATUS_COMPLETED)
+        place_order([(first, 1, '5.00')], placed_at=datetime(2024, 5, 15, 12, tzinfo=dt_timezone.utc))
+
+        assert get_stats(customer) == {'orders_count': 2, 'lifetime_spend': Decimal('13.00'), 'last_order_at': placed_at}
+        assert set(CustomerProductStats.objects.values_list('product_id', 'units', 'revenue')) == {
+            (first.id, 3, Decimal('15.00')),
+            (second.id, 1, Decimal('3.00'))
+        }
+
+    def test_without_upserts_increments_row_by_row(self, customer, place_order, monkeypatch):
+        monkeypatch.setattr(connection.features, 'supports_update_conflicts_with_target', False)
+        product = baker.make(Product)
+        place_order([(product, 2, '5.00')])
+        place_order([(product, 1, '5.00')])
+
+        assert get_stats(customer)['orders_count'] == 2
+        assert CustomerProductStats.objects.get(customer=customer).units == 3
+
+    def test_payment_status_changes_move_the_spend(self, customer, place_order):
+        order = place_order([(baker.make(Product), 2, '5.00')])
+
+        order.payment_status = Order.STATUS_COMPLETED
+        order.save()
+        completed = get_stats(customer)['lifetime_spend']
+        order.payment_status = Order.STATUS_FAILED
+        order.save()
+
+        assert completed == Decimal('10.00')
+        assert get_stats(customer)['lifetime_spend'] == Decimal('0.00')
+
+    def test_rebuild_matches_incremental_aggregates(self, customer, place_order):
+        first, second = baker.make(Product, _quantity=2)
+        order = place_order([(first, 2, '5.00'), (second, 1, '3.00')])
+        place_order([(second, 4, '3.00')])
+        order.payment_status = Order.STATUS_COMPLETED
+        order.save()
+        incremental = get_stats(customer), set(CustomerProductStats.objects.values_list('product_id', 'units', 'revenue'))
+
+        customer_stats.rebuild()
+
+        assert (get_stats(customer), set(CustomerProductStats.objects.values_list('product_id', 'units', 'revenue'))) == incremental
+
+    def test_failed_increments_are_logged_and_caught_up_by_the_task(self, customer, monkeypatch, caplog):
+        from store.signals import send_order_created
+        from store.tasks import rebuild_customer_stats
+        order = baker.make(Order, customer=customer, payment_status=Order.STATUS_COMPLETED)
+        baker.make(OrderItem, order=order, quantity=2, unit_price=Decimal('5.00'))
+        def add_order(order):
+            raise RuntimeError('lock wait timeout')
+        monkeypatch.setattr(customer_stats, 'add_order', add_order)
+
+        send_order_created(Order, order)
+        monkeypatch.undo()
+
+        assert f'add_order_to_customer_stats failed for order {order.pk}' in caplog.text
+        assert not CustomerStats.objects.exists()
+        rebuild_customer_stats()
+        assert get_stats(customer)['lifetime_spend'] == Decimal('10.00')
+
+    def test_deleting_an_order_removes_it(self, customer, place_order):
+        product = baker.make(Product)
+        place_order([(product, 1, '5.00')])
+        order = place_order([(product, 2, '5.00')])
+
+        order.items.all().delete()
+        order.delete()
+
+        assert get_stats(customer)['orders_count'] == 1
+        assert CustomerProductStats.objects.get(customer=customer).units == 1
+
+
+@pytest.mark.django_db
+class TestCustomerAdmin:
+    def test_changelist_reads_the_order_count_from_the_aggregates(self, client, customer, place_order):
+        place_order([(baker.make(Product), 1, '5.00')])
+        client.force_login(baker.make(settings.AUTH_USER_MODEL, is_staff=True, is_superuser=True))
+
+        response = client.get('/admin/store/customer/?o=4')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert f'customer__id={customer.id}">1</a>' in response.content.decode()
+
+
+@pytest.mark.django_db
+class TestCustomerHistory:
+    def test_if_user_lacks_permission_returns_403(self, api_client, customer):
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL))
+
+        response = api_client.get(f'/store/customers/{customer.id}/history/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_returns_aggregates_and_orders_newest_first(self, api_client, customer, place_order):
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL, is_superuser=True))
+        first, second = baker.make(Product, _quantity=2)
+        orders = [place_order([(first, 1, '5.00')]), place_order([(second, 3, '2.00')])]
+
+        response = api_client.get(f'/store/customers/{customer.id}/history/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['orders_count'] == 2
+        assert [row['product']['id'] for row in response.data['top_products']] == [second.id, first.id]
+        assert [order['id'] for order in response.data['orders']['results']] == [orders[1].id, orders[0].id]
+
+    def test_customer_without_orders_returns_zeros(self, api_client, customer):
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL, is_superuser=True))
+
+        response = api_client.get(f'/store/customers/{customer.id}/history/')
+
+        assert response.data['orders_count'] == 0
+        assert response.data['orders']['results'] == []
+
+    def test_queries_do_not_grow_with_orders(self, api_client, customer, place_order, assert_query_budget):
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL, is_superuser=True))
+        products = baker.make(Product, _quantity=3)
+
+        assert_query_budget(
+            lambda size: [place_order([(product, 1, '5.00') for product in products]) for _ in range(size)],
+            lambda: api_client.get(f'/store/customers/{customer.id}/history/'))
@@ -0,0 +1,69 @@
+from decimal import Decimal
+from rest_framework import status
+import pytest
+from store.models import Product, Collection
+from model_bakery import baker
+
+
+@pytest.mark.django_db
+class TestProductFacets:
+    def test_returns_collection_price_and_stock_counts(self, api_client):
+        bakery = baker.make(Collection, title='Bakery')
+        drinks = baker.make(Collection, title='Drinks')
+        baker.make(Product, collection=bakery, unit_price=Decimal('5'), inventory=0)
+        baker.make(Product, collection=bakery, unit_price=Decimal('15'), inventory=3)
+        baker.make(Product, collection=drinks, unit_price=Decimal('7'), inventory=1)
+
+        response = api_client.get('/store/products/facets/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {
+            'count': 3,
+            'collections': [
+                {'id': bakery.pk, 'title': 'Bakery', 'count': 2},
+                {'id': drinks.pk, 'title': 'Drinks', 'count': 1}
+            ],
+            'prices': [
+                {'min': 0, 'max': 10, 'count': 2},
+                {'min': 10, 'max': 20, 'count': 1}
+            ],
+            'stock': {'in_stock': 2, 'out_of_stock': 1}
+        }
+
+    def test_applies_product_filters_in_one_query(self, api_client, django_assert_num_queries):
+        baker.make(Product, unit_price=Decimal('5'))
+        baker.make(Product, unit_price=Decimal('50'))
+
+        with django_assert_num_queries(1):
+            response = api_client.get('/store/products/facets/?unit_price__gt=10&price_bucket=25')
+
+        assert response.data['prices'] == [{'min': 50, 'max': 75, 'count': 1}]
+
+    def test_collection_counts_ignore_only_the_collection_filter(self, api_client):
+        bakery = baker.make(Collection, title='Bakery')
+        drinks = baker.make(Collection, title='Drinks')
+        baker.make(Product, collection=bakery, unit_price=Decimal('5'))
+        baker.make(Product, collection=bakery, unit_price=Decimal('50'))
+        baker.make(Product, collection=drinks, unit_price=Decimal('60'), _quantity=2)
+
+        response = api_client.get(f'/store/products/facets/?collection_id={bakery.pk}&unit_price__gt=10')
+
+        assert response.data['count'] == 1
+        assert response.data['collections'] == [
+            {'id': bakery.pk, 'title': 'Bakery', 'count': 1},
+            {'id': drinks.pk, 'title': 'Drinks', 'count': 2}
+        ]
+        assert response.data['prices'] == [{'min': 50, 'max': 60, 'count': 1}]
+
+    def test_second_request_is_cached(self, api_client):
+        baker.make(Product)
+        api_client.get('/store/products/facets/')
+
+        response = api_client.get('/store/products/facets/')
+
+        assert response['X-Cache'] == 'HIT'
+
+    def test_if_bucket_size_is_invalid_returns_400(self, api_client):
+        response = api_client.get('/store/products/facets/?price_bucket=0')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,118 @@
+import hashlib
+from threading import Timer
+from types import SimpleNamespace
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from rest_framework import status
+import pytest
+from store import idempotency
+from store.models import Cart, CartItem, Order, Product
+from model_bakery import baker
+
+
+@pytest.fixture
+def cart_with_item():
+    product = baker.make(Product, inventory=10)
+    cart = baker.make(Cart)
+    baker.make(CartItem, cart=cart, product=product, quantity=1)
+    return cart, product
+
+
+def get_cache_key(path, key):
+    request = SimpleNamespace(user=AnonymousUser(), path=path)
+    return idempotency.IdempotentMixin().get_idempotency_cache_key(request, key)
+
+
+@pytest.mark.django_db
+class TestIdempotentOrders:
+    def test_retried_checkout_replays_without_queries(self, api_client, cart_with_item, django_assert_num_queries):
+        cart, _ = cart_with_item
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL))
+        first = api_client.post('/store/orders/', {'cart_id': str(cart.id)}, HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        with django_assert_num_queries(0):
+            retry = api_client.post('/store/orders/', {'cart_id': str(cart.id)}, HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        assert first.status_code == retry.status_code == status.HTTP_200_OK
+        assert retry.data == first.data
+        assert retry['Idempotent-Replayed'] == 'true'
+        assert Order.objects.count() == 1
+
+    def test_key_reused_with_another_body_returns_422(self, api_client, cart_with_item):
+        cart, _ = cart_with_item
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL))
+        api_client.post('/store/orders/', {'cart_id': str(cart.id)}, HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        response = api_client.post('/store/orders/', {'cart_id': str(baker.make(Cart).id)}, HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        assert response.status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+
+    def test_failed_requests_are_not_stored(self, api_client):
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL))
+        cart = baker.make(Cart)
+
+        empty = api_client.post('/store/orders/', {'cart_id': str(cart.id)}, HTTP_IDEMPOTENCY_KEY='checkout-1')
+        product = baker.make(Product, inventory=10)
+        baker.make(CartItem, cart=cart, product=product, quantity=1)
+        retry = api_client.post('/store/orders/', {'cart_id': str(cart.id)}, HTTP_IDEMPOTENCY_KEY='checkout-1')
+
+        assert empty.status_code == status.HTTP_400_BAD_REQUEST
+        assert retry.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestIdempotentCartItems:
+    def test_retried_add_counts_once(self, api_client, cart_with_item):
+        cart, product = cart_with_item
+        url = f'/store/carts/{cart.id}/items/'
+
+        for _ in range(3):
+            response = api_client.post(url, {'product_id': product.id, 'quantity': 2}, HTTP_IDEMPOTENCY_KEY='add-1')
+
+        assert response.data['quantity'] == 3
+        assert CartItem.objects.get(cart=cart, product=product).quantity == 3
+
+    def test_retried_batch_counts_once(self, api_client, cart_with_item):
+        cart, product = cart_with_item
+        url = f'/store/carts/{cart.id}/items/batch/'
+        data = {'items': [{'product_id': product.id, 'quantity': 2}]}
+
+        api_client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='batch-1')
+        api_client.post(url, data, format='json', HTTP_IDEMPOTENCY_KEY='batch-1')
+
+        assert CartItem.objects.get(cart=cart, product=product).quantity == 3
+
+    def test_duplicate_waits_for_the_request_in_flight(self, api_client, cart_with_item):
+        cart, product = cart_with_item
+        url = f'/store/carts/{cart.id}/items/'
+        cache_key = get_cache_key(url, 'add-1')
+        body = f'product_id={product.id}&quantity=2'
+        # Another request holds the key and stores its response a moment later
+        cache.add(f'{cache_key}:lock', 'other', idempotency.LOCK_TIMEOUT)
+        stored = {
+            'fingerprint': hashlib.sha256(body.encode('utf-8')).hexdigest(),
+            'status': status.HTTP_201_CREATED,
+            'data': {'id': 1, 'product_id': product.id, 'quantity': 7},
+            'headers': {}
+        }
+        timer = Timer(0.2, lambda: cache.set(cache_key, stored))
+        timer.start()
+
+        response = api_client.post(url, body,
+                                   content_type='application/x-www-form-urlencoded', HTTP_IDEMPOTENCY_KEY='add-1')
+        timer.join()
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data['quantity'] == 7
+        assert CartItem.objects.get(cart=cart, product=product).quantity == 1
+
+    def test_request_in_flight_for_too_long_returns_409(self, api_client, cart_with_item, monkeypatch):
+        monkeypatch.setattr(idempotency, 'WAIT_TIMEOUT', 0.1)
+        cart, product = cart_with_item
+        url = f'/store/carts/{cart.id}/items/'
+        cache.add(f'{get_cache_key(url, "add-1")}:lock', 'other', idempotency.LOCK_TIMEOUT)
+
+        response = api_client.post(url, {'product_id': product.id, 'quantity': 2}, HTTP_IDEMPOTENCY_KEY='add-1')
+
+        assert response.status_code == status.HTTP_409_CONFLICT
@@ -0,0 +1,118 @@
+from datetime import date, datetime, timezone as dt_timezone
+from decimal import Decimal
+from django.conf import settings
+from rest_framework import status
+import pytest
+from store.models import Collection, Order, OrderItem, Product, ProductSales
+from store.signals import order_created
+from model_bakery import baker
+
+
+@pytest.fixture
+def place_order():
+    customer = baker.make(settings.AUTH_USER_MODEL).customer
+    def do_place_order(items, placed_at=None):
+        order = baker.make(Order, customer=customer)
+        if placed_at is not None:
+            Order.objects.filter(pk=order.pk).update(placed_at=placed_at)
+            order.refresh_from_db()
+        for product, quantity, unit_price in items:
+            baker.make(OrderItem, order=order, product=product, quantity=quantity, unit_price=Decimal(unit_price))
+        order_created.send_robust(None, order=order)
+        return order
+    return do_place_order
+
+
+@pytest.mark.django_db
+class TestLeaderboardRollups:
+    def test_order_created_adds_items_to_every_period(self, place_order):
+        product = baker.make(Product)
+        place_order([(product, 2, '5.00')], placed_at=datetime(2024, 5, 15, 12, tzinfo=dt_timezone.utc))
+        place_order([(product, 1, '5.00')], placed_at=datetime(2024, 5, 16, 12, tzinfo=dt_timezone.utc))
+
+        rows = ProductSales.objects.filter(product=product).values_list('period', 'period_start', 'units', 'revenue')
+
+        assert sorted(rows) == [
+            ('A', date(1970, 1, 1), 3, Decimal('15.00')),
+            ('D', date(2024, 5, 15), 2, Decimal('10.00')),
+            ('D', date(2024, 5, 16), 1, Decimal('5.00')),
+            ('M', date(2024, 5, 1), 3, Decimal('15.00')),
+            ('W', date(2024, 5, 13), 3, Decimal('15.00'))
+        ]
+
+    def test_rebuild_matches_incremental_rollups(self, place_order):
+        from store import leaderboards
+        first, second = baker.make(Product, _quantity=2)
+        place_order([(first, 2, '5.00'), (second, 1, '3.00')])
+        place_order([(second, 4, '3.00')])
+        incremental = set(ProductSales.objects.values_list('period', 'period_start', 'product_id', 'units', 'revenue'))
+
+        leaderboards.rebuild()
+
+        assert set(ProductSales.objects.values_list('period', 'period_start', 'product_id', 'units', 'revenue')) == incremental
+
+    def test_failed_increments_are_logged_and_caught_up_by_the_task(self, monkeypatch, caplog):
+        from store import leaderboards
+        from store.signals import send_order_created
+        from store.tasks import rebuild_leaderboards
+        order = baker.make(Order, customer=baker.make(settings.AUTH_USER_MODEL).customer)
+        baker.make(OrderItem, order=order, quantity=2, unit_price=Decimal('5.00'))
+        def add_order(order):
+            raise RuntimeError('lock wait timeout')
+        monkeypatch.setattr(leaderboards, 'add_order', add_order)
+
+        send_order_created(Order, order)
+        monkeypatch.undo()
+
+        assert f'add_order_to_leaderboards failed for order {order.pk}' in caplog.text
+        assert not ProductSales.objects.exists()
+        rebuild_leaderboards()
+        assert set(ProductSales.objects.values_list('units', flat=True)) == {2}
+
+    def test_moving_a_product_moves_its_sales(self, place_order):
+        product = baker.make(Product)
+        place_order([(product, 1, '5.00')])
+        collection = baker.make(Collection)
+
+        product.collection = collection
+        product.save()
+
+        assert set(ProductSales.objects.values_list('collection_id', flat=True)) == {collection.id}
+
+
+@pytest.mark.django_db
+class TestRetrieveLeaderboard:
+    def test_if_user_is_not_admin_returns_403(self, api_client, authenticate):
+        authenticate(is_staff=False)
+
+        response = api_client.get('/store/leaderboards/')
+
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_if_params_are_invalid_returns_400(self, api_client, authenticate):
+        authenticate(is_staff=True)
+
+        response = api_client.get('/store/leaderboards/?period=year&limit=0&date=2024-02-30')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert set(response.data) == {'period', 'limit', 'date'}
+
+    def test_returns_top_products_in_one_query(self, api_client, authenticate, place_order, django_assert_num_queries):
+        authenticate(is_staff=True)
+        bread, milk, jam = baker.make(Product, _quantity=3)
+        place_order([(bread, 1, '10.00'), (milk, 5, '1.00'), (jam, 1, '2.00')])
+
+        with django_assert_num_queries(1):
+            response = api_client.get('/store/leaderboards/?period=month&limit=2')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [row['product']['id'] for row in response.data['results']] == [bread.id, milk.id]
+
+    def test_filters_by_collection_and_metric(self, api_client, authenticate, place_order):
+        authenticate(is_staff=True)
+        bread, milk = baker.make(Product, _quantity=2)
+        place_order([(bread, 1, '10.00'), (milk, 5, '1.00')])
+
+        response = api_client.get(f'/store/leaderboards/?metric=units&collection_id={milk.collection_id}')
+
+        assert [(row['product']['id'], row['units']) for row in response.data['results']] == [(milk.id, 5)]
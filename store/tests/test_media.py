@@ -0,0 +1,86 @@
+import pytest
+from rest_framework import status
+
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def media_file(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    (tmp_path / 'store').mkdir()
+    (tmp_path / 'store' / 'photo.jpg').write_bytes(CONTENT)
+    return '/media/store/photo.jpg'
+
+
+def read(response):
+    return b''.join(response.streaming_content)
+
+
+class TestServeMedia:
+    def test_serves_the_whole_file(self, client, media_file):
+        response = client.get(media_file)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert read(response) == CONTENT
+        assert response['Content-Type'] == 'image/jpeg'
+        assert response['Accept-Ranges'] == 'bytes'
+        assert response['ETag'] and response['Last-Modified']
+
+    def test_if_file_does_not_exist_returns_404(self, client, media_file):
+        assert client.get('/media/store/missing.jpg').status_code == status.HTTP_404_NOT_FOUND
+        assert client.get('/media/../settings.py').status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.parametrize('header, start, end', [
+        ('bytes=0-99', 0, 99),
+        ('bytes=1000-', 1000, 1023),
+        ('bytes=-24', 1000, 1023),
+        ('bytes=1000-5000', 1000, 1023)
+    ])
+    def test_serves_byte_ranges(self, client, media_file, header, start, end):
+        response = client.get(media_file, HTTP_RANGE=header)
+
+        assert response.status_code == status.HTTP_206_PARTIAL_CONTENT
+        assert response['Content-Range'] == f'bytes {start}-{end}/1024'
+        assert int(response['Content-Length']) == end - start + 1
+        assert read(response) == CONTENT[start:end + 1]
+
+    def test_if_range_is_unsatisfiable_returns_416(self, client, media_file):
+        response = client.get(media_file, HTTP_RANGE='bytes=2000-')
+
+        assert response.status_code == status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        assert response['Content-Range'] == 'bytes */1024'
+
+    def test_if_range_is_stale_serves_the_whole_file(self, client, media_file):
+        response = client.get(media_file, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"old"')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert read(response) == CONTENT
+
+    def test_if_etag_matches_returns_304(self, client, media_file):
+        etag = client.get(media_file)['ETag']
+
+        response = client.get(media_file, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_offloads_to_nginx_when_configured(self, client, media_file, settings):
+        settings.MEDIA_OFFLOAD = 'x-accel-redirect'
+
+        response = client.get(media_file)
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response['X-Accel-Redirect'] == '/protected-media/store/photo.jpg'
+        assert response.content == b''
+
+    def test_fingerprinted_files_are_cached_forever(self, client, settings, tmp_path):
+        from store.storage import IMMUTABLE_CACHE_CONTROL
+        settings.MEDIA_ROOT = str(tmp_path)
+        name = 'ab/' + 'ab' * 32 + '.png'
+        (tmp_path / 'ab').mkdir()
+        (tmp_path / name).write_bytes(b'png')
+
+        response = client.get('/media/' + name)
+
+        assert response['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+        assert response['ETag'] == '"%s"' % ('ab' * 32)
@@ -0,0 +1,302 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from threading import Barrier
+from django.conf import settings
+from django.db import OperationalError, connection, connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+import pytest
+from store.models import Cart, CartItem, Order, OrderItem, OrderTicket, Product
+from model_bakery import baker
+
+
+@pytest.mark.django_db
+class TestListOrders:
+    def test_if_user_anonymous_returns_401(self, api_client):
+        response = api_client.get('/store/orders/')
+
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_sparse_fieldset_skips_items(self, api_client, authenticate):
+        # Customers are created by a signal when their user is saved
+        customer = baker.make(settings.AUTH_USER_MODEL).customer
+        order = baker.make(Order, customer=customer)
+        baker.make(OrderItem, order=order)
+        authenticate(is_staff=True)
+
+        response = api_client.get('/store/orders/?fields=id,payment_status')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [{'id': order.pk, 'payment_status': order.payment_status}]
+
+
+    def test_customer_orders_make_a_fixed_number_of_queries(self, api_client, assert_query_budget):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        baker.make(Order, customer=baker.make(settings.AUTH_USER_MODEL).customer)
+        api_client.force_authenticate(user=user)
+
+        def add_orders(size):
+            for order in baker.make(Order, customer=user.customer, _quantity=size):
+                baker.make(OrderItem, order=order, _quantity=2)
+
+        # The orders (customer joined) and their items with products
+        assert_query_budget(add_orders, lambda: api_client.get('/store/orders/'), max_queries=2)
+        assert len(api_client.get('/store/orders/').data) == 14
+
+    def test_staff_orders_make_a_fixed_number_of_queries(self, api_client, authenticate, assert_query_budget):
+        authenticate(is_staff=True)
+
+        def add_orders(size):
+            customer = baker.make(settings.AUTH_USER_MODEL).customer
+            for order in baker.make(Order, customer=customer, _quantity=size):
+                baker.make(OrderItem, order=order, _quantity=3)
+
+        assert_query_budget(add_orders, lambda: api_client.get('/store/orders/'), max_queries=2)
+
+    def test_order_items_make_a_fixed_number_of_queries(self, api_client, assert_query_budget):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        order = baker.make(Order, customer=user.customer)
+        api_client.force_authenticate(user=user)
+
+        assert_query_budget(
+            lambda size: baker.make(OrderItem, order=order, _quantity=size),
+            lambda: api_client.get(f'/store/orders/{order.id}/'),
+            max_queries=2)
+
+    def test_token_customer_id_scopes_orders(self, api_client):
+        user = baker.make(settings.AUTH_USER_MODEL, username='jane')
+        user.set_password('secret-pass')
+        user.save()
+        order = baker.make(Order, customer=user.customer)
+        baker.make(Order, customer=baker.make(settings.AUTH_USER_MODEL).customer)
+        token = api_client.post('/auth/jwt/create/', {'username': 'jane', 'password': 'secret-pass'}).data['access']
+
+        api_client.credentials(HTTP_AUTHORIZATION=f'JWT {token}')
+        response = api_client.get('/store/orders/')
+
+        assert [row['id'] for row in response.data] == [order.id]
+
+@pytest.fixture
+def make_cart():
+    def do_make_cart(items):
+        cart = baker.make(Cart)
+        for product, quantity in items:
+            baker.make(CartItem, cart=cart, product=product, quantity=quantity)
+        return cart
+    return do_make_cart
+
+@pytest.fixture
+def checkout(api_client, make_cart):
+    def do_checkout(user, items):
+        cart = make_cart(items)
+        api_client.force_authenticate(user=user)
+        return cart, api_client.post('/store/orders/', {'cart_id': str(cart.id)})
+    return do_checkout
+
+
+@pytest.mark.django_db
+class TestCreateOrder:
+    def test_takes_inventory_and_deletes_the_cart(self, checkout):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        first = baker.make(Product, inventory=5, unit_price=Decimal('3'))
+        second = baker.make(Product, inventory=2, unit_price=Decimal('7'))
+
+        cart, response = checkout(user, [(first, 2), (second, 2)])
+
+        assert response.status_code == status.HTTP_200_OK
+        order = Order.objects.get(pk=response.data['id'])
+        assert sorted(order.items.values_list('product_id', 'quantity', 'unit_price')) == [
+            (first.id, 2, Decimal('3')), (second.id, 2, Decimal('7'))]
+        assert dict(Product.objects.values_list('id', 'inventory')) == {first.id: 3, second.id: 0}
+        assert not Cart.objects.filter(pk=cart.pk).exists()
+
+    def test_if_inventory_is_short_nothing_is_written(self, checkout):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        first = baker.make(Product, inventory=5)
+        second = baker.make(Product, inventory=1)
+
+        cart, response = checkout(user, [(first, 2), (second, 2)])
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not Order.objects.exists()
+        assert dict(Product.objects.values_list('id', 'inventory')) == {first.id: 5, second.id: 1}
+        assert CartItem.objects.filter(cart=cart).count() == 2
+
+    def test_cached_product_responses_show_the_new_inventory(self, api_client, checkout,
+                                                              django_capture_on_commit_callbacks):
+        product = baker.make(Product, inventory=5)
+        before = api_client.get(f'/store/products/{product.id}/')
+        api_client.get(f'/store/products/{product.id}/')
+
+        with django_capture_on_commit_callbacks(execute=True):
+            checkout(baker.make(settings.AUTH_USER_MODEL), [(product, 2)])
+        api_client.force_authenticate(user=None)
+        after = api_client.get(f'/store/products/{product.id}/', HTTP_IF_NONE_MATCH=before['ETag'])
+
+        assert after.status_code == status.HTTP_200_OK
+        assert after.data['inventory'] == 3
+        assert after['ETag'] != before['ETag']
+
+    def test_queries_do_not_depend_on_cart_size(self, api_client, make_cart, assert_query_budget):
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL))
+        cart_ids = []
+
+        def add_cart(size):
+            cart_ids.append(make_cart([(product, 1) for product in baker.make(Product, inventory=10, _quantity=size)]).id)
+
+        assert_query_budget(add_cart, lambda: api_client.post('/store/orders/', {'cart_id': str(cart_ids[-1])}))
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConcurrentCheckouts:
+    CUSTOMERS = 8
+
+    def test_inventory_is_never_oversold(self):
+        from store.serializers import CreateOrderSerializer
+        users = baker.make(settings.AUTH_USER_MODEL, _quantity=self.CUSTOMERS)
+        scarce = baker.make(Product, inventory=5)
+        plenty = baker.make(Product, inventory=100)
+        carts = []
+        for user in users:
+            cart = baker.make(Cart)
+            # Half the carts list the products in the other order
+            for product in [scarce, plenty] if user.id % 2 else [plenty, scarce]:
+                baker.make(CartItem, cart=cart, product=product, quantity=1)
+            carts.append(cart)
+        barrier = Barrier(self.CUSTOMERS)
+
+        def place_order(user, cart):
+            try:
+                barrier.wait()
+                while True:
+                    serializer = CreateOrderSerializer(data={'cart_id': str(cart.id)}, context={'user_id': user.id})
+                    try:
+                        serializer.is_valid(raise_exception=True)
+                        serializer.save()
+                        return True
+                    except ValidationError:
+                        return False
+                    except OperationalError:
+                        # SQLite's in-memory test database refuses concurrent writers ("locked"); the transaction
+                        # rolled back, so it's retried
+                        time.sleep(0.001)
+            finally:
+                connections.close_all()
+
+        with ThreadPoolExecutor(self.CUSTOMERS) as executor:
+            placed = list(executor.map(place_order, users, carts))
+
+        assert placed.count(True) == 5
+        assert Order.objects.count() == 5
+        assert dict(Product.objects.values_list('id', 'inventory')) == {scarce.id: 0, plenty.id: 95}
+        assert OrderItem.objects.filter(product=scarce).count() == 5
+
+
+@pytest.mark.django_db
+class TestAsyncCheckout:
+    @pytest.fixture(autouse=True)
+    def async_placement(self, settings):
+        settings.ORDER_PLACEMENT = 'async'
+
+    def test_files_a_ticket_that_a_worker_places(self, api_client, checkout):
+        from store import orders
+        user = baker.make(settings.AUTH_USER_MODEL)
+        product = baker.make(Product, inventory=3)
+
+        cart, response = checkout(user, [(product, 2)])
+
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert response.data['status'] == OrderTicket.STATUS_PENDING
+        assert response['Location'].endswith(f'/store/order-tickets/{response.data["id"]}/')
+        assert not Order.objects.exists()
+
+        assert orders.place_tickets(batch_size=10) == 1
+
+        ticket = api_client.get(f'/store/order-tickets/{response.data["id"]}/').data
+        assert ticket['status'] == OrderTicket.STATUS_PLACED
+        order = Order.objects.get(pk=ticket['order_id'])
+        assert list(order.items.values_list('product_id', 'quantity')) == [(product.id, 2)]
+        assert Product.objects.get(pk=product.pk).inventory == 1
+        assert not Cart.objects.filter(pk=cart.pk).exists()
+
+    def test_filing_queues_a_worker_run(self, checkout, django_capture_on_commit_callbacks):
+        user = baker.make(settings.AUTH_USER_MODEL)
+        product = baker.make(Product, inventory=3)
+
+        # The eager_celery fixture runs the queued task in the test
+        with django_capture_on_commit_callbacks(execute=True):
+            _, response = checkout(user, [(product, 1)])
+
+        assert OrderTicket.objects.get(pk=response.data['id']).status == OrderTicket.STATUS_PLACED
+
+    def test_short_inventory_fails_the_ticket(self, checkout):
+        from store import orders
+        user = baker.make(settings.AUTH_USER_MODEL)
+        product = baker.make(Product, inventory=1)
+        _, response = checkout(user, [(product, 2)])
+
+        orders.place_tickets(batch_size=10)
+
+        ticket = OrderTicket.objects.get(pk=response.data['id'])
+        assert ticket.status == OrderTicket.STATUS_FAILED
+        assert 'inventory' in ticket.error
+        assert not Order.objects.exists()
+
+    def test_places_tickets_in_batches(self, checkout):
+        from store import orders
+        product = baker.make(Product, inventory=10)
+        for user in baker.make(settings.AUTH_USER_MODEL, _quantity=5):
+            checkout(user, [(product, 1)])
+
+        assert orders.place_tickets(batch_size=2) == 5
+        assert Order.objects.count() == 5
+        assert not OrderTicket.objects.exclude(status=OrderTicket.STATUS_PLACED).exists()
+
+    def test_unexpected_errors_put_the_ticket_back_to_pending(self, checkout, monkeypatch):
+        from store import orders
+        product = baker.make(Product, inventory=10)
+        for user in baker.make(settings.AUTH_USER_MODEL, _quantity=2):
+            checkout(user, [(product, 1)])
+        def create_order(customer_id, cart_id):
+            raise RuntimeError('database went away')
+        monkeypatch.setattr(orders, 'create_order', create_order)
+
+        assert orders.place_tickets(batch_size=1) == 2
+
+        assert set(OrderTicket.objects.values_list('status', flat=True)) == {OrderTicket.STATUS_PENDING}
+
+    def test_a_reclaimed_ticket_keeps_the_other_workers_outcome(self, checkout):
+        from store import orders
+        product = baker.make(Product, inventory=10)
+        _, response = checkout(baker.make(settings.AUTH_USER_MODEL), [(product, 1)])
+        [stale] = orders.claim_tickets(batch_size=1)
+        # The claim timed out and another worker placed the ticket
+        OrderTicket.objects.filter(pk=stale.pk).update(status=OrderTicket.STATUS_PENDING)
+        [ticket] = orders.claim_tickets(batch_size=1)
+        orders.place_ticket(ticket)
+
+        orders.place_ticket(stale)
+
+        ticket = OrderTicket.objects.get(pk=response.data['id'])
+        assert (ticket.status, ticket.error) == (OrderTicket.STATUS_PLACED, '')
+        assert Order.objects.count() == 1
+
+    def test_other_customers_tickets_return_404(self, api_client, checkout):
+        product = baker.make(Product, inventory=10)
+        _, response = checkout(baker.make(settings.AUTH_USER_MODEL), [(product, 1)])
+
+        api_client.force_authenticate(user=baker.make(settings.AUTH_USER_MODEL))
+        other = api_client.get(f'/store/order-tickets/{response.data["id"]}/')
+
+        assert other.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_long_polling_returns_when_the_wait_ends(self, api_client, checkout):
+        product = baker.make(Product, inventory=10)
+        _, response = checkout(baker.make(settings.AUTH_USER_MODEL), [(product, 1)])
+
+        polled = api_client.get(f'/store/order-tickets/{response.data["id"]}/?wait=0.3')
+
+        assert polled.status_code == status.HTTP_200_OK
+        assert polled.data['status'] == OrderTicket.STATUS_PENDING
@@ -0,0 +1,49 @@
+from decimal import Decimal
+from rest_framework import status
+import pytest
+from store.models import Product, Collection, Promotion
+from model_bakery import baker
+
+
+@pytest.mark.django_db
+class TestProductPricing:
+    def test_tax_rate_comes_from_collection(self, api_client):
+        collection = baker.make(Collection, tax_rate=Decimal('0.2'))
+        product = baker.make(Product, collection=collection, unit_price=Decimal('10'))
+
+        response = api_client.get(f'/store/products/{product.pk}/')
+
+        assert response.data['price_with_tax'] == Decimal('12.00')
+        assert response.data['effective_price'] == Decimal('12.00')
+
+    def test_best_promotion_is_applied(self, api_client):
+        product = baker.make(Product, unit_price=Decimal('10'))
+        product.promotions.add(
+            baker.make(Promotion, discount=0.1),
+            baker.make(Promotion, discount=0.5))
+
+        response = api_client.get(f'/store/products/{product.pk}/')
+
+        assert response.data['price_with_tax'] == Decimal('11.00')
+        assert response.data['effective_price'] == Decimal('5.50')
+
+    def test_changing_tax_rate_invalidates_cached_detail(self, api_client):
+        product = baker.make(Product, unit_price=Decimal('10'))
+        api_client.get(f'/store/products/{product.pk}/')
+
+        product.collection.tax_rate = Decimal('0')
+        product.collection.save()
+        response = api_client.get(f'/store/products/{product.pk}/')
+
+        assert response.data['price_with_tax'] == Decimal('10.00')
+
+    def test_order_and_filter_by_effective_price(self, api_client):
+        cheap = baker.make(Product, unit_price=Decimal('20'))
+        cheap.promotions.add(baker.make(Promotion, discount=0.9))
+        middle = baker.make(Product, unit_price=Decimal('10'))
+        baker.make(Product, unit_price=Decimal('50'))
+
+        response = api_client.get('/store/products/?ordering=effective_price&effective_price__lt=20')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [p['id'] for p in response.data['results']] == [cheap.pk, middle.pk]
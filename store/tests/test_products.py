@@ -1,10 +1,12 @@
+import base64
+import json
 from django.contrib.auth.models import User
 from rest_framework import status
 from rest_framework.test import APIClient
 import pytest
-from store.models import Product, Collection
+from store.models import Product, Collection, ProductImage
 from model_bakery import baker
-from decimal import Decimal
+from decimal import Decimal, ROUND_HALF_UP
 
 
 @pytest.mark.django_db
@@ -59,7 +61,8 @@ class TestCreateProduct:
             'inventory': 1,
             'collection': collection.pk,
             'images': [],
-            'price_with_tax': product['unit_price'] * Decimal(1.1)
+            'price_with_tax': Decimal('1.10'),
+            'effective_price': Decimal('1.10')
         }
 
 
@@ -82,7 +85,8 @@ class TestRetrieveProduct:
             'slug': product.slug,
             'unit_price': product.unit_price,
             'images': [],
-            'price_with_tax': product.unit_price * Decimal(1.1)
+            'price_with_tax': (product.unit_price * Decimal('1.1')).quantize(Decimal('0.01'), ROUND_HALF_UP),
+            'effective_price': (product.unit_price * Decimal('1.1')).quantize(Decimal('0.01'), ROUND_HALF_UP)
         }
 
     def test_if_product_not_existing_returns_404(self, api_client):
@@ -91,3 +95,98 @@ class TestRetrieveProduct:
         response = api_client.get(f'/store/products/{non_existing_product_id}/')
 
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestListProducts:
+    def test_default_pagination_returns_count(self, api_client):
+        baker.make(Product, _quantity=3)
+
+        response = api_client.get('/store/products/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data['count'] == 3
+
+    def test_cursor_pagination_walks_every_product_once(self, api_client):
+        collection = baker.make(Collection)
+        for price in [5, 5, 5, 7, 2, 9, 9, 3, 5, 1, 8, 5]:
+            baker.make(Product, collection=collection, unit_price=price)
+
+        seen = []
+        url = '/store/products/?pagination=cursor&ordering=-unit_price'
+        while url:
+            response = api_client.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            assert 'count' not in response.data
+            seen += [(p['unit_price'], p['id']) for p in response.data['results']]
+            url = response.data['next']
+
+        assert len(seen) == 12
+        assert seen == sorted(seen, reverse=True)
+
+    def test_cursor_pagination_previous_link_returns_previous_page(self, api_client):
+        baker.make(Product, _quantity=15)
+
+        first = api_client.get('/store/products/?pagination=cursor')
+        second = api_client.get(first.data['next'])
+        previous = api_client.get(second.data['previous'])
+
+        assert len(second.data['results']) == 5
+        assert previous.data['results'] == first.data['results']
+
+    def test_if_cursor_is_invalid_returns_404(self, api_client):
+        response = api_client.get('/store/products/?cursor=garbage')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    @pytest.mark.parametrize('ordering, value', [
+        ('unit_price', 'abc'), ('-price_with_tax', 'NaN'), ('last_update', 'yesterday'), ('unit_price', None)
+    ])
+    def test_if_cursor_value_is_tampered_returns_404(self, api_client, ordering, value):
+        baker.make(Product)
+        position = {'v': value, 'id': 1, 'r': False}
+        cursor = base64.urlsafe_b64encode(json.dumps(position).encode('ascii')).decode('ascii')
+
+        response = api_client.get(f'/store/products/?ordering={ordering}&cursor={cursor}')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_queries_do_not_grow_with_images(self, api_client, assert_query_budget):
+        def add_products(size):
+            for product in baker.make(Product, _quantity=size):
+                baker.make(ProductImage, product=product, image='store/images/a.png', _quantity=2)
+
+        assert_query_budget(add_products, lambda: api_client.get('/store/products/?page_size=100'))
+
+
+@pytest.mark.django_db
+class TestSparseFieldsets:
+    def test_fields_keeps_only_listed_fields(self, api_client):
+        product = baker.make(Product)
+
+        response = api_client.get('/store/products/?fields=id,title,unit_price')
+
+        assert response.data['results'] == [
+            {'id': product.pk, 'title': product.title, 'unit_price': product.unit_price}
+        ]
+
+    def test_omit_drops_listed_fields(self, api_client):
+        product = baker.make(Product)
+
+        response = api_client.get(f'/store/products/{product.pk}/?omit=description,images')
+
+        assert 'description' not in response.data
+        assert 'images' not in response.data
+        assert response.data['price_with_tax'] == (product.unit_price * Decimal('1.1')).quantize(Decimal('0.01'), ROUND_HALF_UP)
+
+    def test_unrequested_images_are_not_prefetched(self, api_client, django_assert_num_queries):
+        baker.make(Product, _quantity=3)
+
+        # count and page
+        with django_assert_num_queries(2):
+            api_client.get('/store/products/?fields=id,title')
+
+    def test_if_field_is_unknown_returns_400(self, api_client):
+        response = api_client.get('/store/products/?fields=id,colour')
+
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,70 @@
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import status
+import pytest
+from store import recommendations
+from store.models import Order, OrderItem, Product, ProductPair
+from model_bakery import baker
+
+
+@pytest.fixture
+def place_order():
+    customer = baker.make(settings.AUTH_USER_MODEL).customer
+    def do_place_order(*products, age=timedelta(hours=1)):
+        order = baker.make(Order, customer=customer)
+        # placed_at is auto_now_add, so it's moved back afterwards
+        Order.objects.filter(pk=order.pk).update(placed_at=timezone.now() - age)
+        for product in products:
+            baker.make(OrderItem, order=order, product=product)
+        return order
+    return do_place_order
+
+
+@pytest.mark.django_db
+class TestUpdateRecommendations:
+    def test_ranks_products_by_orders_bought_together(self, place_order):
+        milk, bread, eggs, jam = baker.make(Product, _quantity=4)
+        place_order(milk, bread, eggs)
+        place_order(milk, bread)
+        place_order(bread, jam)
+
+        recommendations.update_recommendations()
+
+        assert list(milk.recommendations.values_list('recommended_id', 'orders')) == [(bread.id, 2), (eggs.id, 1)]
+        assert list(bread.recommendations.values_list('recommended_id', 'position')) == [(milk.id, 0), (eggs.id, 1), (jam.id, 2)]
+
+    def test_adds_only_new_orders_to_the_counts(self, place_order):
+        milk, bread = baker.make(Product, _quantity=2)
+        place_order(milk, bread)
+        recommendations.update_recommendations()
+        place_order(milk, bread)
+
+        recommendations.update_recommendations()
+        recommendations.update_recommendations()
+
+        assert ProductPair.objects.get(product=milk, related=bread).orders == 2
+
+    def test_skips_orders_that_may_not_be_committed_yet(self, place_order):
+        milk, bread = baker.make(Product, _quantity=2)
+        place_order(milk, bread, age=timedelta(0))
+
+        assert recommendations.update_recommendations() == 0
+        assert not ProductPair.objects.exists()
+
+
+@pytest.mark.django_db
+class TestRetrieveRecommendations:
+    def test_returns_neighbours_in_one_query(self, api_client, place_order, django_assert_num_queries):
+        milk, bread = baker.make(Product, _quantity=2)
+        place_order(milk, bread)
+        recommendations.update_recommendations()
+
+        with django_assert_num_queries(1):
+            response = api_client.get(f'/store/products/{milk.id}/recommendations/')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [{
+            'product': {'id': bread.id, 'title': bread.title, 'unit_price': bread.unit_price},
+            'orders': 1
+        }]
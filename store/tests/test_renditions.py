@@ -0,0 +1,115 @@
+import io
+import pytest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from model_bakery import baker
+from PIL import Image
+from rest_framework import status
+from store.models import Product, ProductImage
+
+
+@pytest.fixture
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    return tmp_path
+
+@pytest.fixture
+def make_image(media_root):
+    def do_make_image(size=(1200, 600)):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, format='JPEG')
+        upload = SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+        return baker.make(ProductImage, product=baker.make(Product), image=upload)
+    return do_make_image
+
+
+@pytest.mark.django_db
+class TestRenditions:
+    def test_generates_every_size_and_webp(self, make_image, media_root):
+        from store import renditions
+        image = make_image()
+
+        files = renditions.generate(image)
+
+        assert set(files) == set(renditions.NAMES)
+        with Image.open(media_root / files['small']) as small:
+            assert (small.format, small.size) == ('JPEG', (400, 200))
+        with Image.open(media_root / files['thumbnail_webp']) as thumbnail:
+            assert (thumbnail.format, thumbnail.size) == ('WEBP', (150, 75))
+        image.refresh_from_db()
+        assert renditions.is_current(image)
+
+    def test_replacing_the_image_makes_renditions_stale(self, make_image):
+        from store import renditions
+        image = make_image()
+        renditions.generate(image)
+
+        image.image.name = 'store/images/other.jpg'
+
+        assert not renditions.is_current(image)
+
+    def test_missing_renditions_link_to_the_generating_endpoint(self, api_client, make_image):
+        image = make_image()
+
+        response = api_client.get(f'/store/products/{image.product_id}/')
+
+        url = response.data['images'][0]['renditions']['medium']
+        assert url.endswith(f'/store/products/{image.product_id}/images/{image.id}/renditions/medium/')
+
+    def test_endpoint_queues_generation_and_redirects_to_the_original(self, api_client, make_image, monkeypatch):
+        queued = []
+        monkeypatch.setattr('store.views.queue_renditions', queued.extend)
+        image = make_image()
+
+        url = f'/store/products/{image.product_id}/images/{image.id}/renditions/medium_webp/'
+        response = api_client.get(url)
+        api_client.get(url)
+
+        assert response.status_code == status.HTTP_302_FOUND
+        assert response['Location'].endswith(image.image.name)
+        assert queued == [image.id]
+        image.refresh_from_db()
+        assert image.renditions == {}
+
+    def test_endpoint_generates_for_staff_and_redirects(self, api_client, authenticate, make_image):
+        authenticate(is_staff=True)
+        image = make_image()
+
+        response = api_client.get(f'/store/products/{image.product_id}/images/{image.id}/renditions/medium_webp/')
+
+        assert response.status_code == status.HTTP_302_FOUND
+        assert response['Location'].endswith('.webp')
+        image.refresh_from_db()
+        assert image.renditions['files']['medium_webp'] in response['Location']
+
+    def test_generated_renditions_are_linked_directly(self, api_client, make_image):
+        from store import renditions
+        image = make_image()
+        renditions.generate(image)
+
+        response = api_client.get(f'/store/products/?fields=id,images')
+
+        urls = response.data['results'][0]['images'][0]['renditions']
+        assert urls['thumbnail'].endswith('.jpg')
+        assert urls['thumbnail_webp'].endswith('.webp')
+
+    def test_if_rendition_is_unknown_returns_404(self, api_client, make_image):
+        image = make_image()
+
+        response = api_client.get(f'/store/products/{image.product_id}/images/{image.id}/renditions/huge/')
+
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestContentAddressedStorage:
+    def test_identical_uploads_share_one_fingerprinted_file(self, media_root):
+        from store.storage import is_fingerprinted
+        first = baker.make(ProductImage, image=SimpleUploadedFile('a.PNG', b'same bytes'))
+        second = baker.make(ProductImage, image=SimpleUploadedFile('b.png', b'same bytes'))
+        other = baker.make(ProductImage, image=SimpleUploadedFile('a.png', b'other bytes'))
+
+        assert first.image.name == second.image.name
+        assert first.image.name != other.image.name
+        assert first.image.name.startswith('store/images/') and first.image.name.endswith('.png')
+        assert is_fingerprinted(first.image.name)
+        assert len(list(media_root.glob('store/images/*/*.png'))) == 2
@@ -0,0 +1,55 @@
+from django.db import connection
+from rest_framework import status
+import pytest
+from store import search
+from store.models import Product, Collection
+from tags.models import Tag, TaggedItem
+from model_bakery import baker
+
+
+@pytest.mark.django_db
+class TestSearchProducts:
+    def test_matches_title_prefix(self, api_client):
+        coffee = baker.make(Product, title='Coffee Beans')
+        baker.make(Product, title='Bread')
+
+        response = api_client.get('/store/products/?search=cof')
+
+        assert response.status_code == status.HTTP_200_OK
+        assert [p['id'] for p in response.data['results']] == [coffee.pk]
+
+    def test_title_matches_rank_above_description_matches(self, api_client):
+        in_description = baker.make(Product, title='Mug', description='Great for coffee')
+        in_title = baker.make(Product, title='Coffee', description='Dark roast')
+
+        response = api_client.get('/store/products/?search=coffee')
+
+        assert [p['id'] for p in response.data['results']] == [in_title.pk, in_description.pk]
+
+    def test_matches_collection_title_and_tags(self, api_client):
+        product = baker.make(Product, title='Espresso', collection=baker.make(Collection, title='Beverages'))
+        TaggedItem.objects.create(tag=baker.make(Tag, label='organic'), content_object=product)
+
+        by_collection = api_client.get('/store/products/?search=beverages')
+        by_tag = api_client.get('/store/products/?search=organic')
+
+        assert [p['id'] for p in by_collection.data['results']] == [product.pk]
+        assert [p['id'] for p in by_tag.data['results']] == [product.pk]
+
+    def test_index_follows_updates_and_deletes(self, api_client):
+        product = baker.make(Product, title='Coffee')
+        product.title = 'Tea'
+        product.save()
+        deleted = baker.make(Product, title='Tea cups')
+        deleted.delete()
+
+        coffee = api_client.get('/store/products/?search=coffee')
+        tea = api_client.get('/store/products/?search=tea')
+
+        assert coffee.data['count'] == 0
+        assert [p['id'] for p in tea.data['results']] == [product.pk]
+
+    def test_mysql_query_requires_every_term_and_prefixes_the_last(self, monkeypatch):
+        monkeypatch.setattr(connection, 'vendor', 'mysql')
+
+        assert search.build_match_query(search.get_terms('Dark cof')) == '+dark +cof*'
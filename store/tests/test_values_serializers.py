@@ -0,0 +1,62 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from rest_framework.request import Request
+import pytest
+from store.models import Product, Collection, ProductImage
+from store.pricing import annotate_prices
+from store.serializers import CollectionSerializer, CollectionValuesSerializer, ProductSerializer, ProductValuesSerializer, SimpleProductSerializer, SimpleProductValuesSerializer
+from model_bakery import baker
+
+
+def render(data):
+    return JSONRenderer().render(data)
+
+def make_request(url='/store/products/'):
+    return Request(APIRequestFactory().get(url))
+
+
+@pytest.mark.django_db
+class TestValuesSerializers:
+    def test_product_output_is_byte_identical(self):
+        products = baker.make(Product, _quantity=3, description=None)
+        baker.make(Product, description='text')
+        baker.make(ProductImage, product=products[0], image='store/images/a.png', _quantity=2)
+        request = make_request()
+        fast = ProductValuesSerializer(context={'request': request})
+
+        products = annotate_prices(Product.objects.all())
+        expected = ProductSerializer(products.prefetch_related('images'), many=True, context={'request': request}).data
+        actual = fast.serialize(products.values(*fast.get_values_fields()))
+
+        assert render(actual) == render(expected)
+
+    def test_product_output_follows_sparse_fieldset(self):
+        baker.make(Product, _quantity=2)
+        request = make_request('/store/products/?fields=id,price_with_tax')
+        fast = ProductValuesSerializer(context={'request': request})
+
+        products = annotate_prices(Product.objects.all())
+        expected = ProductSerializer(products, many=True, context={'request': request}).data
+        actual = fast.serialize(products.values(*fast.get_values_fields()))
+
+        assert render(actual) == render(expected)
+
+    def test_simple_product_output_is_byte_identical(self):
+        baker.make(Product, _quantity=3)
+        fast = SimpleProductValuesSerializer()
+
+        expected = SimpleProductSerializer(Product.objects.all(), many=True).data
+        actual = fast.serialize(Product.objects.values(*fast.get_values_fields()))
+
+        assert render(actual) == render(expected)
+
+    def test_collection_output_is_byte_identical(self):
+        baker.make(Product, collection=baker.make(Collection), _quantity=2)
+        baker.make(Collection)
+        collections = Collection.objects.all()
+        fast = CollectionValuesSerializer()
+
+        expected = CollectionSerializer(collections, many=True).data
+        actual = fast.serialize(collections.values(*fast.get_values_fields()))
+
+        assert render(actual) == render(expected)
@@ -9,16 +9,23 @@ router.register('collections', viewset=views.CollectionViewSet, basename='collec
 router.register('carts', viewset=views.CartViewSet, basename='carts')
 router.register('customers', viewset=views.CustomerViewSet, basename='customers')
 router.register('orders', viewset=views.OrderViewSet, basename='orders')
+router.register('order-tickets', viewset=views.OrderTicketViewSet, basename='order-tickets')
 
 products_router = routers.NestedDefaultRouter(router, 'products', lookup='product') # Lookup parameter specifies the keyword argument used for looking up the parent instance.
 products_router.register('reviews', views.ReviewViewSet, basename='product-review') # Basename parameter is used to define the base name for the registered viewset. It helps in generating the URL patterns for the viewset's endpoints.
 products_router.register('images', views.ProductImageViewSet, basename='product-image')
+products_router.register('recommendations', views.ProductRecommendationViewSet, basename='product-recommendation')
 
 carts_router = routers.NestedDefaultRouter(router,'carts', lookup='cart')
 carts_router.register('items', views.CartItemViewSet, basename='cart-item')
 
 # URLConf
-urlpatterns = router.urls + products_router.urls + carts_router.urls
+urlpatterns = router.urls + products_router.urls + carts_router.urls + [
+    path('cache-stats/', views.CacheStatsView.as_view(), name='cache-stats'),
+    path('bulk/<str:kind>/', views.BulkCatalogView.as_view(), name='bulk-catalog'),
+    path('leaderboards/', views.LeaderboardView.as_view(), name='leaderboards'),
+    path('analytics/sales/', views.SalesAnalyticsView.as_view(), name='sales-analytics')
+]
 
 # urlpatterns = [
 #     router.pat
@@ -1,18 +1,34 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db.models.aggregates import Count
+from django.db.models import Prefetch
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render, get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from rest_framework.decorators import action
 from rest_framework.filters import SearchFilter, OrderingFilter
 from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework import status
-from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, UpdateModelMixin
+from rest_framework.exceptions import NotFound, ValidationError as APIValidationError
+from rest_framework.mixins import CreateModelMixin, ListModelMixin, RetrieveModelMixin, DestroyModelMixin, UpdateModelMixin
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
-from .pagination import DefaultPagination
+from . import analytics, bulk, caching, carts, customer_stats, leaderboards, orders, pricing, renditions
+from .caching import VersionedCacheMixin
+from .conditional import ConditionalGetMixin, make_etag
+from .idempotency import IdempotentMixin
+from .facets import compute_facets, DEFAULT_PRICE_BUCKET
+from .pagination import NewestFirstPagination, SelectablePagination, OptionalKeysetPagination
 from .permissions import IsAdminOrReadOnly, ViewCustomerHistoryPermission
 from .filters import ProductFilter
-from .models import Product, Collection, Order, OrderItem, Review, Cart, CartItem, Customer, ProductImage
-from .serializers import ProductSerializer, CollectionSerializer, ReviewSerializer, CartSerializer, CartItemSerializer, AddCartItemSerializer, UpdateCartItemSerializer, CustomerSerializer, OrderItemSerializer, OrderSerializer, CreateOrderSerializer, UpdateOrderSerializer, ProductImageSerializer
+from .search import ProductSearchFilter
+from .tasks import queue_renditions
+from .models import Product, Collection, Order, OrderItem, Review, Cart, CartItem, Customer, OrderTicket, ProductImage, ProductRecommendation
+from .serializers import ProductValuesSerializer, CollectionValuesSerializer, ProductSerializer, CollectionSerializer, ReviewSerializer, CartSerializer, CartSummarySerializer, CartItemSerializer, AddCartItemSerializer, AddCartItemsSerializer, UpdateCartItemSerializer, CustomerSerializer, CustomerProductStatsSerializer, CustomerStatsSerializer, OrderItemSerializer, OrderSerializer, CreateOrderSerializer, OrderTicketSerializer, UpdateOrderSerializer, ProductImageSerializer, ProductRecommendationSerializer, ProductSalesSerializer, SalesReportSerializer
 
 
 # # Unused imports, which we used earlier
@@ -33,20 +49,127 @@ from .serializers import ProductSerializer, CollectionSerializer, ReviewSerializ
 
 
 
-class ProductViewSet(ModelViewSet):
-    queryset = Product.objects.prefetch_related('images').all()
+class ValuesListModelMixin:
+    """
+    Read-only fast path for list(): the page is fetched with .values() and rendered by a ValuesSerializer,
+    so no model instances or ModelSerializer fields are built. The output matches the regular serializer.
+    """
+    values_serializer_class = None
+
+    def get_values_serializer(self):
+        return self.values_serializer_class(context=self.get_serializer_context())
+
+    def get_values_fields(self, serializer):
+        return serializer.get_values_fields()
+
+    def list(self, request, *args, **kwargs):
+        serializer = self.get_values_serializer()
+        queryset = self.filter_queryset(self.get_queryset()) \
+            .prefetch_related(None) \
+            .values(*self.get_values_fields(serializer))
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(queryset))
+
+
+class ProductViewSet(ConditionalGetMixin, VersionedCacheMixin, ValuesListModelMixin, ModelViewSet):
     serializer_class = ProductSerializer
-    filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter] # Filtering using DjangoFilterBackend
+    filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter] # Filtering using DjangoFilterBackend
     # If no custom filter needed, use filterset_fields = ['collection_id'] # Filtering using DjangoFilterBackend
     filterset_class = ProductFilter
-    pagination_class = DefaultPagination
+    pagination_class = SelectablePagination
     permission_classes = [IsAdminOrReadOnly]
     search_fields = ['title', 'description']
-    ordering_fields = ['unit_price', 'last_update']
+    ordering_fields = ['unit_price', 'last_update', 'price_with_tax', 'effective_price']
+    cache_name = 'products'
+    values_serializer_class = ProductValuesSerializer
 
     def get_serializer_context(self):
         return {'request': self.request} ## Find out
+
+    # Only load the columns (and images) that the requested sparse fieldset renders
+    def get_queryset(self):
+        queryset = Product.objects.all()
+        if self.request.method != 'GET':
+            return queryset.prefetch_related('images')
+        fields = ProductSerializer.get_requested_fields(self.request)
+        if 'images' in fields:
+            queryset = queryset.prefetch_related('images')
+        model_fields = self.with_ordering_field(ProductSerializer.get_model_fields(fields))
+        model_fields = [field for field in model_fields if field not in pricing.ANNOTATIONS]
+        return pricing.annotate_prices(queryset.only(*model_fields))
+
+    def get_values_fields(self, serializer):
+        return self.with_ordering_field(serializer.get_values_fields())
+
+    # Keyset pagination cursors read the ordering field, so it's loaded even when it isn't rendered
+    def with_ordering_field(self, fields):
+        ordering = self.request.query_params.get('ordering', '').split(',')[0].lstrip('-')
+        if ordering in self.ordering_fields and ordering not in fields:
+            fields.append(ordering)
+        return fields
+
+    # A list filtered to one collection only goes stale when that collection's products change
+    def get_list_version_keys(self, request):
+        collection_id = request.query_params.get('collection_id', '')
+        if collection_id.isdigit():
+            return [caching.collection_version_key(int(collection_id)), caching.pricing_version_key()]
+        return [caching.catalog_version_key(), caching.pricing_version_key()]
+
+    def get_detail_version_keys(self, request, pk):
+        return [caching.product_version_key(pk), caching.pricing_version_key()]
+
+    # Lists only get an ETag, from the cache version counters: saving or deleting a product (or its images and tags)
+    # bumps its collection and the catalog, and price changes bump pricing, so no query is needed
+    def get_list_validators(self, request):
+        versions = caching.get_versions(*self.get_list_version_keys(request))
+        return make_etag(request.get_host(), sorted(request.query_params.lists()), versions), None
+
+    def get_detail_validators(self, request, pk):
+        try:
+            rows = list(Product.objects.filter(pk=pk).values_list('last_update', 'images__id'))
+        except (TypeError, ValueError):
+            return None, None
+        if not rows:
+            return None, None
+        last_update = rows[0][0]
+        image_ids = sorted(image_id for _, image_id in rows if image_id is not None)
+        # Tax rate and promotion changes don't touch last_update, but they change the payload
+        last_modified = max(last_update, caching.get_pricing_changed_at())
+        return make_etag(request.get_host(), last_update, image_ids, last_modified), last_modified
     
+    # Filter sidebar data for the current filters and search: /store/products/facets/?price_bucket=10
+    @action(detail=False)
+    def facets(self, request):
+        bucket_size = request.query_params.get('price_bucket', str(DEFAULT_PRICE_BUCKET))
+        if not bucket_size.isdigit() or not 0 < int(bucket_size) <= 10000:
+            raise APIValidationError({'price_bucket': 'Must be a whole number between 1 and 10000.'})
+        # The collection counts ignore the collection filter, so they depend on every collection
+        key = self.get_response_cache_key(
+            request, 'facets', [caching.catalog_version_key(), caching.pricing_version_key()])
+        return self.cached_response(key, lambda: Response(compute_facets(
+            self.filter_queryset(self.get_queryset()), int(bucket_size), self.get_facet_collection_queryset())))
+
+    # The products the collection counts are computed from: the current filters and search except collection_id
+    def get_facet_collection_queryset(self):
+        params = self.request.query_params.copy()
+        if params.pop('collection_id', None) is None:
+            return None
+        queryset = self.filterset_class(params, self.get_queryset(), request=self.request).qs
+        return ProductSearchFilter().filter_queryset(self.request, queryset, self)
+
+    # Stock / price sync: POST [{"id": 1, "inventory": 5, "unit_price": "9.99"}, ...] (admins only)
+    @action(detail=False, methods=['post'], url_path='batch-update')
+    def batch_update(self, request):
+        rows = request.data
+        if not isinstance(rows, list) or not rows:
+            raise APIValidationError('Expected a non-empty list of {id, inventory, unit_price} objects.')
+        if len(rows) > bulk.MAX_BATCH_UPDATE:
+            raise APIValidationError(f'At most {bulk.MAX_BATCH_UPDATE} rows per request.')
+        return Response(bulk.update_products(rows))
+
     def destroy(self, request, *args, **kwargs):
         if OrderItem.objects.filter(product_id=kwargs['pk']).count() > 0:
             return Response({'error': 'Product cannot be deleted because it is associated with an order item.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
@@ -61,13 +184,23 @@ class ProductViewSet(ModelViewSet):
     #     return queryset
 
 
-class CollectionViewSet(ModelViewSet):
-    queryset = Collection.objects.annotate(product_count=Count('products'))
+class CollectionViewSet(ConditionalGetMixin, ValuesListModelMixin, ModelViewSet):
+    queryset = Collection.objects.all()
     serializer_class = CollectionSerializer
+    values_serializer_class = CollectionValuesSerializer
     permission_classes = [IsAdminOrReadOnly]
 
+    # The cache version counters already change whenever a collection or its products change
+    def get_list_validators(self, request):
+        version, = caching.get_versions(caching.catalog_version_key())
+        return make_etag('collections', version, sorted(request.query_params.lists())), None
+
+    def get_detail_validators(self, request, pk):
+        version, = caching.get_versions(caching.collection_version_key(pk))
+        return make_etag('collection', pk, version), None
+
     def destroy(self, request, *args, **kwargs):
-        if Product.objects.filter(collection_id=['pk']).count() > 0:
+        if Collection.objects.filter(pk=kwargs['pk'], product_count__gt=0).exists():
             return Response({'error': 'Collection cannot be deleted because it is associated with one or more products.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
         return super().destroy(request, *args, **kwargs)
 
@@ -82,11 +215,49 @@ class ReviewViewSet(ModelViewSet):
         return {'product_id': self.kwargs['product_pk']}
 
 
-class CartViewSet(CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
+class CartLockedMixin:
+    # A cache-backed cart stayed locked by another request (carts.CacheCartStore.lock): the client should retry
+    def handle_exception(self, exc):
+        if isinstance(exc, carts.CartLocked):
+            return Response({'detail': str(exc)}, status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+        return super().handle_exception(exc)
+
+
+class CartViewSet(CartLockedMixin, ConditionalGetMixin, CreateModelMixin, RetrieveModelMixin, DestroyModelMixin, GenericViewSet):
     queryset = Cart.objects.prefetch_related('items__product').all()
     serializer_class = CartSerializer
 
-class CartItemViewSet(ModelViewSet):
+    # Carts are read and written through the configured cart store (database or cache, see store/carts.py)
+    def create(self, request, *args, **kwargs):
+        cart = carts.get_store().create()
+        return Response(self.get_serializer(cart).data, status=status.HTTP_201_CREATED)
+
+    def get_object(self):
+        cart = carts.get_store().get(self.kwargs['pk'])
+        if cart is None:
+            raise NotFound()
+        return cart
+
+    def destroy(self, request, *args, **kwargs):
+        if not carts.get_store().delete(kwargs['pk']):
+            raise NotFound()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def get_detail_validators(self, request, pk):
+        parts = carts.get_store().get_validator_parts(pk)
+        if parts is None:
+            return None, None
+        return make_etag('cart', pk, parts), None
+
+    # Item count and total for header badges: one aggregate query, cached until the cart or a price changes
+    @action(detail=True)
+    def summary(self, request, pk):
+        summary = carts.get_summary(pk)
+        if summary is None:
+            raise NotFound()
+        return Response(CartSummarySerializer(summary).data)
+
+class CartItemViewSet(CartLockedMixin, IdempotentMixin, ModelViewSet):
     http_method_names = ['get', 'post', 'patch', 'delete']
 
     def get_serializer_class(self):
@@ -102,6 +273,30 @@ class CartItemViewSet(ModelViewSet):
     def get_serializer_context(self):
         return {'cart_id': self.kwargs['cart_pk']}
 
+    def list(self, request, *args, **kwargs):
+        items = carts.get_store().get_items(self.kwargs['cart_pk'])
+        return Response(self.get_serializer(items, many=True).data)
+
+    def get_object(self):
+        item = carts.get_store().get_item(self.kwargs['cart_pk'], self.kwargs['pk'])
+        if item is None:
+            raise NotFound()
+        return item
+
+    def perform_destroy(self, instance):
+        carts.get_store().remove_item(self.kwargs['cart_pk'], instance)
+
+    # POST /carts/<cart_pk>/items/batch/ {"items": [{"product_id": 1, "quantity": 2}, ...], "mode": "add" | "set"}
+    @action(detail=False, methods=['post'])
+    def batch(self, request, cart_pk):
+        return self.idempotent_response(request, lambda: self.add_items(request))
+
+    def add_items(self, request):
+        serializer = AddCartItemsSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        items = serializer.save()
+        return Response(AddCartItemSerializer(items, many=True).data)
+
 
 class CustomerViewSet(ModelViewSet):
     queryset = Customer.objects.all()
@@ -122,13 +317,39 @@ class CustomerViewSet(ModelViewSet):
             serializer.save()
             return Response(serializer.data)
 
+    # Reads the precomputed aggregates (customer_stats.py), and the orders newest first with keyset pagination:
+    # the same few queries for any number of orders
     @action(detail=True, permission_classes=[ViewCustomerHistoryPermission])
     def history(self, request, pk):
-        return Response('OK')
+        customer = get_object_or_404(Customer.objects.select_related('stats'), pk=pk)
+        orders = Order.objects \
+            .filter(customer=customer) \
+            .prefetch_related(Prefetch('items', queryset=get_order_items()))
+        paginator = NewestFirstPagination()
+        page = paginator.paginate_queryset(orders, request, self)
+        return Response({
+            **CustomerStatsSerializer(customer_stats.get_stats(customer)).data,
+            'top_products': CustomerProductStatsSerializer(customer_stats.get_top_products(customer.pk), many=True).data,
+            'orders': paginator.get_paginated_response(OrderSerializer(page, many=True).data).data
+        })
+
 
+# Tokens carry the customer id (core.serializers.TokenObtainPairSerializer), so orders don't look the customer up
+def get_token_customer_id(request):
+    token = request.auth
+    return token.get('customer_id') if token is not None and hasattr(token, 'get') else None
 
-class OrderViewSet(ModelViewSet):
+
+# Items with their products in one query, reading only what OrderItemSerializer outputs
+def get_order_items():
+    return OrderItem.objects \
+        .select_related('product') \
+        .only('id', 'order_id', 'unit_price', 'quantity', 'product__id', 'product__title', 'product__unit_price')
+
+
+class OrderViewSet(CartLockedMixin, IdempotentMixin, ModelViewSet):
     permission_classes = [IsAuthenticated]
+    pagination_class = OptionalKeysetPagination
     http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
 
     def get_permissions(self):
@@ -145,20 +366,199 @@ class OrderViewSet(ModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
+        queryset = Order.objects.all()
+        if self.request.method == 'GET':
+            fields = OrderSerializer.get_requested_fields(self.request)
+            if 'items' in fields:
+                queryset = queryset.prefetch_related(Prefetch('items', queryset=get_order_items()))
+            queryset = queryset.only(*OrderSerializer.get_model_fields(fields))
         if user.is_staff: 
-            return Order.objects.all()
-        
-        customer_id = Customer.objects.only('id').get(user_id=user.id)
-        return Order.objects.filter(customer_id=customer_id)
+            return queryset
+
+        customer_id = get_token_customer_id(self.request)
+        if customer_id is not None:
+            return queryset.filter(customer_id=customer_id)
+        # Joined instead of fetching the customer first
+        return queryset.filter(customer__user_id=user.id)
    
+    # Retried checkouts with the same Idempotency-Key get the first response instead of a second order
     def create(self, request, *args, **kwargs):
-        serializer = CreateOrderSerializer(data=request.data, context={'user_id': self.request.user.id})
+        return self.idempotent_response(request, lambda: self.place_order(request))
+
+    def place_order(self, request):
+        context = {'user_id': self.request.user.id, 'customer_id': get_token_customer_id(request)}
+        serializer = CreateOrderSerializer(data=request.data, context=context)
         serializer.is_valid(raise_exception=True)
+        if settings.ORDER_PLACEMENT == 'async':
+            ticket = serializer.file_ticket()
+            location = reverse('order-tickets-detail', kwargs={'pk': ticket.pk}, request=request)
+            return Response(OrderTicketSerializer(ticket).data, status=status.HTTP_202_ACCEPTED, headers={'Location': location})
         order = serializer.save()
+        order = Order.objects.prefetch_related(Prefetch('items', queryset=get_order_items())).get(pk=order.pk)
         serializer = OrderSerializer(order)
         return Response(serializer.data)
         
 
+class OrderTicketViewSet(RetrieveModelMixin, GenericViewSet):
+    """Status of an asynchronous checkout. ?wait=<seconds> long-polls until the order is placed or fails."""
+    serializer_class = OrderTicketSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        user = self.request.user
+        if user.is_staff:
+            return OrderTicket.objects.all()
+        return OrderTicket.objects.filter(customer__user_id=user.id)
+
+    def retrieve(self, request, *args, **kwargs):
+        ticket = self.get_object()
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            raise APIValidationError({'wait': 'Must be a number of seconds.'})
+        if wait > 0 and ticket.status in [OrderTicket.STATUS_PENDING, OrderTicket.STATUS_PROCESSING]:
+            orders.wait_for_ticket(ticket.pk, wait)
+            ticket = self.get_object()
+        return Response(self.get_serializer(ticket).data)
+
+
+class CacheStatsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(caching.get_stats())
+
+
+class LeaderboardView(APIView):
+    """
+    Best sellers from the sales rollups:
+    /store/leaderboards/?period=day|week|month|all&metric=revenue|units&date=2024-05-01&collection_id=3&limit=5
+    (date picks the day, week or month; it defaults to today).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        params = request.query_params
+        period = params.get('period', 'all')
+        metric = params.get('metric', 'revenue')
+        limit = params.get('limit', str(leaderboards.DEFAULT_LIMIT))
+        collection_id = params.get('collection_id')
+        errors = {}
+        if period not in leaderboards.PERIODS:
+            errors['period'] = f'Must be one of: {", ".join(leaderboards.PERIODS)}.'
+        if metric not in leaderboards.METRICS:
+            errors['metric'] = f'Must be one of: {", ".join(leaderboards.METRICS)}.'
+        if not limit.isdigit() or not 0 < int(limit) <= leaderboards.MAX_LIMIT:
+            errors['limit'] = f'Must be a whole number between 1 and {leaderboards.MAX_LIMIT}.'
+        if collection_id is not None and not collection_id.isdigit():
+            errors['collection_id'] = 'Must be a collection id.'
+        day = None
+        if params.get('date'):
+            try:
+                day = parse_date(params['date'])
+            except ValueError:
+                pass
+            if day is None:
+                errors['date'] = 'Must be a date (YYYY-MM-DD).'
+        if errors:
+            raise APIValidationError(errors)
+
+        rows = leaderboards.get_leaderboard(period, metric, day, collection_id and int(collection_id), int(limit))
+        day = day or timezone.localdate()
+        return Response({
+            'period': period,
+            'period_start': leaderboards.get_period_start(leaderboards.PERIODS[period], day),
+            'metric': metric,
+            'results': ProductSalesSerializer(rows, many=True).data
+        })
+
+
+class SalesAnalyticsView(APIView):
+    """
+    Revenue, units and average order value from the daily sales rollups:
+    /store/analytics/sales/?start=2024-05-01&end=2024-05-31&group_by=day|collection|membership&payment_status=C
+    (the last 30 days by default; payment_status takes a comma-separated list, or all, and defaults to completed).
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        params = request.query_params
+        group_by = params.get('group_by', 'day')
+        payment_status = params.get('payment_status', Order.STATUS_COMPLETED)
+        payment_statuses = None if payment_status == 'all' else payment_status.split(',')
+        start, end = analytics.get_default_range()
+        errors = {}
+        for name in ['start', 'end']:
+            if params.get(name):
+                try:
+                    day = parse_date(params[name])
+                except ValueError:
+                    day = None
+                if day is None:
+                    errors[name] = 'Must be a date (YYYY-MM-DD).'
+                elif name == 'start':
+                    start = day
+                else:
+                    end = day
+        if not errors and not 0 <= (end - start).days < analytics.MAX_DAYS:
+            errors['end'] = f'Must be on or after start, and at most {analytics.MAX_DAYS} days after it.'
+        if group_by not in analytics.GROUPS:
+            errors['group_by'] = f'Must be one of: {", ".join(analytics.GROUPS)}.'
+        statuses = [code for code, _ in Order.PAYMENT_STATUS_CHOICES]
+        if payment_statuses is not None and not set(payment_statuses) <= set(statuses):
+            errors['payment_status'] = f'Must be all, or some of: {", ".join(statuses)}.'
+        if errors:
+            raise APIValidationError(errors)
+
+        return Response({
+            'start': start,
+            'end': end,
+            'group_by': group_by,
+            'payment_status': payment_status,
+            'results': SalesReportSerializer(analytics.get_report(start, end, group_by, payment_statuses), many=True).data
+        })
+
+
+class BulkCatalogView(APIView):
+    """
+    GET streams a catalog table (?output=ndjson|csv); POST upserts an NDJSON or text/csv body in chunks
+    and reports created / updated counts and the rejected lines.
+    """
+    permission_classes = [IsAdminUser]
+    content_types = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+    def get_kind(self, kind):
+        if kind not in bulk.KINDS:
+            raise NotFound(f'Unknown catalog table: {kind}')
+        return kind
+
+    def get(self, request, kind):
+        kind = self.get_kind(kind)
+        output = request.query_params.get('output', 'ndjson')
+        if output not in bulk.FORMATS:
+            raise APIValidationError({'output': f'Must be one of: {", ".join(bulk.FORMATS)}.'})
+        response = StreamingHttpResponse(bulk.export_lines(kind, output), content_type=self.content_types[output])
+        response['Content-Disposition'] = f'attachment; filename="{kind}.{output}"'
+        return response
+
+    def post(self, request, kind):
+        kind = self.get_kind(kind)
+        format = 'csv' if request.content_type.startswith('text/csv') else 'ndjson'
+        # Read the body as a stream instead of request.data, so large files are never held in memory
+        report = bulk.import_rows(kind, bulk.read_rows(request.stream or [], format))
+        return Response(report)
+
+
+# Frequently bought together, precomputed by the update_recommendations task: one indexed query per request
+class ProductRecommendationViewSet(ListModelMixin, GenericViewSet):
+    serializer_class = ProductRecommendationSerializer
+
+    def get_queryset(self):
+        return ProductRecommendation.objects \
+            .filter(product_id=self.kwargs['product_pk']) \
+            .select_related('recommended')
+
+
 class ProductImageViewSet(ModelViewSet):
     serializer_class = ProductImageSerializer
 
@@ -167,6 +567,25 @@ class ProductImageViewSet(ModelViewSet):
 
     def get_queryset(self):
         return ProductImage.objects.filter(product_id=self.kwargs['product_pk'])
+
+    # Link target for renditions that haven't been generated yet. Encoding is too expensive to do for anyone who
+    # asks: other clients get the original while a worker generates them, staff get them generated right away
+    @action(detail=True, url_path=r'renditions/(?P<name>\w+)')
+    def rendition(self, request, product_pk=None, pk=None, name=None):
+        if name not in renditions.NAMES:
+            raise NotFound(f'Unknown rendition: {name}')
+        image = self.get_object()
+        if not image.image.name:
+            raise NotFound('This image has no file.')
+        if not renditions.is_current(image) and not request.user.is_staff:
+            if cache.add(renditions.get_queued_key(image.pk), True, renditions.QUEUED_TIMEOUT):
+                queue_renditions([image.pk])
+            response = HttpResponseRedirect(renditions.get_storage().url(image.image.name))
+            # Until the renditions exist
+            response['Cache-Control'] = 'no-cache'
+            return response
+        files = renditions.ensure(image)
+        return HttpResponseRedirect(renditions.get_storage().url(files[name]))
     
 
 
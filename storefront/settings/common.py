@@ -133,6 +133,10 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Hand media transfers to the front proxy: None, 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache mod_xsendfile)
+MEDIA_OFFLOAD = None
+# nginx `internal` location aliased to MEDIA_ROOT, used with 'x-accel-redirect'
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
@@ -159,7 +163,8 @@ DJOSER = {
 
 SIMPLE_JWT = {
    'AUTH_HEADER_TYPES': ('JWT',),
-   "ACCESS_TOKEN_LIFETIME": timedelta(minutes=120)
+   "ACCESS_TOKEN_LIFETIME": timedelta(minutes=120),
+   'TOKEN_OBTAIN_SERIALIZER': 'core.serializers.TokenObtainPairSerializer'
 }
 
 #EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -175,9 +180,54 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'playground.tasks.notify_customers',
         'schedule': 5,
         'args': ['Hello World']
+    },
+    'update_recommendations': {
+        'task': 'store.tasks.update_recommendations',
+        'schedule': crontab(minute='*/15')
+    },
+    'reap_carts': {
+        'task': 'store.tasks.reap_carts',
+        'schedule': crontab(minute=45)
+    },
+    # Picks up order tickets whose task was lost (each ticket also queues a run when it's filed)
+    'place_order_tickets': {
+        'task': 'store.tasks.place_order_tickets',
+        'schedule': crontab()
+    },
+    # Catches the leaderboards up with orders whose increments failed (order_created receivers log their errors)
+    'rebuild_leaderboards': {
+        'task': 'store.tasks.rebuild_leaderboards',
+        'schedule': crontab(hour=3, minute=0)
+    },
+    # Same for the customer aggregates
+    'rebuild_customer_stats': {
+        'task': 'store.tasks.rebuild_customer_stats',
+        'schedule': crontab(hour=3, minute=15)
+    },
+    'reconcile_sales': {
+        'task': 'store.tasks.reconcile_sales',
+        'schedule': crontab(hour=3, minute=30)
     }
 }
 
+# Where carts are kept: 'database', or 'cache' (written back to the database in the background, see store/carts.py)
+CART_BACKEND = 'database'
+CART_CACHE_TIMEOUT = 7 * 24 * 60 * 60
+CART_PERSIST_DELAY = 30
+# Carts without changes for this long are deleted by the reap_carts task, CART_REAP_CHUNK_SIZE carts per transaction
+# (keep it longer than CART_CACHE_TIMEOUT)
+CART_IDLE_TIMEOUT = 30 * 24 * 60 * 60
+CART_REAP_CHUNK_SIZE = 1000
+
+# 'sync': POST /store/orders/ places the order. 'async': it files an order ticket (202) and Celery workers place the
+# tickets, ORDER_BATCH_SIZE per transaction claim; clients poll /store/order-tickets/<id>/ (see store/orders.py)
+ORDER_PLACEMENT = 'sync'
+ORDER_BATCH_SIZE = 50
+# How long responses to POSTs with an Idempotency-Key are replayed for retries (see store/idempotency.py)
+IDEMPOTENCY_TTL = 24 * 60 * 60
+# The nightly reconcile_sales task recomputes this many past days of the sales rollups (see store/analytics.py)
+SALES_RECONCILE_DAYS = 7
+
 CACHES = {
     "default": {
         "BACKEND": "django_redis.cache.RedisCache",
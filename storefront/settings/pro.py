@@ -8,6 +8,8 @@ SECRET_KEY = os.environ['SECRET_KEY']
 
 ALLOWED_HOSTS = ['bobbuy-prod-bff4f84a128d.herokuapp.com']
 
+MEDIA_OFFLOAD = os.environ.get('MEDIA_OFFLOAD') or None
+
 DATABASES = {
     'default': dj_database_url.config() # This module looks for an env variable called DATABASE_URL
 }
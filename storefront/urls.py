@@ -15,10 +15,10 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.conf import settings
-from django.conf.urls.static import static
 import debug_toolbar
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
+from store.media import serve_media
 
 
 admin.site.site_header = 'Storefront Admin'
@@ -32,9 +32,10 @@ urlpatterns = [
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.jwt')), #auth engine
     path('__debug__/', include(debug_toolbar.urls)),
+    # Served in production too: the view offloads to the front proxy when MEDIA_OFFLOAD is set
+    re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_media),
 ] 
 
 if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
     urlpatterns += [path('silk/', include('silk.urls', namespace='silk'))]
 